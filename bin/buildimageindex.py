@@ -0,0 +1,19 @@
+#!/usr/bin/env python
+#
+# buildimageindex.py: build the image index for a document root
+#
+# $Revision: $
+
+import sys
+
+from draco2.util.image import build_image_index, write_image_index
+
+if len(sys.argv) != 3:
+    sys.stderr.write('Usage: %s <docroot> <indexfile>\n' % sys.argv[0])
+    sys.exit(1)
+
+docroot, indexfile = sys.argv[1:]
+print 'Scanning: %s' % docroot
+index = build_image_index(docroot)
+print 'Write: %s (%d images)' % (indexfile, len(index))
+write_image_index(index, indexfile)
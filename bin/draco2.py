@@ -22,7 +22,7 @@ from draco2.core.loader import Loader
 from draco2.command import (Command, SchemaCommand, PrincipalCommand,
                             RoleCommand, LanguageCommand, MessageCommand,
                             TranslationCommand, TranslateCommand,
-                            ServeCommand)
+                            ServeCommand, AssetCommand)
 from draco2.session.command import SessionCommand
 
 
@@ -48,6 +48,7 @@ class MainCommand(Command):
         self.add_subcommand(TranslateCommand())
         self.add_subcommand(SessionCommand())
         self.add_subcommand(ServeCommand())
+        self.add_subcommand(AssetCommand())
 
     def load_dynamic(self, opts, args):
         """Dynamically load commands from the document root."""
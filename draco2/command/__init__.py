@@ -18,3 +18,4 @@ from draco2.command.role import RoleCommand
 from draco2.command.message import (LanguageCommand, MessageCommand,
                                     TranslationCommand, TranslateCommand)
 from draco2.command.serve import ServeCommand
+from draco2.command.asset import AssetCommand
@@ -0,0 +1,48 @@
+# vi: ts=8 sts=4 sw=4 et
+#
+# asset.py: asset commands
+#
+# This file is part of Draco2. Draco2 is free software and is made available
+# under the MIT license. Consult the file "LICENSE" that is distributed
+# together with this file for the exact licensing terms.
+#
+# Draco2 is copyright (c) 1999-2007 by the Draco2 authors. See the file
+# "AUTHORS" for a complete overview.
+#
+# $Revision: $
+
+import os.path
+
+from draco2.command.command import Command
+from draco2.file.asset import build_asset_manifest, write_asset_manifest
+
+
+class BuildManifest(Command):
+    """Build the asset manifest."""
+
+    name = 'manifest'
+    description = 'build the asset manifest'
+    require_api = set(('options', 'config'))
+
+    def run(self, opts, args, api):
+        config = api.config.ns('draco2.file.asset')
+        if not config.has_key('manifestfile'):
+            self.error('no manifest file configured')
+            self.exit(1)
+        section = api.config.ns('draco2')
+        fname = os.path.join(section['datadirectory'],
+                             config['manifestfile'])
+        manifest = build_asset_manifest(opts.docroot)
+        write_asset_manifest(manifest, fname)
+        self.write('wrote %d assets to %s\n' % (len(manifest), fname))
+
+
+class AssetCommand(Command):
+    """Asset management."""
+
+    name = 'asset'
+    description = 'manage static assets'
+
+    def __init__(self):
+        super(AssetCommand, self).__init__()
+        self.add_subcommand(BuildManifest())
@@ -45,7 +45,8 @@ class ConnectionHandler(object):
         local_addr = self.m_socket.getsockname()
         remote_addr = self.m_socket.getpeername()
         try:
-            proto, method, uri, headers = http.parse_request(conn)
+            proto, method, uri, headers, data = \
+                    http.read_request(self.m_socket)
         except http.HTTPError, err:
             http.simple_response(conn, err.status(), err.headers(), err.message())
             logger.debug('Response %s' % err.status())
@@ -56,7 +57,7 @@ class ConnectionHandler(object):
             logger.debug('Request for %s (%s)' % (uri, method))
             iface = StandaloneInterface(proto, method, uri, headers,
                                         conn, local_addr, remote_addr,
-                                        self.m_options)
+                                        self.m_options, data)
             handle_request(iface)
             content_type = iface.headers_out().get('content-type', [''])[0]
             logger.debug('Response %s (%s)' % (iface.status(), content_type))
@@ -44,6 +44,8 @@ from draco2.util.misc import get_backtrace
 initialized = False
 rwlock = ReadWriteLock()
 initlock = threading.Lock()
+inflight = {}
+inflightlock = threading.Lock()
 
 
 def handle_request(iface):
@@ -163,6 +165,33 @@ def handle_request(iface):
         rwlock.release_read()
 
 
+def enter_flight(key):
+    """Register an in-flight request for `key'.
+
+    If no other request for `key' is in flight, None is returned.
+    Otherwise an event is returned that is set once the request that
+    is in flight completes.
+    """
+    inflightlock.acquire()
+    try:
+        event = inflight.get(key)
+        if event is None:
+            inflight[key] = threading.Event()
+        return event
+    finally:
+        inflightlock.release()
+
+
+def leave_flight(key):
+    """Unregister the in-flight request for `key'."""
+    inflightlock.acquire()
+    try:
+        event = inflight.pop(key)
+    finally:
+        inflightlock.release()
+    event.set()
+
+
 def dispatch_request(iface):
     """Dispatch a request to the proper handler."""
     api = singleton(API, factory=API._create)
@@ -194,18 +223,54 @@ def dispatch_request(iface):
         # Optional objects
         if api.handler.Locale:
             api.locale = api.handler.Locale._create(api)
-        if api.handler.Session:
-            api.session = api.handler.Session._create(api)
 
         # Run all change contexts. If a change is detected, this will
         # upgrade 'rwlock' and wait for all threads to serialize outside
         # draco_request(). Then, the change callbacks are run.
         api.changes.run_all_contexts(rwlock, api)
 
-        # Handle the request!
-        api.handler._dispatch(api)
+        # Serve the request from cache if possible. This is done before
+        # a session is created so that cached requests are cheap.
+        if api.handler._dispatch_cached(api):
+            return
+
+        # Coalesce identical concurrent requests. The first request is
+        # handled normally and stores its response in the cache. The
+        # others wait for it and are then served from the cache. If
+        # waiting times out or the first request did not produce a
+        # cacheable response, requests are handled independently.
+        # Streamed responses are never stored, so requests are only
+        # coalesced if streaming is disabled. Waiting is done outside
+        # 'rwlock' so that waiting requests do not hold up a reload.
+        key = api.handler._cache_key(api)
+        if key is not None and not api.response.streaming():
+            event = enter_flight(key)
+            if event is not None:
+                key = None
+                config = api.config.ns('draco2.core.dispatch')
+                rwlock.release_read()
+                try:
+                    event.wait(config.get('coalescetimeout', 10))
+                finally:
+                    rwlock.acquire_read()
+                api.changes.run_all_contexts(rwlock, api)
+                if api.handler._dispatch_cached(api):
+                    return
+
+        try:
+            if api.handler.Session:
+                api.session = api.handler.Session._create(api)
+
+            # Handle the request!
+            api.handler._dispatch(api)
+            api.response._finalize()
+        finally:
+            if key is not None:
+                leave_flight(key)
 
     finally:
+        if getattr(api, 'session', None):
+            api.session._finalize()
         if hasattr(api, 'models'):
             api.models._finalize()
         if hasattr(api, 'database'):
@@ -26,3 +26,82 @@ class Filter(object):
     def filter(self, buffer):
         """Filter the response in `buffer'."""
         raise NotImplementedError
+
+
+class IncrementalFilter(Filter):
+    """Base class for incremental filters.
+
+    An incremental filter is fed the response chunk by chunk, and
+    returns filtered output as soon as it is available. This allows
+    a response to be filtered without keeping it in memory as a whole.
+    """
+
+    def feed(self, chunk):
+        """Feed `chunk' to the filter.
+
+        The return value is the filtered output that is available,
+        possibly the empty string.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """Signal the end of the response and return any remaining
+        filtered output."""
+        raise NotImplementedError
+
+    def filter(self, buffer):
+        """Filter the response in `buffer'."""
+        return self.feed(buffer) + self.close()
+
+
+class BufferedFilter(IncrementalFilter):
+    """Adapt a whole-buffer filter to the incremental interface.
+
+    The response is collected until close() is called, at which point
+    the adapted filter is run on it.
+    """
+
+    def __init__(self, filter):
+        """Constructor."""
+        self.m_filter = filter
+        self.m_chunks = []
+
+    def feed(self, chunk):
+        self.m_chunks.append(chunk)
+        return ''
+
+    def close(self):
+        buffer = ''.join(self.m_chunks)
+        del self.m_chunks[:]
+        return self.m_filter.filter(buffer)
+
+
+class FilterChain(IncrementalFilter):
+    """A chain of incremental filters.
+
+    The output of each filter is fed into the next one. Whole-buffer
+    filters are adapted using BufferedFilter.
+    """
+
+    def __init__(self, filters):
+        """Constructor."""
+        self.m_filters = []
+        for filter in filters:
+            if not isinstance(filter, IncrementalFilter):
+                filter = BufferedFilter(filter)
+            self.m_filters.append(filter)
+
+    def feed(self, chunk):
+        for filter in self.m_filters:
+            if not chunk:
+                break
+            chunk = filter.feed(chunk)
+        return chunk
+
+    def close(self):
+        output = ''
+        for filter in self.m_filters:
+            if output:
+                output = filter.feed(output)
+            output += filter.close()
+        return output
@@ -42,7 +42,8 @@ class Handler(DictNamespace):
         uri = api.iface.uri()
         docroot = api.options['documentroot']
         scheme, host, path, args = urilib.parse_uri(uri)
-        directory, filename, pathinfo = urilib.resolve_path_uri(path, docroot)
+        directory, filename, pathinfo = \
+                urilib.resolve_path_uri_cached(path, docroot)
         dirname = directory.replace('/', os.sep)
         relname = os.path.join(dirname, '__handler__.py')
         cls = api.loader.load_class(relname, Handler,
@@ -69,6 +70,20 @@ class Handler(DictNamespace):
                 api.events.raise_event('insufficient_authentication', api)
                 raise HTTPResponse, http.HTTP_FORBIDDEN
 
+    def _cache_key(self, api):
+        """Return a key that identifies the response to the current
+        request, or None if the response cannot be shared with other
+        requests."""
+        return None
+
+    def _dispatch_cached(self, api):
+        """Dispatch a request from a cache.
+
+        This is called before per-request state such as the session is
+        set up. Return True if the request was handled, False otherwise.
+        """
+        return False
+
     def _dispatch(self, api):
         """Dispatch an HTTP request."""
         self._authorize(api)
@@ -16,6 +16,7 @@ import sha
 import random
 
 from draco2.util.misc import md5sum
+from draco2.database import DatabaseDBAPIError
 from draco2.model import Model, Entity, Relationship, Index, View
 from draco2.model.transaction import Transaction
 from draco2.model.attribute import (StringAttribute, IntegerAttribute,
@@ -237,10 +238,14 @@ class SessionPrincipal(PrincipalName):
     name = 'principal'
     nullok = True
 
+class SessionVersion(IntegerAttribute):
+    name = 'version'
+    default = 0
+
 class Session(Entity):
     name = 'session'
     attributes = [SessionID, LastSubsession, SessionPrincipal,
-                  CreateDate, LastUsed, ExpireDate]
+                  CreateDate, LastUsed, ExpireDate, SessionVersion]
     primary_key = [SessionID]
 
 
@@ -250,14 +255,18 @@ class Scope(StringAttribute):
     name = 'scope'
     width = 64
 
+class ValueName(StringAttribute):
+    name = 'name'
+    width = 128
+
 class Data(BinaryAttribute):
     name = 'data'
     nullok = True
 
 class SessionNamespace(Entity):
     name = 'session_namespace'
-    attributes = [SessionID, Scope, Data]
-    primary_key = [SessionID, Scope]
+    attributes = [SessionID, Scope, ValueName, Data]
+    primary_key = [SessionID, Scope, ValueName]
 
 class SessionNamespaceRelationship(Relationship):
     name = 'session_data_relationship'
@@ -520,6 +529,92 @@ class DracoTransaction(Transaction):
             self.delete(session)
         return len(sessions)
 
+    def load_session(self, sessionid):
+        """Load the session `sessionid', bypassing the object cache.
+
+        The session is returned as a dictionary, or None if it does not
+        exist.
+        """
+        cursor = self.cursor()
+        query = 'SELECT * FROM %s WHERE id = %%s' % Session.name
+        self.retry(cursor.execute, query, (sessionid,))
+        row = cursor.fetchone()
+        if row is None:
+            return
+        columns = [ de[0] for de in cursor.description ]
+        return dict(zip(columns, row))
+
+    def update_session(self, sessionid, version, updates):
+        """Update session `sessionid' with the values in `updates', but
+        only if its version is still `version'.
+
+        The version of the session is incremented. The return value is
+        True if the session was updated. At the serializable isolation
+        level, a session that was updated concurrently since the start
+        of the transaction results in a serialization error rather than
+        a return value of False.
+        """
+        cursor = self.cursor()
+        columns = updates.keys()
+        query = 'UPDATE %s SET ' % Session.name
+        query += ''.join([ '%s = %%s, ' % col for col in columns ])
+        query += 'version = version + 1 WHERE id = %s AND version = %s'
+        args = [ updates[col] for col in columns ] + [sessionid, version]
+        self.retry(cursor.execute, query, tuple(args))
+        return cursor.rowcount == 1
+
+    def write_session_namespaces(self, sessionid, updates, inserts,
+                                 deletes):
+        """Write namespace values of session `sessionid' in bulk.
+
+        The `updates' and `inserts' arguments are dictionaries that map
+        (scope, name) tuples to serialized values, for values that
+        already exist and values that must be created respectively.
+        The `deletes' argument is a list of (scope, name) tuples of the
+        values to delete. At most one UPDATE, one INSERT and one DELETE
+        statement are issued. A value that was inserted concurrently is
+        reported as a serialization error, so that the caller can replay
+        the transaction.
+        """
+        cursor = self.cursor()
+        if updates:
+            keys = updates.keys()
+            query = 'UPDATE %s SET data = CASE %s END WHERE id = %%s' \
+                    ' AND (%s)' % (SessionNamespace.name,
+                     ' '.join(['WHEN scope = %s AND name = %s THEN %s']
+                              * len(keys)),
+                     ' OR '.join(['(scope = %s AND name = %s)'] * len(keys)))
+            args = []
+            for key in keys:
+                args += [key[0], key[1], buffer(updates[key])]
+            args.append(sessionid)
+            for key in keys:
+                args += key
+            self.retry(cursor.execute, query, tuple(args))
+        if inserts:
+            query = 'INSERT INTO %s (id, scope, name, data) VALUES %s' % \
+                    (SessionNamespace.name,
+                     ','.join(['(%s,%s,%s,%s)'] * len(inserts)))
+            args = []
+            for key,data in inserts.items():
+                args += [sessionid, key[0], key[1], buffer(data)]
+            database = self.model().database()
+            try:
+                self.retry(cursor.execute, query, tuple(args))
+            except DatabaseDBAPIError, err:
+                if database.is_primary_key_error(err):
+                    raise database.serialization_error()
+                raise
+        if deletes:
+            query = 'DELETE FROM %s WHERE id = %%s AND (%s)' % \
+                    (SessionNamespace.name,
+                     ' OR '.join(['(scope = %s AND name = %s)']
+                                 * len(deletes)))
+            args = [sessionid]
+            for key in deletes:
+                args += key
+            self.retry(cursor.execute, query, tuple(args))
+
     def update_messages(self, messages):
         """Update the `message' table with new messages that require
         translation.
@@ -557,12 +652,38 @@ class DracoTransaction(Transaction):
                     count += 1
         return count
 
+    def select_translations(self, hashes, names, languages):
+        """Return the translations in any of the languages `languages'
+        of the messages with a hash in `hashes' or a name in `names'.
+
+        The translations are returned as a list of (hash, name, context,
+        language, translation) tuples. The object cache is bypassed.
+        """
+        where = 'message.hash IN (%s)' % ','.join(['%s'] * len(hashes))
+        args = list(hashes)
+        if names:
+            where += ' OR message.name IN (%s)' % \
+                        ','.join(['%s'] * len(names))
+            args += names
+        query = 'SELECT message.hash, message.name, message.context,' \
+                ' relationship.language, translation.translation' \
+                ' FROM %s AS message, %s AS relationship, %s AS translation' \
+                ' WHERE relationship.message_id = message.id' \
+                ' AND relationship.translation_id = translation.id' \
+                ' AND (%s) AND relationship.language IN (%s)' % \
+                (Message.name, MessageTranslationRelationship.name,
+                 Translation.name, where, ','.join(['%s'] * len(languages)))
+        args += languages
+        cursor = self.cursor()
+        self.retry(cursor.execute, query, tuple(args))
+        return cursor.fetchall()
+
 
 # MODEL ...
 
 class DracoModel(Model):
     name = 'draco'
-    version = 3
+    version = 5
     entities = [Config, Locale, LocaleData, Robot, Principal, Role,
                 SecurityContext, Session, SessionNamespace, Language,
                 Message, Translation, Change, Schema]
@@ -13,47 +13,59 @@
 
 import os.path
 
+from draco2.core.exception import HTTPResponse, DracoInterfaceError
 from draco2.util import http
 from draco2.util import uri as urilib
 
 
 class Request(object):
-    """The request object."""
+    """The request object.
 
-    def __init__(self, iface):
-        """Constructor."""
+    Query and POST arguments are parsed when they are first accessed,
+    so that requests that do not use them do not pay for parsing them.
+    """
+
+    def __init__(self, iface, config=None):
+        """Constructor.
+
+        The `config' argument is an optional dictionary with the
+        settings from the [draco2.core.request] config file section.
+        """
         self.m_iface = iface
         self.m_headers = iface.headers_in()
+        self.m_post_args = None
+        self.m_body_read = False
+        self._configure(config)
         self._parse_uri()
         self._init_cookies()
 
     @classmethod
     def _create(cls, api):
         """Factory method."""
-        request = cls(api.iface)
+        request = cls(api.iface, api.config.ns('draco2.core.request'))
         return request
 
+    def _configure(self, config):
+        """Configure the request body limits."""
+        if config is None:
+            config = {}
+        self.m_max_body_size = config.get('maxbodysize')
+        self.m_max_part_size = config.get('maxpartsize')
+        self.m_spool_size = config.get('spoolsize', 65536)
+
     def _parse_uri(self):
         """Parse the request URI."""
         uri = self.m_iface.uri()
         docroot = self.m_iface.options()['documentroot']
         protocol, host, path, args = urilib.parse_uri(uri)
-        directory, filename, pathinfo = urilib.resolve_path_uri(path, docroot)
+        directory, filename, pathinfo = \
+                urilib.resolve_path_uri_cached(path, docroot)
         self.m_docroot = docroot
         self.m_directory = directory
         self.m_filename = filename
         self.m_pathinfo = [ pi for pi in pathinfo.split('/') if pi ]
-        self.m_args = {}
-        args = urilib.parse_query(args)
-        self._add_args(args)
-        if self.m_iface.method() == 'POST':
-            ctype = self.header('content-type')
-            if ctype is not None:
-                value, options = http.parse_header_options(ctype)
-                if value in ('application/x-www-form-urlencoded',
-                             'multipart/form-data'):
-                    args = http.parse_post(self.headers(), self)
-                    self._add_args(args)
+        self.m_query = args
+        self.m_args = None
         self.m_basename, self.m_extension = os.path.splitext(self.filename())
         self.m_extension = self.m_extension[1:]
 
@@ -115,6 +127,53 @@ class Request(object):
         """
         return self.m_pathinfo
 
+    def _check_body_size(self):
+        """Stop the request if the body is larger than allowed."""
+        if self.m_max_body_size is None:
+            return
+        try:
+            clen = int(self.header('content-length'))
+        except (TypeError, ValueError):
+            return
+        if clen > self.m_max_body_size:
+            raise HTTPResponse, http.HTTP_REQUEST_ENTITY_TOO_LARGE
+
+    def _post_args(self):
+        """Parse the POST arguments from the request body.
+
+        The body is parsed only once, also if the request is internally
+        redirected.
+        """
+        if self.m_post_args is not None:
+            return self.m_post_args
+        self.m_post_args = {}
+        if self.m_iface.method() != 'POST' or self.m_body_read:
+            return self.m_post_args
+        ctype = self.header('content-type')
+        if ctype is None:
+            return self.m_post_args
+        value, options = http.parse_header_options(ctype)
+        if value not in ('application/x-www-form-urlencoded',
+                         'multipart/form-data'):
+            return self.m_post_args
+        self._check_body_size()
+        self.m_body_read = True
+        try:
+            self.m_post_args = http.parse_post(self.headers(), self,
+                                               self.m_max_body_size,
+                                               self.m_max_part_size,
+                                               self.m_spool_size)
+        except http.HTTPError, err:
+            raise HTTPResponse(err.status(), err.headers())
+        return self.m_post_args
+
+    def _parse_args(self):
+        """Parse the query and POST arguments."""
+        self.m_args = {}
+        args = urilib.parse_query(self.m_query)
+        self._add_args(args)
+        self._add_args(self._post_args())
+
     def _add_args(self, args):
         """Add GET/POST arguments."""
         for name in args:
@@ -133,6 +192,8 @@ class Request(object):
         The result is a dictionary with string, FileUpload or list of 
         string/FileUpload values and string keys.
         """
+        if self.m_args is None:
+            self._parse_args()
         return self.m_args
 
     def header(self, name, default=None):
@@ -190,6 +251,32 @@ class Request(object):
         """Return a dictionary with all SSL variables."""
         return self.m_iface.ssl_variables()
 
+    def body(self, block_size=65536):
+        """Return an iterator over the raw request body.
+
+        The body is returned in blocks of up to `block_size' bytes. It
+        can only be read once, and it is not available for argument
+        parsing afterwards.
+        """
+        if self.m_body_read:
+            raise DracoInterfaceError, 'Request body has already been read.'
+        self._check_body_size()
+        self.m_body_read = True
+        return self._iter_body(block_size)
+
+    def _iter_body(self, block_size):
+        """Generator that reads the request body."""
+        try:
+            remaining = int(self.header('content-length'))
+        except (TypeError, ValueError):
+            remaining = 0
+        while remaining > 0:
+            data = self.m_iface.read(min(block_size, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+
     def read(self, size=None):
         """Read up to `size' bytes from the input.
 
@@ -14,7 +14,7 @@
 from cStringIO import StringIO
 
 from draco2.core.exception import *
-from draco2.core.filter import Filter
+from draco2.core.filter import Filter, FilterChain
 from draco2.util import http
 from draco2.util.timezone import GMT, LocalTime
 
@@ -32,6 +32,11 @@ class Response(object):
     BUFFER_COMPLETE = 5
     BUFFER_HEADER_SENT = 6
     BUFFER_BODY_SENT = 7
+    # streaming states
+    STREAM_INIT = 8
+    BYTES_STREAMED = 9
+    STREAM_HEADER_SENT = 10
+    STREAM_BODY_SENT = 11
 
     def __init__(self, iface):
         """Constructor."""
@@ -41,9 +46,16 @@ class Response(object):
         self.m_headers = {}
         self.m_cookies = {}
         self.m_modified = None
+        self.m_cache_policy = None
+        self.m_body = None
         self.m_filters = []
+        self.m_filter_chain = None
+        self.m_chunks = []
+        self.m_chunked_size = 0
+        self.m_streaming = False
         self.set_buffering(False)
         self.set_encoding('utf-8')
+        self.set_chunk_size(16384)
 
     @classmethod
     def _create(cls, api):
@@ -51,9 +63,13 @@ class Response(object):
         response = cls(api.iface)
         section = api.config.ns('draco2.core.response')
         if section.has_key('buffering'):
-            self.set_buffering(section['buffering'])
+            response.set_buffering(section['buffering'])
+        if section.get('streaming'):
+            response.set_streaming(True)
+        if section.has_key('chunksize'):
+            response.set_chunk_size(section['chunksize'])
         if section.has_key('encoding'):
-            self.set_encoding(section['encoding'])
+            response.set_encoding(section['encoding'])
         filters = api.loader.load_classes('__filter__.py', Filter, 
                                           scope='__docroot__')
         for filter in filters:
@@ -70,15 +86,56 @@ class Response(object):
 
         Features such as encoding require buffering.
         """
-        if self.m_state not in (self.INIT, self.BUFFER_INIT):
+        if self.m_state not in (self.INIT, self.BUFFER_INIT,
+                                self.STREAM_INIT):
             m = 'Canot change buffer policy (wrong state).'
             raise DracoInterfaceError, m
         self.m_buffering = enable
+        self.m_streaming = False
         if self.m_buffering:
             self.m_state = self.BUFFER_INIT
         else:
             self.m_state = self.INIT
 
+    def streaming(self):
+        """Return True if streaming is enabled."""
+        return self.m_streaming
+
+    def set_streaming(self, enable):
+        """Enable or disable streaming.
+
+        In streaming mode, output is collected into chunks of at most
+        chunk_size() bytes that are sent to the client as soon as they
+        are complete. If the client supports it, the "chunked"
+        transfer-coding is used so that the connection can be kept
+        alive. If the whole response fits in a single chunk, it is sent
+        with a Content-Length header instead. For HEAD requests, only the
+        header is sent.
+
+        Disabling streaming does not change the buffering policy.
+        """
+        if self.m_state not in (self.INIT, self.BUFFER_INIT,
+                                self.STREAM_INIT):
+            m = 'Cannot change streaming policy (wrong state).'
+            raise DracoInterfaceError, m
+        if enable:
+            self.m_streaming = True
+            self.m_buffering = False
+            self.m_state = self.STREAM_INIT
+        elif self.m_streaming:
+            self.m_streaming = False
+            self.m_state = self.INIT
+
+    def chunk_size(self):
+        """Return the chunk size used in streaming mode."""
+        return self.m_chunk_size
+
+    def set_chunk_size(self, size):
+        """Set the chunk size for streaming mode to `size' bytes."""
+        if not isinstance(size, int) or size <= 0:
+            raise ValueError, 'Expecting a positive integer chunk size.'
+        self.m_chunk_size = size
+
     def encoding(self):
         """Return the response encoding."""
         return self.m_encoding
@@ -111,7 +168,8 @@ class Response(object):
         All other values for this header are removed.
         """
         if self.m_state not in (self.INIT, self.BUFFER_INIT,
-                                self.BYTES_BUFFERED, self.BUFFER_COMPLETE):
+                                self.BYTES_BUFFERED, self.BUFFER_COMPLETE,
+                                self.STREAM_INIT, self.BYTES_STREAMED):
             m = 'Cannot set header (wrong state).'
             raise DracoInterfaceError, m
         if isinstance(value, int):
@@ -129,7 +187,8 @@ class Response(object):
         The value is appended to existing values for the header.
         """
         if self.m_state not in (self.INIT, self.BUFFER_INIT,
-                                self.BYTES_BUFFERED, self.BUFFER_COMPLETE):
+                                self.BYTES_BUFFERED, self.BUFFER_COMPLETE,
+                                self.STREAM_INIT, self.BYTES_STREAMED):
             m = 'Cannot add header (wrong state).'
             raise DracoInterfaceError, m
         if isinstance(value, int):
@@ -156,7 +215,8 @@ class Response(object):
     def set_cookie(self, cookie):
         """Set a cookie, removing other cookies with the same name."""
         if self.m_state not in (self.INIT, self.BUFFER_INIT,
-                                self.BYTES_BUFFERED, self.BUFFER_COMPLETE):
+                                self.BYTES_BUFFERED, self.BUFFER_COMPLETE,
+                                self.STREAM_INIT, self.BYTES_STREAMED):
             m = 'Cannot set cookie (wrong state).'
             raise DracoInterfaceError, m
         self.m_cookies[cookie.name] = cookie
@@ -168,7 +228,8 @@ class Response(object):
     def set_status(self, status):
         """Set the HTTP response status."""
         if self.m_state not in (self.INIT, self.BUFFER_INIT,
-                                self.BYTES_BUFFERED, self.BUFFER_COMPLETE):
+                                self.BYTES_BUFFERED, self.BUFFER_COMPLETE,
+                                self.STREAM_INIT, self.BYTES_STREAMED):
             m = 'Cannot set status (wrong state).'
             raise DracoInterfaceError, m
         self.m_iface.set_status(status)
@@ -184,7 +245,8 @@ class Response(object):
         HTTP header is set from this.
         """
         if self.m_state not in (self.INIT, self.BUFFER_INIT,
-                                self.BYTES_BUFFERED, self.BUFFER_COMPLETE):
+                                self.BYTES_BUFFERED, self.BUFFER_COMPLETE,
+                                self.STREAM_INIT, self.BYTES_STREAMED):
             m = 'Modification date cannot be changed (wrong state).'
             raise DracoInterfaceError, m
         # Convert to GMT, as required by RFC2616. If no tzinfo was
@@ -199,10 +261,33 @@ class Response(object):
         value = self.m_modified.strftime(http.rfc1123_datetime)
         self.set_header('last-modified', value)
 
+    def cache_policy(self):
+        """Return the HTTP caching policy for the response, or None if
+        no policy was set."""
+        return self.m_cache_policy
+
+    def set_cache_policy(self, policy):
+        """Set the HTTP caching policy for the response.
+
+        The `policy' argument must be a CachePolicy instance. It sets
+        the "Cache-Control", "Expires" and "Vary" headers.
+        """
+        if not isinstance(policy, http.CachePolicy):
+            raise TypeError, 'Expecting CachePolicy instance.'
+        self.m_cache_policy = policy
+        self.set_header('cache-control', policy.cache_control())
+        expires = policy.expires()
+        if expires is not None:
+            self.set_header('expires', expires)
+        if policy.vary:
+            self.set_header('vary', ', '.join(policy.vary))
+
     def add_filter(self, filter, priority=None):
         """Add an output filter `filter'."""
         if self.m_state not in (self.INIT, self.BUFFER_INIT,
-                                self.BYTES_BUFFERED, self.BUFFER_COMPLETE):
+                                self.BYTES_BUFFERED, self.BUFFER_COMPLETE,
+                                self.STREAM_INIT, self.BYTES_STREAMED) \
+                    or self.m_filter_chain is not None:
             m = 'Filter cannot be added (wrong state).'
             raise DracoInterfaceError, m
         if not isinstance(filter, Filter):
@@ -219,7 +304,8 @@ class Response(object):
 
     def send_header(self):
         """Send the HTTP header."""
-        if self.m_state not in (self.INIT, self.BUFFER_COMPLETE):
+        if self.m_state not in (self.INIT, self.BUFFER_COMPLETE,
+                                self.STREAM_INIT, self.BYTES_STREAMED):
             m = 'Cannot send header (wrong state).'
             raise DracoInterfaceError, m
         for name,cookie in self.m_cookies.items():
@@ -229,22 +315,34 @@ class Response(object):
         self.m_iface.send_header()
         if self.m_state == self.INIT:
             self.m_state = self.HEADER_SENT
-        else:
+        elif self.m_state == self.BUFFER_COMPLETE:
             self.m_state = self.BUFFER_HEADER_SENT
+        else:
+            self.m_state = self.STREAM_HEADER_SENT
 
     def write(self, buf):
         """Write the string `buf' to the client.
 
-        If buffering is enabled this call just updated the buffer.
+        If buffering is enabled this call just updated the buffer. If
+        streaming is enabled, the data is sent once a full chunk is
+        available.
         """
         if self.m_state not in (self.INIT, self.HEADER_SENT,
                                 self.BYTES_WRITTEN, self.BUFFER_INIT,
-                                self.BYTES_BUFFERED):
+                                self.BYTES_BUFFERED, self.STREAM_INIT,
+                                self.BYTES_STREAMED, self.STREAM_HEADER_SENT):
             m = 'No output possible (wrong state).'
             raise DracoInterfaceError, m
         if isinstance(buf, unicode):
             buf = buf.encode(self.m_encoding)
-        if self.m_buffering:
+        if self.m_streaming:
+            self.m_chunks.append(buf)
+            self.m_chunked_size += len(buf)
+            if self.m_state == self.STREAM_INIT:
+                self.m_state = self.BYTES_STREAMED
+            if self.m_chunked_size >= self.m_chunk_size:
+                self._write_chunks()
+        elif self.m_buffering:
             assert self.m_state not in (self.HEADER_SENT, self.BYTES_WRITTEN)
             self.m_buffer.write(buf)
             self.m_state = self.BYTES_BUFFERED
@@ -255,15 +353,83 @@ class Response(object):
             self.m_iface.write(buf)
             self.m_state = self.BYTES_WRITTEN
 
+    def _filter_chain(self):
+        """Return the filter chain for this response."""
+        if self.m_filter_chain is None:
+            self.m_filter_chain = FilterChain(self.filters())
+        return self.m_filter_chain
+
+    def _send_stream(self, buffer, header_only=False):
+        """Send `buffer' as part of a streaming response.
+
+        The header is sent first if that was not yet done. Output is
+        sent in chunks of at most chunk_size() bytes, unless
+        `header_only' is set.
+        """
+        if self.m_state != self.STREAM_HEADER_SENT:
+            if self.m_iface.chunked():
+                self.set_header('transfer-encoding', 'chunked')
+            else:
+                # No framing available: the end of the response is
+                # signalled by closing the connection.
+                self.set_header('connection', 'close')
+            self.send_header()
+        if header_only:
+            return
+        size = self.m_chunk_size
+        for i in range(0, len(buffer), size):
+            if self.m_iface.chunked():
+                self.m_iface.write_chunk(buffer[i:i+size])
+            else:
+                self.m_iface.write(buffer[i:i+size])
+
+    def _write_chunks(self):
+        """Filter and send out the output that was collected in
+        streaming mode."""
+        buffer = ''.join(self.m_chunks)
+        del self.m_chunks[:]
+        self.m_chunked_size = 0
+        buffer = self._filter_chain().feed(buffer)
+        # Filters may hold back output. Delay sending the header until
+        # there is something to send.
+        if buffer:
+            self._send_stream(buffer, self.m_iface.method() == 'HEAD')
+
+    def _flush_stream(self, header_only):
+        """Flush a streaming response."""
+        # Chunks may have been sent before the flush, so the method is
+        # checked here as well.
+        header_only = header_only or self.m_iface.method() == 'HEAD'
+        buffer = ''.join(self.m_chunks)
+        del self.m_chunks[:]
+        self.m_chunked_size = 0
+        chain = self._filter_chain()
+        buffer = chain.feed(buffer) + chain.close()
+        if self.m_state == self.STREAM_HEADER_SENT:
+            self._send_stream(buffer, header_only)
+            if self.m_iface.chunked() and not header_only:
+                self.m_iface.end_chunks()
+        else:
+            # The complete response is known: no need for chunking.
+            self.set_header('content-length', str(len(buffer)))
+            self.send_header()
+            if not header_only:
+                self.m_iface.write(buffer)
+        self.m_state = self.STREAM_BODY_SENT
+
     def flush(self, header_only=False):
         """Flush the response. This function is only useful in combination
-        with buffered responses."""
+        with buffered or streaming responses."""
+        if self.m_state in (self.STREAM_INIT, self.BYTES_STREAMED,
+                            self.STREAM_HEADER_SENT):
+            self._flush_stream(header_only)
+            return
         if self.m_state not in (self.BUFFER_INIT, self.BYTES_BUFFERED):
             m = 'Cannot flush output (wrong state).'
             raise DracoInterfaceError, m
         buffer = self.m_buffer.getvalue()
-        for filter in self.filters():
-            buffer = filter.filter(buffer)
+        buffer = self._filter_chain().filter(buffer)
+        self.m_body = buffer
         self.m_state = self.BUFFER_COMPLETE
         self.set_header('content-length', str(len(buffer)))
         self.send_header()
@@ -271,9 +437,15 @@ class Response(object):
             self.m_iface.write(buffer)
         self.m_state = self.BUFFER_BODY_SENT
 
+    def body(self):
+        """Return the body of a buffered response, after it has been
+        flushed. In all other cases None is returned."""
+        return self.m_body
+
     def redirect(self, uri, status=None):
         """Redirect to another URI."""
-        if self.m_state not in (self.INIT, self.BUFFER_INIT, self.BYTES_BUFFERED):
+        if self.m_state not in (self.INIT, self.BUFFER_INIT, self.BYTES_BUFFERED,
+                                self.STREAM_INIT, self.BYTES_STREAMED):
             m = 'Cannot redirect (wrong state).'
             raise DracoInterfaceError, m
         if status is None:
@@ -288,6 +460,15 @@ class Response(object):
             self.add_header('set-cookie', cookie.encode())
         raise HTTPResponse(status, headers=self.m_headers)
 
+    def _finalize(self):
+        """Finalize the response.
+
+        This completes a streaming response that was not flushed by
+        the handler.
+        """
+        if self.m_state in (self.BYTES_STREAMED, self.STREAM_HEADER_SENT):
+            self.flush()
+
     def exit(self, code=http.HTTP_OK):
         """End processing."""
         raise HTTPResponse, code
@@ -0,0 +1,40 @@
+# vi: ts=8 sts=4 sw=4 et
+#
+# test_dispatch.py: unit tests for the dispatcher
+#
+# This file is part of Draco2. Draco2 is free software and is made available
+# under the MIT license. Consult the file "LICENSE" that is distributed
+# together with this file for the exact licensing terms.
+#
+# Draco2 is copyright (c) 1999-2007 by the Draco2 authors. See the file
+# "AUTHORS" for a complete overview.
+#
+# $Revision: $
+
+import threading
+
+from draco2.core.dispatch import enter_flight, leave_flight
+
+
+class TestCoalescing(object):
+
+    def test_single_flight(self):
+        key = ('/index.dsp',)
+        assert enter_flight(key) is None
+        event = enter_flight(key)
+        assert event is not None
+        assert not event.isSet()
+        leave_flight(key)
+        assert event.isSet()
+        assert enter_flight(key) is None
+        leave_flight(key)
+
+    def test_wait(self):
+        key = ('/wait.dsp',)
+        assert enter_flight(key) is None
+        event = enter_flight(key)
+        thread = threading.Thread(target=leave_flight, args=(key,))
+        thread.start()
+        event.wait(5)
+        thread.join()
+        assert event.isSet()
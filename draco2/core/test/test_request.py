@@ -0,0 +1,82 @@
+# vi: ts=8 sts=4 sw=4 et
+#
+# test_request.py: unit tests for the request object
+#
+# This file is part of Draco2. Draco2 is free software and is made available
+# under the MIT license. Consult the file "LICENSE" that is distributed
+# together with this file for the exact licensing terms.
+#
+# Draco2 is copyright (c) 1999-2007 by the Draco2 authors. See the file
+# "AUTHORS" for a complete overview.
+#
+# $Revision: $
+
+import tempfile
+from cStringIO import StringIO
+
+import py.test
+
+from draco2.core.request import Request
+from draco2.core.exception import HTTPResponse, DracoInterfaceError
+from draco2.interface.interface import HTTPInterface
+from draco2.util import http
+
+
+class MemoryInterface(HTTPInterface):
+    """Interface that reads its request body from memory."""
+
+    def __init__(self, uri, method='GET', body='', headers=None):
+        if headers is None:
+            headers = {}
+        if body:
+            headers['content-type'] = ['application/x-www-form-urlencoded']
+            headers['content-length'] = [str(len(body))]
+        self._set_uri(uri)
+        self._set_method(method)
+        self._set_headers_in(headers)
+        self._set_options({ 'documentroot': tempfile.gettempdir() })
+        self.m_input = StringIO(body)
+
+    def read(self, size=None):
+        if size is None:
+            return self.m_input.read()
+        return self.m_input.read(size)
+
+
+class TestArgs(object):
+
+    def test_lazy(self):
+        iface = MemoryInterface('/test.dsp?a=1', 'POST', 'b=2')
+        request = Request(iface)
+        assert iface.m_input.tell() == 0
+        assert request.args() == { 'a': '1', 'b': '2' }
+
+    def test_internal_redirect(self):
+        iface = MemoryInterface('/test.dsp?a=1', 'POST', 'b=2')
+        request = Request(iface)
+        assert request.args() == { 'a': '1', 'b': '2' }
+        iface._set_uri('/other.dsp?c=3')
+        request._parse_uri()
+        assert request.args() == { 'c': '3', 'b': '2' }
+
+    def test_body_size(self):
+        iface = MemoryInterface('/test.dsp', 'POST', 'a=1&b=2')
+        request = Request(iface, { 'maxbodysize': 5 })
+        err = py.test.raises(HTTPResponse, request.args).value
+        assert err.status == http.HTTP_REQUEST_ENTITY_TOO_LARGE
+        assert iface.m_input.tell() == 0
+
+
+class TestBody(object):
+
+    def test_body(self):
+        iface = MemoryInterface('/test.dsp', 'POST', 'a=1&b=2')
+        request = Request(iface)
+        assert list(request.body(3)) == ['a=1', '&b=', '2']
+        assert request.args() == {}
+        py.test.raises(DracoInterfaceError, request.body)
+
+    def test_body_size(self):
+        iface = MemoryInterface('/test.dsp', 'POST', 'a=1&b=2')
+        request = Request(iface, { 'maxbodysize': 5 })
+        py.test.raises(HTTPResponse, request.body)
@@ -0,0 +1,238 @@
+# vi: ts=8 sts=4 sw=4 et
+#
+# test_response.py: unit tests for the response object
+#
+# This file is part of Draco2. Draco2 is free software and is made available
+# under the MIT license. Consult the file "LICENSE" that is distributed
+# together with this file for the exact licensing terms.
+#
+# Draco2 is copyright (c) 1999-2007 by the Draco2 authors. See the file
+# "AUTHORS" for a complete overview.
+#
+# $Revision: $
+
+from draco2.core.response import Response
+from draco2.core.filter import Filter, IncrementalFilter, FilterChain
+from draco2.interface.interface import HTTPInterface
+from draco2.util import http
+
+
+class MemoryInterface(HTTPInterface):
+    """Interface that records its output in memory."""
+
+    def __init__(self, protocol='HTTP/1.1', method='GET'):
+        self._set_protocol(protocol)
+        self._set_method(method)
+        self._set_headers_out({})
+        self._set_header_sent(False)
+        self.set_status(http.HTTP_OK)
+        self.m_output = []
+
+    def send_header(self):
+        self._set_header_sent(True)
+
+    def write(self, buf):
+        self.m_output.append(buf)
+
+    def output(self):
+        return ''.join(self.m_output)
+
+
+class UpperFilter(IncrementalFilter):
+
+    def feed(self, chunk):
+        return chunk.upper()
+
+    def close(self):
+        return ''
+
+
+class ReverseFilter(Filter):
+
+    def filter(self, buffer):
+        return buffer[::-1]
+
+
+class Config(object):
+
+    def __init__(self, section):
+        self.m_section = section
+
+    def ns(self, name):
+        return self.m_section
+
+
+class Loader(object):
+
+    def load_classes(self, fname, typ, scope=None):
+        return []
+
+
+class Api(object):
+
+    def __init__(self, section):
+        self.iface = MemoryInterface()
+        self.config = Config(section)
+        self.loader = Loader()
+
+
+class TestStreaming(object):
+
+    def test_single_chunk(self):
+        iface = MemoryInterface()
+        response = Response(iface)
+        response.set_streaming(True)
+        response.write('hello ')
+        response.write('world')
+        assert not iface.header_sent()
+        response.flush()
+        assert iface.headers_out()['content-length'] == ['11']
+        assert 'transfer-encoding' not in iface.headers_out()
+        assert iface.output() == 'hello world'
+
+    def test_chunked(self):
+        iface = MemoryInterface()
+        response = Response(iface)
+        response.set_streaming(True)
+        response.set_chunk_size(4)
+        response.write('ab')
+        assert not iface.header_sent()
+        response.write('cdef')
+        assert iface.header_sent()
+        assert iface.headers_out()['transfer-encoding'] == ['chunked']
+        response.write('g')
+        response.flush()
+        assert iface.output() == '4\r\nabcd\r\n2\r\nef\r\n1\r\ng\r\n0\r\n\r\n'
+
+    def test_http10(self):
+        iface = MemoryInterface('HTTP/1.0')
+        response = Response(iface)
+        response.set_streaming(True)
+        response.set_chunk_size(4)
+        response.write('abcdef')
+        response.flush()
+        assert iface.headers_out()['connection'] == ['close']
+        assert iface.output() == 'abcdef'
+
+    def test_head(self):
+        iface = MemoryInterface(method='HEAD')
+        response = Response(iface)
+        response.set_streaming(True)
+        response.set_chunk_size(4)
+        response.write('abcdef')
+        assert iface.header_sent()
+        assert iface.headers_out()['transfer-encoding'] == ['chunked']
+        response.write('g')
+        response.flush()
+        assert iface.output() == ''
+        iface = MemoryInterface(method='HEAD')
+        response = Response(iface)
+        response.set_streaming(True)
+        response.write('abc')
+        response.flush()
+        assert iface.headers_out()['content-length'] == ['3']
+        assert iface.output() == ''
+
+    def test_finalize(self):
+        iface = MemoryInterface()
+        response = Response(iface)
+        response.set_streaming(True)
+        response.set_chunk_size(2)
+        response.write('abc')
+        response._finalize()
+        assert iface.output() == '2\r\nab\r\n1\r\nc\r\n0\r\n\r\n'
+
+    def test_incremental_filter(self):
+        iface = MemoryInterface()
+        response = Response(iface)
+        response.add_filter(UpperFilter())
+        response.set_streaming(True)
+        response.set_chunk_size(2)
+        response.write('abc')
+        assert iface.output() == '2\r\nAB\r\n1\r\nC\r\n'
+        response.flush()
+        assert iface.output().endswith('0\r\n\r\n')
+
+    def test_buffered_filter(self):
+        iface = MemoryInterface()
+        response = Response(iface)
+        response.add_filter(ReverseFilter())
+        response.set_streaming(True)
+        response.set_chunk_size(2)
+        response.write('abc')
+        assert not iface.header_sent()
+        response.flush()
+        assert iface.headers_out()['content-length'] == ['3']
+        assert iface.output() == 'cba'
+
+
+    def test_config_buffering(self):
+        api = Api({ 'buffering': True, 'streaming': False })
+        response = Response._create(api)
+        assert response.buffering()
+        assert not response.streaming()
+
+    def test_config_streaming(self):
+        api = Api({ 'buffering': True, 'streaming': True })
+        response = Response._create(api)
+        assert response.streaming()
+        assert not response.buffering()
+
+    def test_disable_streaming(self):
+        response = Response(MemoryInterface())
+        response.set_buffering(True)
+        response.set_streaming(False)
+        assert response.buffering()
+        response.set_streaming(True)
+        response.set_streaming(False)
+        assert not response.streaming()
+        assert not response.buffering()
+
+
+class TestFilterChain(object):
+
+    def test_chain(self):
+        chain = FilterChain([UpperFilter(), ReverseFilter()])
+        assert chain.feed('ab') == ''
+        assert chain.feed('cd') == ''
+        assert chain.close() == 'DCBA'
+
+    def test_filter(self):
+        chain = FilterChain([ReverseFilter(), UpperFilter()])
+        assert chain.filter('abc') == 'CBA'
+
+
+class TestCachePolicy(object):
+
+    def test_no_cache(self):
+        response = Response(MemoryInterface())
+        response.set_cache_policy(http.CachePolicy())
+        assert response.header('cache-control') == 'no-cache'
+        assert response.header('expires') is None
+
+    def test_max_age(self):
+        response = Response(MemoryInterface())
+        policy = http.CachePolicy(max_age=60, s_maxage=600, public=False,
+                                  stale_while_revalidate=30,
+                                  vary=['Accept-Language', 'Cookie'])
+        response.set_cache_policy(policy)
+        assert response.header('cache-control') == \
+                'private, max-age=60, s-maxage=600, stale-while-revalidate=30'
+        assert response.header('expires').endswith(' GMT')
+        assert response.header('vary') == 'Accept-Language, Cookie'
+
+    def test_immutable(self):
+        response = Response(MemoryInterface())
+        policy = http.CachePolicy(max_age=3600, public=True, immutable=True)
+        response.set_cache_policy(policy)
+        assert response.header('cache-control') == \
+                'public, max-age=3600, immutable'
+
+    def test_aged(self):
+        policy = http.CachePolicy(max_age=60, s_maxage=600, public=True)
+        aged = policy.aged(100)
+        assert aged.cache_control() == 'public, max-age=0, s-maxage=500'
+        assert policy.max_age == 60
+        response = Response(MemoryInterface())
+        response.set_cache_policy(aged)
+        assert response.cache_policy() is aged
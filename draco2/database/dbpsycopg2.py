@@ -145,8 +145,9 @@ class Psycopg2DatabaseManager(DatabaseManager):
 
     def is_primary_key_error(self, exception):
         """Return True if `exception' is a primary key error."""
+        # PostgreSQL 8.2 and later say "duplicate key value violates".
         err = str(exception)
-        return err.startswith('duplicate key violates')
+        return err.startswith('duplicate key')
 
     def primary_key_error(self):
         """Return an instance of a primary key error."""
@@ -0,0 +1,107 @@
+# vi: ts=8 sts=4 sw=4 et
+#
+# agent.py: user agent classification
+#
+# This file is part of Draco2. Draco2 is free software and is made available
+# under the MIT license. Consult the file "LICENSE" that is distributed
+# together with this file for the exact licensing terms.
+#
+# Draco2 is copyright (c) 1999-2007 by the Draco2 authors. See the file
+# "AUTHORS" for a complete overview.
+#
+# $Revision: $
+
+import logging
+
+from draco2.draco.robot import RobotSignatures
+from draco2.util import http
+from draco2.util.cache import LruCache
+from draco2.util.singleton import singleton
+
+
+class AgentClassifier(object):
+    """Classify user agents.
+
+    A user agent is classified from its `User-Agent' header into a
+    3-tuple: (agentinfo, isrobot, iscompat). The `agentinfo' element is
+    the parsed header as returned by http.parse_user_agent(), or None if
+    the header is empty. The `isrobot' element indicates whether the
+    agent is a web robot, and `iscompat' indicates whether it needs
+    compatibility mode (i.e. it does not support XHTML).
+
+    User agent strings repeat heavily, so classifications are cached.
+    The cache is cleared when the robot signatures change.
+
+    This class is thread safe.
+    """
+
+    # Longer agent strings are not cached.
+    max_agent_size = 512
+
+    def __init__(self, robots=None):
+        """Constructor."""
+        self.m_robots = robots
+        self.m_cache = LruCache(1000)
+
+    @classmethod
+    def _create(cls, api):
+        """Factory method."""
+        robots = singleton(RobotSignatures, api,
+                           factory=RobotSignatures._create)
+        classifier = cls(robots)
+        classifier._configure(api)
+        if hasattr(api, 'changes'):
+            classifier._set_change_manager(api.changes)
+        return classifier
+
+    def _configure(self, api):
+        """Configure the classifier from the config file."""
+        config = api.config.ns('draco2.draco.agent')
+        if config.has_key('cachesize'):
+            self._set_cache_size(config['cachesize'])
+
+    def _set_change_manager(self, changes):
+        """Set the change manager to `changes'."""
+        ctx = changes.get_context('draco2.draco.robot')
+        ctx.add_callback(self._robot_callback)
+        ctx = changes.get_context('draco2.core.config')
+        ctx.add_callback(self._change_callback)
+
+    def _robot_callback(self, api):
+        """Clear the cache because the robot signatures have changed."""
+        self.m_cache.clear()
+        logger = logging.getLogger('draco2.draco.agent')
+        logger.debug('Cleared agent cache due to robot signature change.')
+
+    def _change_callback(self, api):
+        """Reload config."""
+        self._configure(api)
+
+    def _set_cache_size(self, size):
+        """Set the cache size."""
+        self.m_cache.set_size(size)
+
+    def _classify(self, agent):
+        """Classify `agent' without using the cache."""
+        if not agent:
+            return (None, False, False)
+        agentinfo = http.parse_user_agent(agent)
+        isrobot = False
+        if self.m_robots:
+            signatures = [agentinfo[0]] + agentinfo[2]
+            for sig in signatures:
+                if self.m_robots.match(sig):
+                    isrobot = True
+                    break
+        iscompat = agentinfo[0] == 'MSIE' or isrobot
+        return (agentinfo, isrobot, iscompat)
+
+    def classify(self, agent):
+        """Classify the user agent string `agent'."""
+        if len(agent) > self.max_agent_size:
+            return self._classify(agent)
+        result = self.m_cache.get(agent)
+        if result is None:
+            result = self._classify(agent)
+            self.m_cache.add(agent, result)
+        return result
@@ -0,0 +1,151 @@
+# vi: ts=8 sts=4 sw=4 et
+#
+# cache.py: full page cache
+#
+# This file is part of Draco2. Draco2 is free software and is made available
+# under the MIT license. Consult the file "LICENSE" that is distributed
+# together with this file for the exact licensing terms.
+#
+# Draco2 is copyright (c) 1999-2007 by the Draco2 authors. See the file
+# "AUTHORS" for a complete overview.
+#
+# $Revision: $
+
+import time
+import logging
+
+from draco2.util.cache import LruCache
+
+
+class CachedPage(object):
+    """A page in the page cache."""
+
+    def __init__(self, status, headers, body, expires, policy=None):
+        """Constructor."""
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.expires = expires
+        self.policy = policy
+        self.created = time.time()
+
+    def age(self):
+        """Return the number of seconds this page has been cached."""
+        return max(0, int(time.time() - self.created))
+
+
+class PageCache(object):
+    """Full page cache.
+
+    The page cache stores rendered pages together with their response
+    headers for a limited amount of time. It is used for requests that
+    are not tied to a session or a principal, i.e. anonymous visitors
+    and web robots.
+
+    Pages are indexed by a key that is computed by the handler. The key
+    is a tuple of which the first element must be the request URI.
+
+    This class is thread safe.
+    """
+
+    def __init__(self):
+        """Constructor."""
+        self.m_cache = LruCache(1000)
+        self.set_timeout(300)
+        self.set_vary([])
+
+    @classmethod
+    def _create(cls, api):
+        """Factory method."""
+        cache = cls()
+        cache._configure(api)
+        if hasattr(api, 'changes'):
+            cache._set_change_manager(api.changes)
+        return cache
+
+    def _configure(self, api):
+        """Configure the cache from the config file."""
+        config = api.config.ns('draco2.draco.cache')
+        if config.has_key('cachesize'):
+            self._set_cache_size(config['cachesize'])
+        if config.has_key('timeout'):
+            self.set_timeout(config['timeout'])
+        if config.has_key('vary'):
+            self.set_vary(config['vary'])
+
+    def _set_change_manager(self, changes):
+        """Set the change manager to `changes'."""
+        ctx = changes.get_context('draco2.core.config')
+        ctx.add_callback(self._change_callback)
+        ctx = changes.get_context('draco2.core.loader')
+        ctx.add_callback(self._change_callback)
+
+    def _change_callback(self, api):
+        """Reload config and clear the cache."""
+        self._configure(api)
+        self.m_cache.clear()
+        logger = logging.getLogger('draco2.draco.cache')
+        logger.debug('Cleared page cache due to change.')
+
+    def _set_cache_size(self, size):
+        """Set the cache size."""
+        self.m_cache.set_size(size)
+
+    def timeout(self):
+        """Return the default time to live of a page, in seconds."""
+        return self.m_timeout
+
+    def set_timeout(self, timeout):
+        """Set the default time to live of a page to `timeout' seconds."""
+        self.m_timeout = timeout
+
+    def vary(self):
+        """Return the list of request headers that are part of the
+        cache key."""
+        return self.m_vary
+
+    def set_vary(self, headers):
+        """Set the list of request headers that are part of the cache
+        key to `headers'."""
+        self.m_vary = [ name.lower() for name in headers ]
+
+    def get(self, key):
+        """Return the page stored under `key', or None if there is no
+        such page or if it has expired."""
+        page = self.m_cache.get(key)
+        if page is None:
+            return
+        if page.expires <= time.time():
+            self.m_cache.remove(key)
+            return
+        return page
+
+    def add(self, key, status, headers, body, timeout=None, policy=None):
+        """Store a page under `key'.
+
+        The `headers' argument is a dictionary of lists of header
+        values indexed by lower case header name. The `policy' argument
+        is the HTTP caching policy of the page, if any.
+        """
+        if timeout is None:
+            timeout = self.m_timeout
+        page = CachedPage(status, headers, body, time.time() + timeout,
+                          policy)
+        self.m_cache.add(key, page)
+        return page
+
+    def purge(self, prefix=''):
+        """Remove all pages with a URI that starts with `prefix'.
+
+        The number of pages removed is returned.
+        """
+        count = 0
+        for key in self.m_cache.keys():
+            if key[0].startswith(prefix):
+                self.m_cache.remove(key)
+                count += 1
+        return count
+
+    def clear(self):
+        """Remove all pages from the cache."""
+        self.m_cache.clear()
@@ -12,41 +12,66 @@
 # $Revision: $
 
 import draco2
-from draco2.core.filter import Filter
+from draco2.core.filter import IncrementalFilter
 from draco2.core.event import EventHandler
 
 
-class CompatFilter(Filter):
+def iscompat(request):
+    """Return True if the client of `request' needs compatibility
+    mode (i.e. it does not support XHTML)."""
+    return request.iscompat()
+
+
+class CompatFilter(IncrementalFilter):
     """Non-XHTML user agent compatiblity filter.
 
     This filter removes CDATA sections and replaces them with their
     encoded contents.
     """
 
+    cdata_start = '<![CDATA['
+    cdata_end = ']]>'
+
+    def __init__(self):
+        """Constructor."""
+        self.m_compat = None
+        self.m_pending = ''
+        self.m_incdata = False
+
     def _iscompat(self):
-        request = draco2.api.request
-        agent_info = request.agent_info()
-        return agent_info and agent_info[0] == 'MSIE' or request.isrobot()
+        return iscompat(draco2.api.request)
 
-    def filter(self, buffer):
-        if not self._iscompat():
-            return buffer
+    def feed(self, chunk):
+        if self.m_compat is None:
+            self.m_compat = self._iscompat()
+        if not self.m_compat:
+            return chunk
+        buffer = self.m_pending + chunk
+        result = []
         p1 = 0
-        result = ''
         while True:
-            p2 = buffer.find('<![CDATA[', p1)
+            if self.m_incdata:
+                marker = self.cdata_end
+            else:
+                marker = self.cdata_start
+            p2 = buffer.find(marker, p1)
             if p2 == -1:
-                result += buffer[p1:]
+                # Hold back a possible partial marker at the end.
+                p2 = max(p1, len(buffer) - len(marker) + 1)
+                result.append(buffer[p1:p2])
+                self.m_pending = buffer[p2:]
                 break
-            result += buffer[p1:p2]
-            p1 = p2 + 9
-            p2 = buffer.find(']]>', p1)
-            if p2 == -1:
-                raise ValueError
-            #result += buffer[p1:p2].encode('html')
-            result += buffer[p1:p2]
-            p1 = p2 + 3
-        return result
+            result.append(buffer[p1:p2])
+            p1 = p2 + len(marker)
+            self.m_incdata = not self.m_incdata
+        return ''.join(result)
+
+    def close(self):
+        if self.m_incdata:
+            raise ValueError
+        buffer = self.m_pending
+        self.m_pending = ''
+        return buffer
 
 
 class CompatEventHandler(EventHandler):
@@ -56,9 +81,7 @@ class CompatEventHandler(EventHandler):
     """
 
     def _iscompat(self):
-        request = draco2.api.request
-        agent_info = request.agent_info()
-        return agent_info and agent_info[0] == 'MSIE' or request.isrobot()
+        return iscompat(draco2.api.request)
 
     def pre_request_flush(self, api):
         if not self._iscompat():
@@ -18,13 +18,16 @@ from draco2.draco.opener import DracoOpener
 from draco2.draco.request import DracoRequest
 from draco2.draco.response import DracoResponse
 from draco2.draco.locale import DracoLocale
-from draco2.draco.session import DracoSession
+from draco2.draco.session import DracoSession, get_sessionid
 from draco2.draco.parser import DracoParser
 from draco2.draco.rewriter import DracoRewriter
-from draco2.draco.compat import CompatFilter, CompatEventHandler
+from draco2.draco.compat import CompatFilter, CompatEventHandler, iscompat
+from draco2.draco.cache import PageCache
+from draco2.draco.template import TemplateCache
 from draco2.file.handler import FileHandler
 from draco2.util import http
 from draco2.util import uri as urilib
+from draco2.util.singleton import singleton
 
 
 def norobot(method):
@@ -33,6 +36,77 @@ def norobot(method):
     return method
 
 
+def cache_control(max_age=None, s_maxage=None, public=None,
+                  stale_while_revalidate=None, vary=None):
+    """Decorator setting the HTTP caching policy for a method.
+
+    See CachePolicy for a description of the arguments.
+    """
+    policy = http.CachePolicy(max_age, s_maxage, public,
+                              stale_while_revalidate, vary)
+    def decorate(method):
+        method.cache_policy = policy
+        return method
+    return decorate
+
+
+def cache_page(timeout=None):
+    """Decorator enabling the page cache for a method.
+
+    The `timeout' argument specifies the time to live of the cached
+    page in seconds. If it is not specified, the default time to live
+    of the page cache is used.
+
+    A page that is served from the cache is sent before a session is
+    created and before the "pre_request" and "post_request" events
+    and the _pre_request() and _post_request() hooks run. Code that
+    must run for every request cannot be used with cached pages.
+    """
+    def decorate(method):
+        method.cache_pages = True
+        method.cache_timeout = timeout
+        return method
+    return decorate
+
+
+class TemplateWriter(object):
+    """Write parser output to a streaming response.
+
+    Output is held back until a full chunk is available, so that the
+    content type can be detected and the caching policy is known when
+    the response headers are set.
+    """
+
+    def __init__(self, response, start):
+        """Constructor. The `start' callable is called with the first
+        chunk of output before it is written."""
+        self.m_response = response
+        self.m_start = start
+        self.m_pending = []
+        self.m_size = 0
+        self.m_started = False
+
+    def write(self, data):
+        """Write `data'."""
+        if self.m_started:
+            self.m_response.write(data)
+            return
+        self.m_pending.append(data)
+        self.m_size += len(data)
+        if self.m_size >= self.m_response.chunk_size():
+            self.flush()
+
+    def flush(self):
+        """Write out output that was held back."""
+        if self.m_started:
+            return
+        self.m_started = True
+        data = ''.join(self.m_pending)
+        self.m_pending = []
+        self.m_start(data)
+        self.m_response.write(data)
+
+
 class DracoHandler(Handler):
     """The Draco handler base class."""
 
@@ -43,6 +117,17 @@ class DracoHandler(Handler):
 
     allowed_methods = ('GET', 'HEAD', 'POST')
 
+    # Page cache policy for all pages served by this handler. Individual
+    # methods can override this using the @cache_page decorator.
+    cache_pages = False
+    cache_timeout = None
+
+    # HTTP caching policy (a CachePolicy instance) for all pages served
+    # by this handler. Individual methods can override this using the
+    # @cache_control decorator, and templates using the "cache"
+    # directive. The default is to disallow caching.
+    cache_policy = None
+
     def _redirect_index(self, api):
         """Redirect to an index page."""
         request = api.request
@@ -53,6 +138,218 @@ class DracoHandler(Handler):
         headers = { 'location': [uri] }
         raise HTTPResponse(status, headers=headers)
 
+    def _page_cache(self, api):
+        """Return the page cache."""
+        cache = singleton(PageCache, api, factory=PageCache._create)
+        return cache
+
+    def _cache_policy(self, api):
+        """Return the page cache policy for the current request as a
+        (enabled, timeout) tuple."""
+        method = getattr(self, api.request.basename(), None)
+        enabled = getattr(method, 'cache_pages', self.cache_pages)
+        timeout = getattr(method, 'cache_timeout', self.cache_timeout)
+        return (enabled, timeout)
+
+    def _isanonymous(self, api):
+        """Return True if the current request is not tied to a session
+        or a principal."""
+        request = api.request
+        if api.security.principal():
+            return False
+        if request.isrobot():
+            return True
+        # Links for a new session include the session id if full link
+        # rewriting is enabled. Such pages cannot be shared.
+        if api.response.rewrite_link_level() > 1:
+            return False
+        sessionid = get_sessionid(request)
+        return not sessionid[0]
+
+    def _cache_key(self, api):
+        """Return the page cache key for the current request, or None
+        if the request cannot be cached."""
+        request = api.request
+        if request.method() not in ('GET', 'HEAD'):
+            return
+        extension = api.config.ns()['extension']
+        if not request.filename() or request.extension() != extension:
+            return
+        if not self._cache_policy(api)[0] or not self._isanonymous(api):
+            return
+        cache = self._page_cache(api)
+        scheme, host, path, args = urilib.parse_uri(request.uri())
+        pathinfo = '/'.join(request.pathinfo())
+        uri = '/' + urilib.create_path_uri(request.directory(),
+                                           request.filename(), pathinfo)
+        if args:
+            uri += '?' + args
+        if hasattr(api, 'locale'):
+            locale = api.locale.locale()
+        else:
+            locale = None
+        vary = tuple([ request.header(name) for name in cache.vary() ])
+        key = (uri, request.servername(), locale, request.isrobot(),
+               iscompat(request), vary)
+        return key
+
+    def _dispatch_cached(self, api):
+        """Serve the request from the page cache, if possible."""
+        api.pagecache = self._page_cache(api)
+        key = self._cache_key(api)
+        if key is None:
+            return False
+        page = api.pagecache.get(key)
+        if page is None:
+            return False
+        self._authorize(api)
+        response = api.response
+        response.set_buffering(False)
+        response.set_status(page.status)
+        for name,values in page.headers.items():
+            for value in values:
+                response.add_header(name, value)
+        # Either the freshness headers are regenerated for the remaining
+        # lifetime of the page, or the stored ones are sent with an Age
+        # header. Doing both would count the age twice.
+        age = page.age()
+        if page.policy is not None:
+            response.set_cache_policy(page.policy.aged(age))
+        else:
+            response.set_header('age', str(age))
+        response.send_header()
+        if api.request.method() == 'GET':
+            response.write(page.body)
+        return True
+
+    def _store_cached(self, api):
+        """Store the current response in the page cache, if possible."""
+        response = api.response
+        if response.status() != http.HTTP_OK or response.body() is None:
+            return
+        key = self._cache_key(api)
+        if key is None:
+            return
+        # Freshness headers are regenerated from the policy when the page
+        # is served.
+        skip = ['set-cookie', 'date', 'age']
+        policy = response.cache_policy()
+        if policy is not None:
+            skip += ['cache-control', 'expires']
+        headers = {}
+        for name,values in response.headers().items():
+            if name not in skip:
+                headers[name] = values[:]
+        timeout = self._cache_policy(api)[1]
+        cache = self._page_cache(api)
+        cache.add(key, response.status(), headers, response.body(), timeout,
+                  policy)
+
+    def _template_key(self, api, template):
+        """Return the template cache key for `template'."""
+        request = api.request
+        if hasattr(api, 'locale'):
+            locale = api.locale.locale()
+        else:
+            locale = None
+        key = (request.docroot(), request.directory(), request.basename(),
+               template, request.locale(), locale)
+        return key
+
+    def _render_template(self, api, template):
+        """Parse and rewrite `template', and return the output.
+
+        Templates that do not contain code are rewritten by the static
+        tag library handlers, which include translation, only once per
+        locale. The result is stored in the template cache. If no dynamic
+        handlers apply to the result, the XML parse and serialization are
+        skipped altogether.
+
+        For templates that contain code, the static handlers are run once
+        per locale on the literal markup of the template, and the result
+        is stored in the template cache as well. At request time, only the
+        markup that is produced by code is rewritten by all handlers, and
+        the literal markup by the dynamic handlers only.
+        """
+        cache = singleton(TemplateCache, api, factory=TemplateCache._create)
+        key = self._template_key(api, template)
+        compiled = cache.get(key)
+        if compiled is None or compiled.literals is not None:
+            parser = api.parser
+            output = parser.parse(template, namespace=self,
+                                  opener=api.opener)
+            if not parser.isstatic():
+                return self._render_compiled(api, key, compiled, output)
+            output, dynamic = api.rewriter.filter_static(output)
+            files = parser.files() + api.rewriter.files()
+            compiled = cache.add(key, files, output, dynamic,
+                                 parser.cache_policy())
+        else:
+            api.parser._set_cache_policy(compiled.cache_policy)
+        if not compiled.dynamic:
+            return compiled.output
+        mode = api.rewriter.REWRITE_DYNAMIC
+        return api.rewriter.filter(compiled.output, mode)
+
+    def _render_compiled(self, api, key, compiled, output):
+        """Rewrite `output', the output of a template that contains code.
+
+        The literal markup of the template is rewritten by the static
+        handlers and stored in the template cache under `key', unless
+        `compiled' already holds it. If the literal markup cannot be
+        parsed on its own, `output' is rewritten in full.
+        """
+        parser = api.parser
+        rewriter = api.rewriter
+        segments = parser.segments()
+        if segments is None:
+            return rewriter.filter(output)
+        literals, outputs = segments
+        if compiled is None or compiled.literals != literals:
+            cache = singleton(TemplateCache, api,
+                              factory=TemplateCache._create)
+            markup = rewriter.compile(literals)
+            files = parser.files() + rewriter.files()
+            compiled = cache.add(key, files, markup, True,
+                                 parser.cache_policy(), literals)
+        if compiled.output is not None:
+            result = rewriter.filter_compiled(compiled.output, outputs)
+            if result is not None:
+                return result
+        return rewriter.filter(output)
+
+    def _stream_template(self, api, template):
+        """Parse `template' and stream it to the client.
+
+        The parser output is written to the response as it is produced,
+        and is rewritten on the fly by the streaming rewriter, which is
+        installed as an output filter. The response headers are sent
+        once the first chunk of output is complete. Code that changes
+        headers, and "cache" directives, must come before that.
+        """
+        response = api.response
+        rewriter = api.rewriter.stream(response.encoding())
+        response.add_filter(rewriter)
+        def start(output):
+            response.set_header('Content-Type', http.get_mime_type(output))
+            response.set_cache_policy(self._http_cache_policy(api))
+        writer = TemplateWriter(response, start)
+        api.parser.parse(template, namespace=self, opener=api.opener,
+                         output=writer.write)
+        writer.flush()
+        api.events.raise_event('pre_request_flush', api)
+        response.flush()
+
+    def _http_cache_policy(self, api):
+        """Return the HTTP caching policy for the current request."""
+        policy = api.parser.cache_policy()
+        if policy is None:
+            method = getattr(self, api.request.basename(), None)
+            policy = getattr(method, 'cache_policy', self.cache_policy)
+        if policy is None:
+            policy = http.CachePolicy()
+        return policy
+
     def _pre_request(self, api):
         """Pre request hook."""
 
@@ -135,19 +432,22 @@ class DracoHandler(Handler):
             if method:
                 method(api)
 
-            if template:
-                output = api.parser.parse(template, namespace=self,
-                                          opener=api.opener)
-                output = api.rewriter.filter(output)
+            if template and response.streaming() and \
+                        request.method() == 'GET' and \
+                        api.rewriter.streamable():
+                self._stream_template(api, template)
+            elif template:
+                output = self._render_template(api, template)
                 mime_type = http.get_mime_type(output)
                 response.set_buffering(True)
                 response.set_header('Content-Type', mime_type)
-                response.set_header('Cache-Control', 'no-cache')
+                response.set_cache_policy(self._http_cache_policy(api))
                 response.set_header('Content-Length', str(len(output)))
                 response.write(output)
                 api.events.raise_event('pre_request_flush', api)
                 header_only = request.method() == 'HEAD'
                 response.flush(header_only)
+                self._store_cached(api)
 
             api.events.raise_event('post_request', api)
             self._post_request(api)
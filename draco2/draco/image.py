@@ -17,7 +17,8 @@ import threading
 import logging
 
 from draco2.util.cache import LruCache
-from draco2.util.image import get_image_info
+from draco2.util.image import (get_image_info, build_image_index,
+                               read_image_index, write_image_index)
 
 
 class ImageInfo(object):
@@ -27,8 +28,16 @@ class ImageInfo(object):
     certain parts of the file system. The information returns in a
     3-tuple of (format, with, height).
 
-    A LRU cache is used for efficiency. The cache is validated on every
-    access by means of file modification time.
+    If an image index is configured, images in the document root are
+    looked up in the index first. The index is a file that is shared by
+    all processes. It is built at startup if it does not exist, can be
+    rebuilt with the `buildimageindex.py' command, and is reloaded by
+    the change manager when it is rebuilt. Entries in the index are
+    validated by means of file modification time. Images that have
+    changed since the index was built are looked up as other images.
+
+    Other images are looked up in a LRU cache. The cache is validated on
+    every access by means of file modification time.
 
     This class is thread safe.
     """
@@ -37,6 +46,9 @@ class ImageInfo(object):
         """Constructor."""
         self.m_path = []
         self.m_cache = LruCache(1000)
+        self.m_index = {}
+        self.m_index_file = None
+        self.m_change_context = None
 
     @classmethod
     def _create(cls, api):
@@ -49,12 +61,20 @@ class ImageInfo(object):
             images._set_cache_size(config['cachesize'])
         if hasattr(api, 'changes'):
             images._set_change_manager(api.changes)
+        if config.has_key('indexfile'):
+            datadir = api.config.ns('draco2')['datadirectory']
+            fname = os.path.join(datadir, config['indexfile'])
+            if not os.path.exists(fname):
+                images.build_index(docroot, fname)
+            images.set_index_file(fname)
         return images
 
     def _set_change_manager(self, changes):
         """Set the change manager to `changes'."""
         ctx = changes.get_context('draco2.core.config')
         ctx.add_callback(self._change_callback)
+        self.m_change_context = changes.get_context('draco2.draco.image')
+        self.m_change_context.add_callback(self._index_callback)
 
     def _change_callback(self, api):
         """Reload config."""
@@ -64,6 +84,12 @@ class ImageInfo(object):
         logger = logging.getLogger('draco2.draco.image')
         logger.debug('Reloaded due to config change.')
 
+    def _index_callback(self, api):
+        """Reload the image index (change detected)."""
+        self.m_index = read_image_index(self.m_index_file)
+        logger = logging.getLogger('draco2.draco.image')
+        logger.debug('Reloaded image index (change detected).')
+
     def _set_cache_size(self, size):
         """Set the cache size."""
         self.m_cache.set_size(size)
@@ -72,11 +98,42 @@ class ImageInfo(object):
         """Add `path' to the image search path. """
         self.m_path.append(path)
 
+    def build_index(self, root, fname):
+        """Build an image index for directory `root' and write it to
+        the file `fname'."""
+        logger = logging.getLogger('draco2.draco.image')
+        logger.info('Building image index for %s.' % root)
+        index = build_image_index(root)
+        write_image_index(index, fname)
+        logger.info('Wrote %d images to %s.' % (len(index), fname))
+
+    def set_index_file(self, fname):
+        """Use the image index in file `fname'.
+
+        The index must have been built for the first directory in the
+        path, i.e. the document root.
+        """
+        self.m_index_file = fname
+        self.m_index = read_image_index(fname)
+        if self.m_change_context:
+            self.m_change_context.add_file(fname)
+
     def get_info(self, fname):
         """Get image size for `fname'.
 
-        The file `fname' is looked up in the path.
+        The file `fname' is looked up in the image index, and then in
+        the path.
         """
+        if self.m_index:
+            parts = [ p for p in fname.split('/') if p ]
+            entry = self.m_index.get('/' + '/'.join(parts))
+            if entry:
+                try:
+                    st = os.stat(os.path.join(self.m_path[0], *parts))
+                except OSError:
+                    st = None
+                if st and st.st_mtime == entry[3]:
+                    return entry[:3]
         for path in self.m_path:
             # do not use os.path.join() as fname() may start with '/'
             fname = path + os.sep + fname
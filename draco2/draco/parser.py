@@ -11,12 +11,14 @@
 #
 # $Revision: 1187 $
 
+import os
 import re
 
 from draco2.core.exception import DracoError
 from draco2.draco.context import DracoContext
 from draco2.draco.exception import ParseError
 from draco2.util.misc import get_backtrace, dedent
+from draco2.util.http import CachePolicy
 
 
 class Parser(object):
@@ -35,13 +37,17 @@ class Parser(object):
         """Factory method."""
         return cls()
 
-    def parse(self, input, namespace=None, opener=None, mode=None):
+    def parse(self, input, namespace=None, opener=None, mode=None,
+              output=None):
         """Parse a document and return the parsed output.
 
         The document to be parsed is specified by `input'. It must be either
         a file name, or a file like object. The `namespace' argument
         specifies the namespace to use, `opener is an optional document
-        opener, and `mode' specifies the parsing mode.
+        opener, and `mode' specifies the parsing mode. If `output' is
+        specified, it must be a callable that is called with the output
+        as it becomes available. In that case, the return value is an
+        empty string.
         """
         raise NotImplementedError
 
@@ -76,18 +82,30 @@ class Frame(object):
         self.locals = {}
         self.buffer = ''
         self.result = []
+        self.code = set()
 
 
 class DracoParser(Parser):
     """The draco parser."""
 
-    def parse(self, input, namespace=None, opener=None, mode=None):
+    def __init__(self):
+        """Constructor."""
+        self.m_cache_policy = None
+        self.m_static = True
+        self.m_literal = True
+        self.m_files = []
+        self.m_segments = None
+
+    def parse(self, input, namespace=None, opener=None, mode=None,
+              output=None):
         """Parse a document."""
-        self._start(namespace, opener, mode)
-        result = self.include(input)
-        return result
+        self._start(namespace, opener, mode, output)
+        frame = self._include(input)
+        if output is None:
+            self.m_segments = frame
+        return ''.join(frame.result)
 
-    def _start(self, namespace=None, opener=None, mode=None):
+    def _start(self, namespace=None, opener=None, mode=None, output=None):
         """INTERNAL: start parsing but do not yet allocate a frame."""
         if namespace is None:
             namespace = {}
@@ -97,7 +115,13 @@ class DracoParser(Parser):
         self.m_context = DracoContext()
         self.m_opener = opener
         self.m_mode = mode
+        self.m_output = output
         self.m_frames = []
+        self.m_cache_policy = None
+        self.m_static = True
+        self.m_literal = True
+        self.m_files = []
+        self.m_segments = None
 
     def start(self, namespace=None, opener=None, mode=None):
         """Start parsing."""
@@ -109,9 +133,82 @@ class DracoParser(Parser):
         self.feed('', eof=True)
         return self._result()
 
-    def _emit(self, data):
-        """INTERNAL: emit output data."""
-        self.m_frames[-1].result.append(data)
+    def cache_policy(self):
+        """Return the caching policy set by a "cache" directive, or None
+        if no such directive was encountered."""
+        return self.m_cache_policy
+
+    def _set_cache_policy(self, policy):
+        """Set the caching policy to `policy'."""
+        self.m_cache_policy = policy
+
+    def isstatic(self):
+        """Return True if the output of the last parse depends only on
+        the documents that were parsed.
+
+        This is the case if no code blocks or expressions were evaluated,
+        and all documents came from files.
+        """
+        return self.m_static
+
+    def files(self):
+        """Return the files that were parsed, as a list of (filename,
+        mtime) tuples."""
+        return self.m_files
+
+    def segments(self):
+        """Return the output of the last parse, split into the literal
+        markup of the documents and the output of code.
+
+        The return value is a tuple (literals, outputs). The `outputs'
+        list contains the output of code blocks, expressions and includes
+        whose source is an expression, and `literals' contains the markup
+        before, between and after them, so that it is one longer. As code
+        cannot span markup, the literal markup of a template is always
+        the same. The return value is None if the output was not returned
+        by parse(), or if not all documents came from files.
+        """
+        frame = self.m_segments
+        if frame is None or not self.m_literal:
+            return
+        literals = ['']
+        outputs = []
+        code = False
+        for i,data in enumerate(frame.result):
+            if i in frame.code:
+                if code:
+                    outputs[-1] += data
+                else:
+                    outputs.append(data)
+                    literals.append('')
+                code = True
+            elif data:
+                literals[-1] += data
+                code = False
+        return literals, outputs
+
+    def _emit(self, data, code=False):
+        """INTERNAL: emit output data. The `code' argument indicates
+        whether the data was produced by code."""
+        # Output of the top-level document is passed on directly.
+        if self.m_output is not None and len(self.m_frames) == 1:
+            if data:
+                self.m_output(data)
+        else:
+            frame = self.m_frames[-1]
+            if code:
+                frame.code.add(len(frame.result))
+            frame.result.append(data)
+
+    def _extend(self, frame):
+        """INTERNAL: emit the output of the included frame `frame'."""
+        if self.m_output is not None and len(self.m_frames) == 1:
+            self._emit(''.join(frame.result))
+            return
+        current = self.m_frames[-1]
+        offset = len(current.result)
+        current.result += frame.result
+        current.code.update([ offset + i for i in frame.code ])
 
     def _result(self):
         """INTERNAL: return result."""
@@ -122,12 +219,19 @@ class DracoParser(Parser):
 
         This function can be called by embedded code while parsing.
         """
+        frame = self._include(input, kwargs)
+        return ''.join(frame.result)
+
+    def _include(self, input, kwargs=None):
+        """INTERNAL: include a document and return its frame."""
         if len(self.m_frames) > 20:
             raise ParseError, 'Maximum recursion depth exceeded.'
         if hasattr(input, 'read'):
             fin = input
             fname = '<file object>'
             close = False
+            self.m_static = False
+            self.m_literal = False
         else:
             try:
                 if self.m_opener:
@@ -139,8 +243,15 @@ class DracoParser(Parser):
             except IOError:
                 raise ParseError, 'Could not open input: %s' % input
             close = True
+            try:
+                st = os.fstat(fin.fileno())
+                self.m_files.append((fname, st.st_mtime))
+            except (AttributeError, OSError):
+                self.m_static = False
+                self.m_literal = False
         self.m_frames.append(Frame(fname))
-        self.m_frames[-1].locals.update(kwargs)
+        if kwargs:
+            self.m_frames[-1].locals.update(kwargs)
         while True:
             buf = fin.read(4096)
             if not buf:
@@ -149,9 +260,7 @@ class DracoParser(Parser):
         self.feed(buf, eof=True)
         if close:
             fin.close()
-        result = self._result()
-        self.m_frames.pop()
-        return result
+        return self.m_frames.pop()
 
     def _parse_error(self, message):
         """Raise a parse error."""
@@ -209,13 +318,13 @@ class DracoParser(Parser):
                         res = str(res)
                     if buffer[p0+2] == '+':
                         res = res.encode('html')
-                    self._emit(res)
+                    self._emit(res, True)
                 elif self.m_mode == self.COLLECT_CODE:
                     self._emit(dedent(buffer[p0+3:p1]) + '\n')
             else:
                 if self.m_mode == self.PARSE:
                     res = self._parse_code(buffer[p0+2:p1])
-                    self._emit(res)
+                    self._emit(res, True)
                 elif self.m_mode == self.COLLECT_CODE:
                     self._emit(dedent(buffer[p0+2:p1]) + '\n')
             self.m_frames[-1].lineno += buffer[p0:p1+2].count('\n')
@@ -246,15 +355,19 @@ class DracoParser(Parser):
             attrs[str(mobj.group('name'))] = mobj.group('value')[1:-1]
         if name == 'include':
             self._directive_include(attrs)
+        elif name == 'cache':
+            self._directive_cache(attrs)
         else:
             self._parse_error('Unknown directive: %s.' % name)
 
     def _directive_include(self, attrs):
         """Handle an include directive."""
+        code = False
         if attrs.has_key('file'):
             fname = attrs['file']
             del attrs['file']
         elif attrs.has_key('expr'):
+            code = True
             if self.m_mode == self.PARSE:
                 fname = self._parse_expression(attrs['expr'])
             elif self.m_mode == self.COLLECT_CODE:
@@ -271,12 +384,43 @@ class DracoParser(Parser):
                 kwargs[key] = self._parse_expression(value)
             elif self.m_mode == self.COLLECT_CODE:
                 self._emit(dedent(value) + '\n')
-        if fname is not None:
-            result = self.include(fname, **kwargs)
-            self._emit(result)
+        if fname is None:
+            return
+        frame = self._include(fname, kwargs)
+        if code:
+            # The document that is included depends on code.
+            self._emit(''.join(frame.result), True)
+        else:
+            self._extend(frame)
+
+    def _directive_cache(self, attrs):
+        """Handle a cache directive."""
+        if self.m_mode != self.PARSE:
+            return
+        kwargs = {}
+        for key in ('max_age', 's_maxage', 'stale_while_revalidate'):
+            if not attrs.has_key(key):
+                continue
+            try:
+                kwargs[key] = int(attrs[key])
+            except ValueError:
+                self._parse_error('Illegal value for "%s" in cache '
+                                  'directive.' % key)
+        if attrs.has_key('public') or attrs.has_key('private'):
+            public = attrs.get('public', 'false').lower() == 'true'
+            private = attrs.get('private', 'false').lower() == 'true'
+            if public == private:
+                self._parse_error('Illegal public/private in cache '
+                                  'directive.')
+            kwargs['public'] = public
+        if attrs.has_key('vary'):
+            kwargs['vary'] = [ name.strip() for name in
+                               attrs['vary'].split(',') if name.strip() ]
+        self.m_cache_policy = CachePolicy(**kwargs)
 
     def _parse_expression(self, buffer):
         """Evaluate an expression: <%= expr %>."""
+        self.m_static = False
         try:
             result = self.m_context.eval(buffer, self.m_globals,
                                          self.m_frames[-1].locals,
@@ -292,6 +436,7 @@ class DracoParser(Parser):
 
     def _parse_code(self, buffer):
         """Run a clode block: <% code %>."""
+        self.m_static = False
         try:
             stdout, stderr = self.m_context.run(buffer, self.m_globals,
                                                 self.m_frames[-1].locals,
@@ -15,41 +15,43 @@ import os.path
 
 from draco2.core.request import Request
 from draco2.draco import uri as dracouri
-from draco2.draco.robot import RobotSignatures
-from draco2.util import http
+from draco2.draco.agent import AgentClassifier
+from draco2.util import uri as urilib
 from draco2.util.singleton import singleton
 
 
 class DracoRequest(Request):
     """The Draco request object."""
 
-    def __init__(self, iface):
+    def __init__(self, iface, config=None):
         """Constructor."""
-        super(DracoRequest, self).__init__(iface)
+        super(DracoRequest, self).__init__(iface, config)
         self._parse_draco_uri()
-        self._init_agent_info()
-        self._set_robots(None)
+        self._set_agent_classifier(None)
 
     @classmethod
     def _create(cls, api):
         """Factory method."""
-        request = cls(api.iface)
-        robots = singleton(RobotSignatures, api,
-                           factory=RobotSignatures._create)
-        request._set_robots(robots)
+        request = cls(api.iface, api.config.ns('draco2.core.request'))
+        classifier = singleton(AgentClassifier, api,
+                               factory=AgentClassifier._create)
+        request._set_agent_classifier(classifier)
         return request
 
-    def _set_robots(self, robots):
-        """Set the robot signature database."""
-        if robots and not isinstance(robots, RobotSignatures):
-            raise TypeError, 'Expecting a RobotSignatures instance.'
-        self.m_robots = robots
-        self._init_robot()
+    def _set_agent_classifier(self, classifier):
+        """Set the user agent classifier."""
+        if classifier and not isinstance(classifier, AgentClassifier):
+            raise TypeError, 'Expecting an AgentClassifier instance.'
+        self.m_classifier = classifier
+        self.m_agent = None
 
     def _parse_draco_uri(self):
         """Parse the request URI."""
+        uri = self.uri()
+        docroot = self.docroot()
         (protocol, host, directory, filename, locale, session,
-         pathinfo, args) = dracouri.parse_draco_uri(self.uri(), self.docroot())
+         pathinfo, args) = dracouri.parse_draco_uri(uri, docroot,
+                                                    urilib.path_cache)
         self.m_locale = locale
         self.m_session = session
         self.m_pathinfo = pathinfo.split('/')
@@ -62,30 +64,25 @@ class DracoRequest(Request):
         """Return the session presented in the request."""
         return self.m_session
 
-    def _init_agent_info(self):
-        """Parse the `User-Agent' header."""
-        self.m_agentinfo = None
-        agent = self.header('User-Agent')
-        if not agent:
-            return
-        agentinfo = http.parse_user_agent(agent)
-        self.m_agentinfo = agentinfo
+    def _classify_agent(self):
+        """Classify the `User-Agent' header, on first use."""
+        if self.m_agent is None:
+            agent = self.header('User-Agent') or ''
+            classifier = self.m_classifier
+            if classifier is None:
+                classifier = AgentClassifier()
+            self.m_agent = classifier.classify(agent)
+        return self.m_agent
 
     def agent_info(self):
         """Return parsed user agent info."""
-        return self.m_agentinfo
-
-    def _init_robot(self):
-        """Match the `User-Agent' header against the robot database."""
-        self.m_isrobot = False
-        if not self.m_agentinfo or not self.m_robots:
-            return
-        signatures = [self.m_agentinfo[0]] + self.m_agentinfo[2]
-        for sig in signatures:
-            if self.m_robots.match(sig):
-                self.m_isrobot = True
-                break
+        return self._classify_agent()[0]
 
     def isrobot(self):
         """Return nonzero if the a web robot is detected."""
-        return self.m_isrobot
+        return self._classify_agent()[1]
+
+    def iscompat(self):
+        """Return True if the user agent needs compatibility mode
+        (i.e. it does not support XHTML)."""
+        return self._classify_agent()[2]
@@ -18,6 +18,7 @@ from draco2.util import http
 from draco2.util import uri as urimod
 from draco2.draco import uri as dracouri
 from draco2.session.util import dump_sessionid
+from draco2.util.singleton import singleton
 
 
 class DracoResponse(Response):
@@ -27,6 +28,8 @@ class DracoResponse(Response):
         """Constructor."""
         super(DracoResponse, self).__init__(*args)
         self.m_template = None
+        self.m_rewrite_cache = {}
+        self.m_parse_cache = None
         self._set_rewrite_link_level(0)
 
     @classmethod
@@ -35,6 +38,9 @@ class DracoResponse(Response):
         response = super(DracoResponse, cls)._create(api)
         response._set_api(api)
         response._set_request(api.request)
+        cache = singleton(dracouri.ParseCache, api,
+                          factory=dracouri.ParseCache._create)
+        response._set_parse_cache(cache)
         config = api.config.ns('draco2.draco.response')
         if config.has_key('rewritelinklevel'):
             response._set_rewrite_link_level(config['rewritelinklevel'])
@@ -48,6 +54,10 @@ class DracoResponse(Response):
         """Set the request to `request'."""
         self.m_request = request
 
+    def _set_parse_cache(self, cache):
+        """Set the cache that is used to parse URIs to `cache'."""
+        self.m_parse_cache = cache
+
     def _set_rewrite_link_level(self, level):
         """Set the rewrite link level to `level'.
 
@@ -55,6 +65,10 @@ class DracoResponse(Response):
         for subsessions and any value > 1 enables full rewriting."""
         self.m_rewrite_link_level = level
 
+    def rewrite_link_level(self):
+        """Return the rewrite link level."""
+        return self.m_rewrite_link_level
+
     def template(self):
         """Return the template that will be parsed after the handler."""
         return self.m_template
@@ -134,25 +148,47 @@ class DracoResponse(Response):
                                         args)
 
     def rewrite_uri(self, uri, force_rewrite=False):
-        """Pass on extended Draco URI components."""
+        """Pass on extended Draco URI components.
+
+        Results are remembered for the duration of the request, for the
+        current locale and session.
+        """
         if callable(uri):
             extension = self.m_api.options['extension']
             uri = dracouri.uri_from_method(uri, extension)
+        locale = self.m_request.locale()
+        if hasattr(self.m_api, 'session'):
+            sessionid = self.m_api.session.sessionid()
+        else:
+            sessionid = None
+        if sessionid:
+            key = tuple(sessionid)
+        else:
+            key = None
+        key = (uri, force_rewrite, locale, key, self.m_rewrite_link_level)
+        try:
+            return self.m_rewrite_cache[key]
+        except KeyError:
+            pass
+        result = self._rewrite_uri(uri, force_rewrite, locale, sessionid)
+        self.m_rewrite_cache[key] = result
+        return result
+
+    def _rewrite_uri(self, uri, force_rewrite, locale, sessionid):
+        """Rewrite `uri' for `locale' and `sessionid'."""
         scheme, host, path, query = urimod.parse_uri(uri)
         if scheme and scheme != 'http':
             return uri
         docroot = self.m_request.docroot()
         extension = self.m_api.options['extension']
         servername = self.m_request.servername()
-        parts = dracouri.parse_draco_uri(uri, docroot)
+        if self.m_parse_cache is not None:
+            parts = self.m_parse_cache.parse(uri, docroot)
+        else:
+            parts = dracouri.parse_draco_uri(uri, docroot)
         if not force_rewrite and (parts[1] and parts[1] != servername) \
                     or not parts[3].endswith('.' + extension):
             return uri
-        locale = self.m_request.locale()
-        if hasattr(self.m_api, 'session'):
-            sessionid = self.m_api.session.sessionid()
-        else:
-            sessionid = None
         if sessionid:
             sessionid = list(sessionid)
             # subsession if not default
@@ -166,7 +202,8 @@ class DracoResponse(Response):
             session = dump_sessionid(sessionid)
         else:
             session = None
-        uri = self.paste_uri(uri, locale=locale, session=session)
+        uri = dracouri.paste_draco_parts(parts, locale=locale,
+                                         session=session)
         return uri
 
     def redirect(self, uri, scheme=None, host=None, directory=None,
@@ -11,11 +11,13 @@
 #
 # $Revision: 1187 $
 
+import re
 import lxml.etree
 
 import draco2
-from draco2.core.exception import FilterError
-from draco2.core.filter import Filter
+from draco2.core.exception import FilterError, DracoInterfaceError
+from draco2.core.filter import Filter, IncrementalFilter
+from draco2.util.cache import LruCache
 from draco2.draco.taglib import TagLibrary
 from draco2.draco.taglib import DracoTagLibrary, TranslationTagLibrary
 
@@ -46,17 +48,39 @@ class Rewriter(Filter):
         if priority is None:
             priority = taglib.priority
         self.m_tag_libraries.append((priority, taglib))
-        self.m_tag_libraries.sort()
+        self.m_tag_libraries.sort(key=lambda x: x[0])
 
     def tag_libraries(self):
         """Return a list of tag libraries."""
         libraries = [ tl[1] for tl in self.m_tag_libraries ]
         return libraries
 
+    def files(self):
+        """Return the files that the output of static handlers depends
+        on, as a list of (filename, mtime) tuples."""
+        files = []
+        for taglib in self.tag_libraries():
+            files += taglib._files()
+        return files
+
 
 class DracoRewriter(Rewriter):
     """The default Draco rewrite filter."""
 
+    # Rewrite modes
+    REWRITE_ALL = 0
+    REWRITE_STATIC = 1
+    REWRITE_DYNAMIC = 2
+    REWRITE_COMPILED = 3
+
+    # Placeholders for the output of code in the literal markup of a
+    # template, and the attribute that marks elements that have been
+    # rewritten by compile().
+    re_placeholder = re.compile(r'<\?draco-code ([0-9]+)\?>|'
+                                r'\{draco-code:([0-9]+)\}')
+    c_reserved = 'draco-code'
+    c_marker = 'draco-code'
+
     def __init__(self):
         """Constructor."""
         super(DracoRewriter, self).__init__()
@@ -86,24 +110,826 @@ class DracoRewriter(Rewriter):
         """Return a directionary of namespace prefixes."""
         return self.m_namespaces
 
-    def _filter_tree(self, tree):
-        """Filter an XML tree `tree'."""
-        for taglib in self.tag_libraries():
-            for xpath,handler in taglib._elements():
-                try:
-                    nodes = tree.xpath(xpath, namespaces=self.m_namespaces)
-                except lxml.etree.Error, err:
-                    raise RewriteError, str(err)
-                for node in nodes:
-                    handler(node)
-        return tree
+    re_selector = re.compile(r'^//(?:([\w.-]+):)?([\w.-]+|\*)(\[.*\])?$',
+                             re.S)
+    re_positional = re.compile(r'^\[\s*[0-9]|position\s*\(|last\s*\(')
+    c_tables = LruCache(100)
+
+    def _is_predicate(self, expr):
+        """Return True if `expr' is a sequence of XPath predicates that
+        does not depend on the position of the context node."""
+        if self.re_positional.search(expr):
+            return False
+        depth = 0
+        quote = None
+        for ch in expr:
+            if quote:
+                if ch == quote:
+                    quote = None
+            elif ch in '\'"':
+                quote = ch
+            elif ch == '[':
+                depth += 1
+            elif ch == ']':
+                depth -= 1
+                if depth < 0:
+                    return False
+            elif depth == 0:
+                return False
+        return depth == 0 and quote is None
+
+    def _compile_xpath(self, xpath):
+        """Compile `xpath' into an XPath object."""
+        try:
+            return lxml.etree.XPath(xpath, namespaces=self.m_namespaces)
+        except lxml.etree.Error, err:
+            raise RewriteError, str(err)
+
+    def _parse_selector(self, xpath):
+        """Parse a simple selector.
+
+        Selectors of the form `//prefix:name', optionally followed by
+        predicates, are simple. The return value is a tuple (tag,
+        predicate) where `tag' is the element name in lxml notation and
+        `predicate' is a test to apply to candidate nodes, or None. For
+        complex selectors, None is returned.
+        """
+        mobj = self.re_selector.match(xpath)
+        if not mobj:
+            return
+        prefix, name, predicate = mobj.groups()
+        if predicate and not self._is_predicate(predicate):
+            return
+        if prefix:
+            try:
+                uri = self.m_namespaces[prefix]
+            except KeyError:
+                m = 'Undefined namespace prefix: %s' % prefix
+                raise RewriteError, m
+            tag = '{%s}%s' % (uri, name)
+            nametest = '%s:%s' % (prefix, name)
+        elif name == '*':
+            tag = '*'
+            nametest = '*'
+        else:
+            tag = name
+            nametest = name
+        if predicate:
+            predicate = self._compile_xpath('self::%s%s' % (nametest,
+                                                            predicate))
+        return (tag, predicate)
+
+    def _compile_table(self):
+        """Compile the handler dispatch table.
+
+        The return value is a tuple (table, selectors). The table maps
+        element names in lxml notation to lists of handler entries.
+        Element names of the form `{uri}*' and `*' contain wildcard
+        handlers. The selectors are the complex selectors, as a list
+        of tuples (xpath, entry).
+
+        A handler entry is a tuple (priority, seqno, index, name, test,
+        static, local) that refers to the handler `name' of the tag
+        library at position `index'. The `test' member is None or a test
+        that the node must satisfy. The `static' and `local' members are
+        the handler's flags (see `element'). Handlers are ordered by their
+        tag library's priority, and then by the order in which they were
+        defined.
+
+        The table does not refer to tag library instances and is cached
+        for each combination of tag library classes.
+        """
+        key = [ (tl[0], tl[1].__class__) for tl in self.m_tag_libraries ]
+        key.append(tuple(sorted(self.m_namespaces.items())))
+        key = tuple(key)
+        result = self.c_tables.get(key)
+        if result is not None:
+            return result
+        table = {}
+        selectors = []
+        seqno = 0
+        for index,(priority,taglib) in enumerate(self.m_tag_libraries):
+            for xpath,name in taglib._element_names():
+                seqno += 1
+                method = getattr(taglib.__class__, name)
+                static = bool(getattr(method, 'static', False))
+                local = bool(getattr(method, 'local', False))
+                parsed = self._parse_selector(xpath)
+                if parsed is None:
+                    xpath = self._compile_xpath(xpath)
+                    entry = (priority, seqno, index, name, None, static,
+                             local)
+                    selectors.append((xpath, entry))
+                    continue
+                tag, predicate = parsed
+                entry = (priority, seqno, index, name, predicate, static,
+                         local)
+                table.setdefault(tag, []).append(entry)
+        result = (table, selectors)
+        self.c_tables.add(key, result)
+        return result
+
+    def _dispatch_table(self):
+        """Build the handler dispatch table.
+
+        This binds the compiled dispatch table to the tag libraries of
+        this rewriter. The handler entries in the return value are
+        tuples (priority, seqno, handler, test, static, local).
+        """
+        table, selectors = self._compile_table()
+        taglibs = self.tag_libraries()
+        def bind(entry):
+            handler = getattr(taglibs[entry[2]], entry[3])
+            return entry[:2] + (handler,) + entry[4:]
+        bound = {}
+        for tag,entries in table.items():
+            bound[tag] = [ bind(entry) for entry in entries ]
+        bound_selectors = [ (xpath, bind(entry))
+                            for xpath,entry in selectors ]
+        return bound, bound_selectors
+
+    def _handler_lookup(self, tree=None):
+        """Return a function that returns the handler entries that apply
+        to an element name, ordered by priority.
+
+        Complex selectors are evaluated on `tree'. If `tree' is not
+        given, there may not be any complex selectors.
+        """
+        table, selectors = self._dispatch_table()
+        for xpath,entry in selectors:
+            if tree is None:
+                raise RewriteError, 'Complex selectors require a tree.'
+            try:
+                nodes = set(xpath(tree))
+            except lxml.etree.Error, err:
+                raise RewriteError, str(err)
+            entry = entry[:3] + (nodes.__contains__,) + entry[4:]
+            table.setdefault('*', []).append(entry)
+        cache = {}
+        def handlers(tag):
+            try:
+                return cache[tag]
+            except KeyError:
+                pass
+            entries = table.get(tag, []) + table.get('*', [])
+            if tag.startswith('{'):
+                wildcard = tag[:tag.rfind('}')+1] + '*'
+                entries += table.get(wildcard, [])
+            entries.sort()
+            cache[tag] = entries
+            return entries
+        return handlers
+
+    def streamable(self):
+        """Return True if this rewriter can be used in streaming mode.
 
-    def filter(self, buffer):
+        This is the case if none of the tag libraries uses complex
+        selectors.
+        """
+        table, selectors = self._compile_table()
+        return not selectors
+
+    def stream(self, encoding=None):
+        """Return an incremental filter that rewrites a document in
+        streaming mode."""
+        if not self.streamable():
+            m = 'Rewriter cannot be used in streaming mode.'
+            raise DracoInterfaceError, m
+        return StreamRewriter(self, encoding)
+
+    def _following(self, node, top=None):
+        """Return the node that follows `node' in document order, not
+        descending into `node' and not leaving the element `top'."""
+        while node is not None and node is not top:
+            next = node.getnext()
+            if next is not None:
+                return next
+            node = node.getparent()
+
+    def _apply_handlers(self, node, handlers):
+        """Apply all handlers to `node'.
+
+        If a handler changes the name of the node, handlers for the new
+        name that come after the current handler are run as well. The
+        return value is False if the node was removed from the tree by
+        one of the handlers.
+        """
+        tag = node.tag
+        parent = node.getparent()
+        entries = handlers(tag)
+        i = 0
+        while i < len(entries):
+            entry = entries[i]
+            i += 1
+            test = entry[3]
+            if test is not None and not test(node):
+                continue
+            entry[2](node)
+            if node.getparent() is not parent:
+                return False
+            if node.tag != tag:
+                tag = node.tag
+                entries = [ e for e in handlers(tag) if e[:2] > entry[:2] ]
+                i = 0
+        return True
+
+    def _matches(self, node, handlers):
+        """Return True if any of the handlers applies to `node'."""
+        for entry in handlers(node.tag):
+            test = entry[3]
+            if test is None or test(node):
+                return True
+        return False
+
+    def _select_handlers(self, handlers, static):
+        """Return a handler lookup function that returns the static or
+        dynamic subset of the handlers returned by `handlers'."""
+        cache = {}
+        def select(tag):
+            try:
+                return cache[tag]
+            except KeyError:
+                pass
+            entries = [ e for e in handlers(tag) if e[4] == static ]
+            cache[tag] = entries
+            return entries
+        return select
+
+    def _filter_tree(self, tree, mode=None):
+        """Filter an XML tree `tree'.
+
+        The tree is filtered in a single pass in document order. For
+        each element, the matching handlers of all tag libraries are
+        run in order of priority. Content that is inserted by a handler
+        is visited as well. Complex selectors are evaluated on the tree
+        before the pass starts and therefore do not match inserted
+        content.
+
+        The `mode' argument specifies which handlers are run. In
+        REWRITE_STATIC mode only static handlers are run. In
+        REWRITE_DYNAMIC mode the tree is assumed to have been rewritten
+        in REWRITE_STATIC mode already, and only dynamic handlers are
+        run, except on content inserted by handlers. REWRITE_COMPILED
+        mode is like REWRITE_DYNAMIC mode, but only the elements marked
+        by compile() are assumed to have been rewritten.
+
+        The return value is True if dynamic handlers were skipped that
+        apply to the tree, which can only be the case in REWRITE_STATIC
+        mode.
+        """
+        handlers = self._handler_lookup(tree)
+        if mode == self.REWRITE_DYNAMIC:
+            rewritten = set(tree.getroot().iter())
+        elif mode == self.REWRITE_COMPILED:
+            rewritten = set()
+            for node in tree.getroot().iter():
+                if isinstance(node.tag, basestring) and \
+                            node.get(self.c_marker) is not None:
+                    del node.attrib[self.c_marker]
+                    rewritten.update(node.iter())
+        else:
+            rewritten = ()
+        return self._rewrite(tree.getroot(), handlers, mode, rewritten)
+
+    def _rewrite(self, node, handlers, mode=None, rewritten=(), top=None,
+                 stop=None):
+        """Apply handlers to the tree starting at `node', and complete
+        the work that tag libraries have deferred.
+
+        After the walk, each tag library's _finish() method is called.
+        The content of the elements it returns is rewritten again. See
+        _walk() for the arguments and the return value.
+        """
+        skipped = self._walk(node, handlers, mode, rewritten, top, stop)
+        while True:
+            nodes = []
+            for taglib in self.tag_libraries():
+                nodes += taglib._finish()
+            if not nodes:
+                break
+            for node in nodes:
+                if len(node):
+                    skipped = self._walk(node[0], handlers, mode, rewritten,
+                                         top=node) or skipped
+        return skipped
+
+    def _walk(self, node, handlers, mode=None, rewritten=(), top=None,
+              stop=None):
+        """Apply handlers to the tree starting at `node'.
+
+        The walk ends when it reaches `stop' or when it would leave the
+        element `top'. See _filter_tree() for the other arguments and
+        the return value.
+        """
+        if mode is None:
+            mode = self.REWRITE_ALL
+        static = self._select_handlers(handlers, True)
+        dynamic = self._select_handlers(handlers, False)
+        if mode == self.REWRITE_STATIC:
+            run = static
+        else:
+            run = handlers
+        skipped = False
+        while node is not None and node is not stop:
+            if not isinstance(node.tag, basestring):
+                node = self._following(node, top)
+                continue
+            parent = node.getparent()
+            previous = node.getprevious()
+            if node in rewritten:
+                applied = self._apply_handlers(node, dynamic)
+            else:
+                applied = self._apply_handlers(node, run)
+            if applied:
+                if mode == self.REWRITE_STATIC and not skipped:
+                    skipped = self._matches(node, dynamic)
+                if len(node):
+                    next = node[0]
+                else:
+                    next = self._following(node, top)
+            elif previous is not None:
+                next = previous.getnext()
+                if next is None:
+                    next = self._following(previous, top)
+            elif parent is not None and len(parent):
+                next = parent[0]
+            else:
+                next = self._following(parent, top)
+            node = next
+        return skipped
+
+    def _parse(self, buffer):
+        """Parse `buffer' into an XML tree."""
         try:
             tree = lxml.etree.XML(buffer).getroottree()
         except lxml.etree.Error, err:
             raise RewriteError, str(err)
-        self._filter_tree(tree)
-        output = tree.docinfo.doctype
-        output += lxml.etree.tostring(tree, xml_declaration=False)
+        return tree
+
+    def _serialize(self, tree):
+        """Serialize the XML tree `tree'."""
+        output = lxml.etree.tostring(tree, xml_declaration=False)
+        # Older versions of lxml do not write out the document type.
+        doctype = tree.docinfo.doctype
+        if doctype and not output.startswith(doctype):
+            output = doctype + output
+        return output
+
+    def filter(self, buffer, mode=None):
+        """Rewrite `buffer'.
+
+        The `mode' argument specifies which handlers to run, see
+        _filter_tree().
+        """
+        tree = self._parse(buffer)
+        self._filter_tree(tree, mode)
+        return self._serialize(tree)
+
+    def filter_static(self, buffer):
+        """Run the static handlers on `buffer'.
+
+        The return value is a tuple (output, dynamic) where `dynamic'
+        indicates whether dynamic handlers apply to the output. If so,
+        the output needs to be rewritten in REWRITE_DYNAMIC mode before
+        it can be sent to the client.
+        """
+        tree = self._parse(buffer)
+        dynamic = self._filter_tree(tree, self.REWRITE_STATIC)
+        return self._serialize(tree), dynamic
+
+    def _taint(self, node, tainted):
+        """Add `node' and its ancestors to the set `tainted'."""
+        while node is not None and node not in tainted:
+            tainted.add(node)
+            node = node.getparent()
+
+    def compile(self, literals):
+        """Run the static handlers on the literal markup of a template.
+
+        The `literals' argument is the literal markup before, between
+        and after the output of code, as returned by the segments()
+        method of the Draco parser. The output of code is replaced by
+        placeholders, and static handlers are run on the elements that
+        do not contain a placeholder. These elements are marked as
+        rewritten. The return value is the rewritten markup, which must
+        be passed to filter_compiled(). None is returned if the markup
+        cannot be parsed.
+        """
+        for literal in literals:
+            if self.c_reserved in literal:
+                return
+        # Output of code before the first markup, for example before the
+        # document type, is kept in front of the document.
+        prefix = []
+        i = 0
+        while i < len(literals) - 1 and not literals[i].strip():
+            prefix.append('{draco-code:%d}' % i)
+            i += 1
+        parts = [literals[i]]
+        intag = False
+        for i in range(i+1, len(literals)):
+            # Placeholders within a tag can only be attribute values.
+            p1 = parts[-1].rfind('<')
+            p2 = parts[-1].rfind('>')
+            if p1 != -1 or p2 != -1:
+                intag = p1 > p2
+            if intag:
+                parts.append('{draco-code:%d}' % (i-1))
+            else:
+                parts.append('<?draco-code %d?>' % (i-1))
+            parts.append(literals[i])
+        try:
+            tree = self._parse(''.join(parts))
+        except RewriteError:
+            return
+        root = tree.getroot()
+        tainted = set()
+        for node in root.iter():
+            if isinstance(node.tag, basestring):
+                text = [ node.text ] + node.attrib.values()
+                if [ t for t in text if t and self.c_reserved in t ]:
+                    self._taint(node, tainted)
+            elif node.text and self.c_reserved in node.text or \
+                        getattr(node, 'target', None) == self.c_reserved:
+                self._taint(node.getparent(), tainted)
+            if node.tail and self.c_reserved in node.tail:
+                self._taint(node.getparent(), tainted)
+        # Rewrite the largest subtrees that do not contain placeholders.
+        nodes = []
+        for node in root.iter():
+            if not isinstance(node.tag, basestring) or node in tainted:
+                continue
+            parent = node.getparent()
+            if parent is None or parent in tainted:
+                nodes.append(node)
+        handlers = self._handler_lookup(tree)
+        for node in nodes:
+            parent = node.getparent()
+            if parent is None:
+                self._rewrite(node, handlers, self.REWRITE_STATIC)
+                node.set(self.c_marker, 'static')
+                continue
+            previous = node.getprevious()
+            after = node.getnext()
+            self._rewrite(node, handlers, self.REWRITE_STATIC, top=parent,
+                          stop=after)
+            if previous is not None:
+                current = previous.getnext()
+            else:
+                current = parent[0]
+            while current is not None and current is not after:
+                if isinstance(current.tag, basestring):
+                    current.set(self.c_marker, 'static')
+                current = current.getnext()
+        return ''.join(prefix) + self._serialize(tree)
+
+    def filter_compiled(self, markup, outputs):
+        """Rewrite a template that was compiled with compile().
+
+        The placeholders in `markup' are replaced with the output of code
+        in `outputs'. Dynamic handlers are run on the whole document, and
+        static handlers on the elements that were not rewritten by
+        compile(). The return value is None if the result cannot be
+        parsed. In that case the output of the parser must be rewritten
+        with filter().
+        """
+        seen = set()
+        def substitute(mobj):
+            if mobj.group(1):
+                index = int(mobj.group(1))
+                seen.add(index)
+                return outputs[index]
+            # Attribute values are always serialized with double quotes.
+            index = int(mobj.group(2))
+            seen.add(index)
+            return outputs[index].replace('"', '&quot;')
+        try:
+            buffer = self.re_placeholder.sub(substitute, markup)
+        except IndexError:
+            return
+        if len(seen) != len(outputs):
+            return
+        try:
+            tree = self._parse(buffer)
+        except RewriteError:
+            return
+        self._filter_tree(tree, self.REWRITE_COMPILED)
+        return self._serialize(tree)
+
+
+class StreamRewriter(IncrementalFilter):
+    """Event driven rewriter.
+
+    The document is parsed incrementally with a pull parser, and the
+    rewritten output is returned as soon as it is available. Local
+    handlers are run as soon as the start tag of an element has been
+    parsed. Elements to which other handlers apply are collected as a
+    whole, after which they are rewritten as a tree. Content that has
+    been written out is removed from memory.
+
+    Predicates of selectors are evaluated when the start tag has been
+    parsed, and can therefore only depend on the element's attributes
+    and ancestors.
+
+    The output is the same as that of the buffered rewriter. Documents
+    with an XHTML 1.0 document type are serialized by libxml2 in a
+    special XHTML compatibility mode. Such documents are not streamed
+    but are collected and rewritten by the buffered rewriter instead.
+    """
+
+    # Other filters expect rewritten output.
+    priority = 0
+
+    xml_namespace = 'http://www.w3.org/XML/1998/namespace'
+
+    # Document type identifiers for which libxml2 uses XHTML mode.
+    xhtml_identifiers = ('-//W3C//DTD XHTML 1.0 Strict//EN',
+        '-//W3C//DTD XHTML 1.0 Transitional//EN',
+        '-//W3C//DTD XHTML 1.0 Frameset//EN',
+        'http://www.w3.org/TR/xhtml1/DTD/xhtml1-strict.dtd',
+        'http://www.w3.org/TR/xhtml1/DTD/xhtml1-transitional.dtd',
+        'http://www.w3.org/TR/xhtml1/DTD/xhtml1-frameset.dtd')
+
+    def __init__(self, rewriter, encoding=None):
+        """Constructor."""
+        if encoding is None:
+            encoding = 'utf-8'
+        self.m_rewriter = rewriter
+        self.m_handlers = rewriter._handler_lookup()
+        events = ('start', 'end', 'comment', 'pi')
+        self.m_parser = lxml.etree.XMLPullParser(events=events,
+                                                 encoding=encoding)
+        self.m_output = []
+        self.m_input = []
+        self.m_buffered = False
+        self.m_started = False
+        self.m_prolog = []
+        self.m_open = None
+        self.m_empty = None
+        self.m_text = None
+        self.m_capture = None
+        self.m_captured = None
+
+    def feed(self, chunk):
+        # The input is kept until it is known whether the document can
+        # be streamed.
+        if self.m_input is not None:
+            self.m_input.append(chunk)
+        if self.m_buffered:
+            return ''
+        try:
+            self.m_parser.feed(chunk)
+        except lxml.etree.Error, err:
+            raise RewriteError, str(err)
+        return self._process()
+
+    def close(self):
+        if self.m_buffered:
+            return self.m_rewriter.filter(''.join(self.m_input))
+        try:
+            self.m_parser.close()
+        except lxml.etree.Error, err:
+            raise RewriteError, str(err)
+        self._process()
+        self._flush_pending()
+        return self._output()
+
+    def _process(self):
+        """Process all available parse events."""
+        for event,node in self.m_parser.read_events():
+            self._event(event, node)
+            if self.m_buffered:
+                break
+        return self._output()
+
+    def _output(self):
+        """Return the output produced so far."""
+        output = ''.join(self.m_output)
+        del self.m_output[:]
+        if isinstance(output, unicode):
+            output = output.encode('ascii', 'xmlcharrefreplace')
         return output
+
+    def _emit(self, data):
+        """Emit output."""
+        self.m_output.append(data)
+
+    def _start(self, node):
+        """Start the output of the document with root element `node'.
+
+        Returns False if the document cannot be streamed.
+        """
+        docinfo = node.getroottree().docinfo
+        if docinfo.public_id in self.xhtml_identifiers or \
+                    docinfo.system_url in self.xhtml_identifiers:
+            self.m_buffered = True
+            self.m_prolog = []
+            return False
+        if docinfo.doctype:
+            self._emit(docinfo.doctype + '\n')
+        self.m_output += self.m_prolog
+        self.m_prolog = []
+        self.m_input = None
+        self.m_started = True
+        return True
+
+    def _event(self, event, node):
+        """Process a single parse event."""
+        if self.m_capture is not None:
+            if event == 'end' and node is self.m_capture:
+                self.m_capture = None
+                self.m_captured = node
+            return
+        self._flush_pending(event, node)
+        if not self.m_started:
+            # Comments and processing instructions before the root
+            # element are written after the document type.
+            if event != 'start':
+                self.m_prolog.append(self._serialize_node(node, False))
+                return
+            if not self._start(node):
+                return
+        if event == 'start':
+            if self._islocal(node):
+                self.m_rewriter._apply_handlers(node, self.m_handlers)
+                self.m_open = node
+                self.m_text = (node, 'text')
+            else:
+                self.m_capture = node
+        elif event == 'end':
+            if node is self.m_empty:
+                self.m_empty = None
+            else:
+                self._emit('</%s>' % self._element_name(node))
+            self.m_text = (node, 'tail')
+            self._release(node)
+        else:
+            self._emit(self._serialize_node(node, False))
+            self.m_text = (node, 'tail')
+
+    def _islocal(self, node):
+        """Return True if only local handlers apply to `node'."""
+        for entry in self.m_handlers(node.tag):
+            test = entry[3]
+            if not entry[5] and (test is None or test(node)):
+                return False
+        return True
+
+    def _flush_pending(self, event=None, node=None):
+        """Write out pending output.
+
+        Start tags are written out when the next event arrives, so that
+        empty elements can be detected. Text is written out when the next
+        event arrives because that is when the parser has completed it.
+        """
+        if self.m_captured is not None:
+            self._flush_captured()
+        if self.m_open is not None:
+            open = self.m_open
+            self.m_open = None
+            empty = event == 'end' and node is open and not open.text
+            self._emit(self._start_tag(open, empty))
+            if empty:
+                self.m_empty = open
+        if self.m_text is not None:
+            node, attr = self.m_text
+            self.m_text = None
+            text = getattr(node, attr)
+            if text:
+                self._emit(self._escape(text))
+
+    def _flush_captured(self):
+        """Rewrite and write out a collected element."""
+        node = self.m_captured
+        self.m_captured = None
+        parent = node.getparent()
+        previous = node.getprevious()
+        after = node.getnext()
+        tail = node.tail
+        node.tail = None
+        self.m_rewriter._rewrite(node, self.m_handlers, top=parent,
+                                 stop=after)
+        if previous is not None:
+            current = previous.getnext()
+        elif parent is not None and len(parent):
+            current = parent[0]
+        elif parent is None:
+            current = node
+        else:
+            current = None
+        while current is not None and current is not after:
+            self._emit(self._serialize_node(current, True))
+            current = current.getnext()
+        if tail:
+            self._emit(self._escape(tail))
+        if parent is not None:
+            if after is None:
+                del parent[:]
+            else:
+                while after.getprevious() is not None:
+                    del parent[0]
+
+    def _release(self, node):
+        """Release the memory held by the content of `node' and its
+        preceding siblings, which have been written out."""
+        del node[:]
+        parent = node.getparent()
+        if parent is not None:
+            while node.getprevious() is not None:
+                del parent[0]
+
+    def _escape(self, text):
+        """Escape character data."""
+        text = text.replace('&', '&amp;')
+        text = text.replace('<', '&lt;')
+        text = text.replace('>', '&gt;')
+        text = text.replace('\r', '&#13;')
+        return text
+
+    def _escape_attribute(self, value):
+        """Escape an attribute value."""
+        value = self._escape(value)
+        value = value.replace('"', '&quot;')
+        value = value.replace('\n', '&#10;')
+        value = value.replace('\t', '&#9;')
+        return value
+
+    def _element_name(self, node):
+        """Return the qualified name of the element `node'."""
+        name = node.tag
+        if name.startswith('{'):
+            name = name[name.rfind('}')+1:]
+        if node.prefix:
+            name = '%s:%s' % (node.prefix, name)
+        return name
+
+    def _attribute_name(self, node, name, declarations):
+        """Return the qualified name of attribute `name' of `node'.
+
+        If the attribute's namespace is not declared, a declaration is
+        added to `declarations'.
+        """
+        if not name.startswith('{'):
+            return name
+        p = name.rfind('}')
+        uri = name[1:p]
+        local = name[p+1:]
+        if uri == self.xml_namespace:
+            return 'xml:' + local
+        nsmap = node.nsmap.copy()
+        nsmap.update(declarations)
+        for prefix,value in nsmap.items():
+            if value == uri and prefix is not None:
+                return '%s:%s' % (prefix, local)
+        prefix = 'ns%d' % len(declarations)
+        declarations[prefix] = uri
+        return '%s:%s' % (prefix, local)
+
+    def _start_tag(self, node, empty=False):
+        """Return the start tag for `node'."""
+        parent = node.getparent()
+        if parent is not None:
+            inherited = parent.nsmap
+        else:
+            inherited = {}
+        declarations = {}
+        for prefix,uri in node.nsmap.items():
+            if inherited.get(prefix) != uri:
+                declarations[prefix] = uri
+        attributes = []
+        for name,value in node.attrib.items():
+            name = self._attribute_name(node, name, declarations)
+            attributes.append(' %s="%s"' % (name,
+                                            self._escape_attribute(value)))
+        parts = [ '<', self._element_name(node) ]
+        for prefix,uri in sorted(declarations.items()):
+            if prefix is None:
+                parts.append(' xmlns="%s"' % self._escape_attribute(uri))
+            else:
+                parts.append(' xmlns:%s="%s"'
+                             % (prefix, self._escape_attribute(uri)))
+        parts += attributes
+        if empty:
+            parts.append('/>')
+        else:
+            parts.append('>')
+        return ''.join(parts)
+
+    def _serialize_node(self, node, with_tail):
+        """Serialize the tree rooted at `node'."""
+        parts = []
+        if not isinstance(node.tag, basestring):
+            # Comments, processing instructions and entities.
+            parts.append(lxml.etree.tostring(node, with_tail=False))
+        else:
+            empty = not node.text and not len(node)
+            parts.append(self._start_tag(node, empty))
+            if node.text:
+                parts.append(self._escape(node.text))
+            for child in node:
+                parts.append(self._serialize_node(child, True))
+            if not empty:
+                parts.append('</%s>' % self._element_name(node))
+        if with_tail and node.tail:
+            parts.append(self._escape(node.tail))
+        return ''.join(parts)
@@ -13,6 +13,27 @@
 
 from draco2.session.util import issessionid, parse_sessionid
 from draco2.session.session import Session, DummySession
+from draco2.session.store import create_session_store
+
+
+def get_sessionid(request):
+    """Return the session id and subsession presented in `request'.
+
+    The session id is retrieved from the request URL, or from the
+    HTTP cookie if the URL does not contain it.
+    """
+    sessionid = request.session()
+    if sessionid and issessionid(sessionid):
+        basesession, subsession = parse_sessionid(sessionid)
+    else:
+        basesession, subsession = None, None
+    if basesession is None:
+        cookie = request.cookie('draco-session')
+        if cookie and issessionid(cookie.value):
+            basesession, dummy = parse_sessionid(cookie.value)
+    if subsession is None:
+        subsession = 0
+    return (basesession, subsession)
 
 
 class DracoSession(Session):
@@ -24,18 +45,7 @@ class DracoSession(Session):
 
     def _get_sessionid(self):
         """Return session id and subsession."""
-        sessionid = self.m_request.session()
-        if sessionid and issessionid(sessionid):
-            basesession, subsession = parse_sessionid(sessionid)
-        else:
-            basesession, subsession = None, None
-        if basesession is None:
-            cookie = self.m_request.cookie('draco-session')
-            if cookie and issessionid(cookie.value):
-                basesession, dummy = parse_sessionid(cookie.value)
-        if subsession is None:
-            subsession = 0
-        return (basesession, subsession)
+        return get_sessionid(self.m_request)
 
     @classmethod
     def _create(cls, api):
@@ -43,13 +53,25 @@ class DracoSession(Session):
         if api.request.isrobot():
             session = DummySession._create(api)
             return session
-        transaction = api.models.model('draco').transaction('shared')
-        session = cls(api.request, api.response, transaction,
+        store = create_session_store(api)
+        session = cls(api.request, api.response, store,
                       api.security, api.events)
         config = api.config.ns('draco2.draco.session')
         if config.has_key('timeout'):
             session.set_timeout(config['timeout'])
+        if config.has_key('touchfraction'):
+            session.set_touch_fraction(config['touchfraction'])
+        if config.has_key('optimistic'):
+            session.set_optimistic(config['optimistic'])
+        if config.has_key('compressthreshold'):
+            session.set_compress_threshold(config['compressthreshold'])
+        if config.has_key('maxnamespacesize'):
+            session.set_max_namespace_size(config['maxnamespacesize'])
         sessionid = session._get_sessionid()
-        if not sessionid[0] or not session.load(sessionid):
-            session.new()
+        try:
+            if not sessionid[0] or not session.load(sessionid):
+                session.new()
+        except:
+            session._finalize()
+            raise
         return session
@@ -11,7 +11,10 @@
 #
 # $Revision: 1187 $
 
+import os
+import os.path
 import re
+import copy
 import lxml.etree 
 
 import draco2
@@ -19,18 +22,35 @@ from draco2.core.exception import DracoInterfaceError
 from draco2.draco.exception import RewriteError
 from draco2.draco.image import ImageInfo
 from draco2.draco.parser import DracoParser
+from draco2.file.asset import AssetManifest
 from draco2.util.singleton import singleton
+from draco2.util.cache import LruCache
 
 
 class element(object):
-    """Decorator to indentify XML elements in tag libraries."""
+    """Decorator to indentify XML elements in tag libraries.
 
-    def __init__(self, xpath):
+    A handler that is `static' depends only on the document that is
+    rewritten and on the locale, and not on other properties of the
+    current request. Static handlers can be run once on a template for
+    each locale, after which the result is cached.
+
+    A handler that is `local' only looks at the element, its attributes
+    and its ancestors, and only changes the element's attributes. Local
+    handlers can be run by the streaming rewriter as soon as the start
+    tag of the element has been parsed.
+    """
+
+    def __init__(self, xpath, static=False, local=False):
         self.m_xpath = xpath
+        self.m_static = static
+        self.m_local = local
 
     def __call__(self, func):
         func.element = True
         func.xpath = self.m_xpath
+        func.static = self.m_static
+        func.local = self.m_local
         return func
 
 
@@ -46,9 +66,20 @@ class TagLibrary(object):
         taglib = cls()
         return taglib
 
-    def _elements(self):
-        for name in dir(self):
-            attr = getattr(self, name)
+    @classmethod
+    def _element_names(cls):
+        """Return a list of (xpath, name) tuples describing the element
+        handlers of this class.
+
+        The list is computed only once for each class.
+        """
+        try:
+            return cls.__dict__['_element_table']
+        except KeyError:
+            pass
+        table = []
+        for name in dir(cls):
+            attr = getattr(cls, name)
             if name.startswith('_') or not callable(attr):
                 continue
             # a .element property is not required
@@ -56,7 +87,26 @@ class TagLibrary(object):
                 xpath = attr.xpath
             else:
                 xpath = '//' + name
-            yield (xpath, attr)
+            table.append((xpath, name))
+        cls._element_table = table
+        return table
+
+    def _elements(self):
+        for xpath,name in self._element_names():
+            yield (xpath, getattr(self, name))
+
+    def _files(self):
+        """Return the files that the output of static handlers depends
+        on, as a list of (filename, mtime) tuples."""
+        return []
+
+    def _finish(self):
+        """Complete deferred work at the end of a rewrite pass.
+
+        The return value is a list of elements whose content has been
+        replaced. The rewriter rewrites their content again.
+        """
+        return []
 
     def _parse_template(self, template, **kwargs):
         """Parse a template and return a XML fragment."""
@@ -120,17 +170,19 @@ class DracoTagLibrary(TagLibrary):
     """Draco tag library.
 
     This tag library contains the tags that make automated session
-    management and image size detection work.
+    management, image size detection and asset fingerprinting work.
     """
 
     namespaces = { 'draco': 'http://www.digitalfugue.com/NS/draco',
                    'xhtml': 'http://www.w3.org/1999/xhtml' }
 
-    def __init__(self, images=None):
+    def __init__(self, images=None, assets=None):
         super(DracoTagLibrary, self).__init__()
+        self.m_files = []
         self._set_rewrite_links(True)
         self._set_rewrite_images(True)
         self._set_image_info(images)
+        self._set_asset_manifest(assets)
 
     @classmethod
     def _create(cls, api):
@@ -145,6 +197,8 @@ class DracoTagLibrary(TagLibrary):
             taglib._set_rewrite_images(config['rewriteimages'])
         images = singleton(ImageInfo, api, factory=ImageInfo._create)
         taglib._set_image_info(images)
+        assets = singleton(AssetManifest, api, factory=AssetManifest._create)
+        taglib._set_asset_manifest(assets)
         return taglib
 
     def _set_extension(self, extension):
@@ -162,6 +216,14 @@ class DracoTagLibrary(TagLibrary):
             raise TypeError, 'Expecting ImageInfo instance or None.'
         self.m_images = images
 
+    def _set_asset_manifest(self, assets):
+        """Set the asset manifest to use."""
+        if assets is not None and not isinstance(assets, AssetManifest):
+            raise TypeError, 'Expecting AssetManifest instance or None.'
+        if assets is not None and not assets.enabled():
+            assets = None
+        self.m_assets = assets
+
     def _rewrite_link(self, node, name):
         """Rewrite link attribute `name'."""
         if not self.m_rewrite_links:
@@ -177,6 +239,24 @@ class DracoTagLibrary(TagLibrary):
         value = draco2.api.response.rewrite_uri(value)
         node.attrib[name] = value
 
+    def _fingerprint_link(self, node, name):
+        """Replace an asset in link attribute `name' with its
+        fingerprinted URI."""
+        if not self.m_assets:
+            return
+        try:
+            value = node.attrib[name]
+        except KeyError:
+            return
+        if ':' in value or value.startswith('//') or '?' in value \
+                    or '#' in value:
+            return
+        if not value.startswith('/'):
+            value = '/%s/%s' % (draco2.api.request.directory(), value)
+        uri = self.m_assets.lookup(value)
+        if uri:
+            node.attrib[name] = uri
+
     def _rewrite_image(self, node):
         """Detect `width' and `height' attributes."""
         if not self.m_rewrite_images or not self.m_images:
@@ -189,58 +269,95 @@ class DracoTagLibrary(TagLibrary):
             node.attrib['width'] = str(info[1])
             node.attrib['height'] = str(info[2])
 
-    @element('//xhtml:head')
+    def _page_asset(self, reluri):
+        """Return the URI for the page asset `reluri', or None if it
+        does not exist."""
+        if self.m_assets:
+            return self.m_assets.lookup(reluri)
+        # The result changes when the asset is created or removed, which
+        # changes the modification time of its directory.
+        dirname = os.path.dirname(draco2.api.request.docroot() + reluri)
+        self._add_file(dirname)
+        opener = draco2.api.opener
+        if opener.access(reluri):
+            return reluri
+
+    def _add_file(self, fname):
+        """Record that static output depends on `fname'."""
+        for entry in self.m_files:
+            if entry[0] == fname:
+                return
+        try:
+            st = os.stat(fname)
+        except OSError:
+            return
+        self.m_files.append((fname, st.st_mtime))
+
+    def _files(self):
+        return self.m_files
+
+    @element('//xhtml:head', static=True)
     def head(self, node):
         request = draco2.api.request
-        opener = draco2.api.opener
         reluri = '/%s/%s.css' % (request.directory(), request.basename())
-        if opener.access(reluri):
+        reluri = self._page_asset(reluri)
+        if reluri:
             frag = '<link rel="stylesheet" type="text/css" href="%s" />\n' % reluri
             frag = self._parse_fragment(frag)
             node.append(frag[0])
         reluri = '/%s/%s.js' % (request.directory(), request.basename())
-        if opener.access(reluri):
+        reluri = self._page_asset(reluri)
+        if reluri:
             frag = '<script type="text/javascript" src="%s" />\n' % reluri
             frag = self._parse_fragment(frag)
             node.append(frag[0])
 
-    @element('//xhtml:a')
+    @element('//xhtml:a', local=True)
     def a(self, node):
         self._rewrite_link(node, 'href')
 
-    @element('//xhtml:form')
+    @element('//xhtml:form', local=True)
     def form(self, node):
         self._rewrite_link(node, 'action')
 
-    @element('//xhtml:area')
+    @element('//xhtml:area', local=True)
     def area(self, node):
         self._rewrite_link(node, 'href')
 
-    @element('//xhtml:link')
+    @element('//xhtml:link', local=True)
     def link(self, node):
+        self._fingerprint_link(node, 'href')
         self._rewrite_link(node, 'href')
 
-    @element('//xhtml:frame')
+    @element('//xhtml:frame', local=True)
     def frame(self, node):
         self._rewrite_link(node, 'src')
 
-    @element('//xhtml:iframe')
+    @element('//xhtml:iframe', local=True)
     def iframe(self, node):
         self._rewrite_link(node, 'src')
 
-    @element('//xhtml:script')
+    @element('//xhtml:script', local=True)
     def script(self, node):
+        self._fingerprint_link(node, 'src')
         self._rewrite_link(node, 'src')
 
-    @element('//xhtml:img')
-    def img(self, node):
+    @element('//xhtml:img', static=True, local=True)
+    def image_size(self, node):
         self._rewrite_image(node)
+
+    @element('//xhtml:img', local=True)
+    def img(self, node):
         self._rewrite_link(node, 'src')
 
 
 class TranslationTagLibrary(TagLibrary):
     """Tag library that automatically translates strings in
     an XML document.
+
+    The handlers of this tag library are static: templates without code
+    are translated once for each locale, and only text that is generated
+    dynamically is translated at run time.
     """
 
     TRANSLATE = 0
@@ -249,6 +366,7 @@ class TranslationTagLibrary(TagLibrary):
     priority = 40
     namespaces = { 'xhtml': 'http://www.w3.org/1999/xhtml' }
     re_message = re.compile('.*[a-z]', re.I|re.S)
+    c_fragments = LruCache(1000)
 
     def __init__(self, mode=None):
         """Constructor."""
@@ -256,6 +374,7 @@ class TranslationTagLibrary(TagLibrary):
             mode = self.TRANSLATE
         self.m_mode = mode
         self.m_messages = []
+        self.m_pending = []
 
     def messages(self):
         """Return the recorded messages."""
@@ -275,7 +394,11 @@ class TranslationTagLibrary(TagLibrary):
         return message.strip()
 
     def _translate_node(self, node):
-        """Translate a node."""
+        """Translate a node.
+
+        Translation is deferred until the end of the rewrite pass, so
+        that all messages in a document can be looked up at once.
+        """
         message = self._node_text(node)
         message = self._normalize_message(message)
         if not message:
@@ -283,42 +406,71 @@ class TranslationTagLibrary(TagLibrary):
         context = node.attrib.get('context')
         name = node.attrib.get('name')
         if self.m_mode == self.TRANSLATE:
-            trans = draco2.api.locale.translate(message, context, name)
-            if trans != message:
-                frag = self._parse_fragment(trans)
-                self._substitute_descendants(node, frag)
+            # The same node can be matched by more than one handler.
+            if self.m_pending and self.m_pending[-1][0] is node:
+                return
+            self.m_pending.append((node, message, context, name))
         elif self.m_mode == self.COLLECT_MESSAGES:
             self.m_messages.append((message, context, name))
 
-    @element('//xhtml:title')
+    def _translated_fragment(self, translation):
+        """Return a parsed XML fragment for `translation'.
+
+        Parsed fragments are cached by their text, which does not go out
+        of date when the translations change.
+        """
+        frag = self.c_fragments.get(translation)
+        if frag is None:
+            frag = self._parse_fragment(translation)
+            self.c_fragments.add(translation, frag)
+        return copy.deepcopy(frag)
+
+    def _finish(self):
+        """Translate all pending nodes with a single lookup."""
+        pending = self.m_pending
+        if not pending:
+            return []
+        self.m_pending = []
+        messages = [ entry[1:] for entry in pending ]
+        translations = draco2.api.locale.translate_many(messages)
+        nodes = []
+        for entry,trans in zip(pending, translations):
+            node, message = entry[:2]
+            if trans != message:
+                frag = self._translated_fragment(trans)
+                self._substitute_descendants(node, frag)
+                nodes.append(node)
+        return nodes
+
+    @element('//xhtml:title', static=True)
     def title(self, node):
         self._translate_node(node)
 
-    @element('//xhtml:h1')
+    @element('//xhtml:h1', static=True)
     def h1(self, node):
         self._translate_node(node)
 
-    @element('//xhtml:h2')
+    @element('//xhtml:h2', static=True)
     def h2(self, node):
         self._translate_node(node)
 
-    @element('//xhtml:h3')
+    @element('//xhtml:h3', static=True)
     def h3(self, node):
         self._translate_node(node)
 
-    @element('//xhtml:h4')
+    @element('//xhtml:h4', static=True)
     def h4(self, node):
         self._translate_node(node)
 
-    @element('//xhtml:h5')
+    @element('//xhtml:h5', static=True)
     def h5(self, node):
         self._translate_node(node)
 
-    @element('//xhtml:h6')
+    @element('//xhtml:h6', static=True)
     def h6(self, node):
         self._translate_node(node)
 
-    @element('//xhtml:*[@translate]')
+    @element('//xhtml:*[@translate]', static=True)
     def translate(self, node):
         self._translate_node(node)
         del node.attrib['translate']
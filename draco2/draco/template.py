@@ -0,0 +1,158 @@
+# vi: ts=8 sts=4 sw=4 et
+#
+# template.py: statically rewritten template cache
+#
+# This file is part of Draco2. Draco2 is free software and is made available
+# under the MIT license. Consult the file "LICENSE" that is distributed
+# together with this file for the exact licensing terms.
+#
+# Draco2 is copyright (c) 1999-2007 by the Draco2 authors. See the file
+# "AUTHORS" for a complete overview.
+#
+# $Revision: $
+
+import os
+import time
+import logging
+
+from draco2.util.cache import LruCache
+
+
+class CompiledTemplate(object):
+    """A template in the template cache."""
+
+    def __init__(self, files, output, dynamic, cache_policy, expires,
+                 literals=None):
+        """Constructor."""
+        self.files = files
+        self.output = output
+        self.dynamic = dynamic
+        self.cache_policy = cache_policy
+        self.expires = expires
+        self.literals = literals
+
+
+class TemplateCache(object):
+    """Cache of statically rewritten templates.
+
+    Templates that do not contain code always produce the same output.
+    For such templates, the output after running the static tag library
+    handlers is stored in this cache, once for each locale, and includes
+    the translations of the template's text. For templates with code, the
+    same is done for the literal markup of the template, with the output
+    of the code left out. The cache is cleared when
+    the translations change. Entries are validated against the
+    modification times of the files that make up the template and of
+    the files that static handlers report to depend on. They are expired
+    after a timeout to pick up changes in other resources that static
+    handlers depend on, such as images.
+
+    This class is thread safe.
+    """
+
+    def __init__(self):
+        """Constructor."""
+        self.m_cache = LruCache(100)
+        self.set_timeout(60)
+
+    @classmethod
+    def _create(cls, api):
+        """Factory method."""
+        cache = cls()
+        cache._configure(api)
+        if hasattr(api, 'changes'):
+            cache._set_change_manager(api.changes)
+        return cache
+
+    def _configure(self, api):
+        """Configure the cache from the config file."""
+        config = api.config.ns('draco2.draco.template')
+        if config.has_key('cachesize'):
+            self._set_cache_size(config['cachesize'])
+        if config.has_key('timeout'):
+            self.set_timeout(config['timeout'])
+
+    def _set_change_manager(self, changes):
+        """Set the change manager to `changes'."""
+        ctx = changes.get_context('draco2.core.config')
+        ctx.add_callback(self._change_callback)
+        ctx = changes.get_context('draco2.core.loader')
+        ctx.add_callback(self._change_callback)
+        ctx = changes.get_context('draco2.draco.translator')
+        ctx.add_callback(self._translation_callback)
+        ctx = changes.get_context('draco2.file.asset')
+        ctx.add_callback(self._asset_callback)
+
+    def _change_callback(self, api):
+        """Reload config and clear the cache."""
+        self._configure(api)
+        self.m_cache.clear()
+        logger = logging.getLogger('draco2.draco.template')
+        logger.debug('Cleared template cache due to change.')
+
+    def _translation_callback(self, api):
+        """Clear the cache because the translations have changed."""
+        self.m_cache.clear()
+        logger = logging.getLogger('draco2.draco.template')
+        logger.debug('Cleared template cache due to translation change.')
+
+    def _asset_callback(self, api):
+        """Clear the cache because the asset manifest has changed."""
+        self.m_cache.clear()
+        logger = logging.getLogger('draco2.draco.template')
+        logger.debug('Cleared template cache due to asset change.')
+
+    def _set_cache_size(self, size):
+        """Set the cache size."""
+        self.m_cache.set_size(size)
+
+    def timeout(self):
+        """Return the time to live of a template, in seconds."""
+        return self.m_timeout
+
+    def set_timeout(self, timeout):
+        """Set the time to live of a template to `timeout' seconds."""
+        self.m_timeout = timeout
+
+    def get(self, key):
+        """Return the template stored under `key', or None if there is
+        no such template or if it is out of date."""
+        template = self.m_cache.get(key)
+        if template is None:
+            return
+        if template.expires <= time.time():
+            self.m_cache.remove(key)
+            return
+        for fname,mtime in template.files:
+            try:
+                st = os.stat(fname)
+            except OSError:
+                st = None
+            if st is None or st.st_mtime != mtime:
+                self.m_cache.remove(key)
+                return
+        return template
+
+    def add(self, key, files, output, dynamic, cache_policy=None,
+            literals=None):
+        """Store a template under `key'.
+
+        The `files' argument is a list of (filename, mtime) tuples of the
+        files that make up the template, `output' is the statically
+        rewritten output, and `dynamic' indicates whether the output still
+        needs to be rewritten by dynamic handlers.
+
+        For templates that contain code, `literals' is the list of literal
+        markup segments of the template, and `output' is the statically
+        rewritten literal markup as returned by DracoRewriter.compile(),
+        or None if it could not be compiled.
+        """
+        expires = time.time() + self.m_timeout
+        template = CompiledTemplate(files, output, dynamic, cache_policy,
+                                    expires, literals)
+        self.m_cache.add(key, template)
+        return template
+
+    def clear(self):
+        """Remove all templates from the cache."""
+        self.m_cache.clear()
@@ -0,0 +1,39 @@
+# vi: ts=8 sts=4 sw=4 et
+#
+# test_agent.py: test suite for draco2.draco.agent
+#
+# This file is part of Draco2. Draco2 is free software and is made available
+# under the MIT license. Consult the file "LICENSE" that is distributed
+# together with this file for the exact licensing terms.
+#
+# Draco2 is copyright (c) 1999-2007 by the Draco2 authors. See the file
+# "AUTHORS" for a complete overview.
+#
+# $Revision: $
+
+from draco2.draco.agent import AgentClassifier
+from draco2.draco.robot import RobotSignatures
+
+
+class TestAgentClassifier(object):
+
+    def test_classify(self):
+        robots = RobotSignatures()
+        robots.m_robots = ['googlebot']
+        classifier = AgentClassifier(robots)
+        info, isrobot, iscompat = classifier.classify('Googlebot/2.1')
+        assert info[0] == 'Googlebot'
+        assert isrobot and iscompat
+        info, isrobot, iscompat = classifier.classify('Mozilla/5.0')
+        assert not isrobot and not iscompat
+        assert classifier.classify('') == (None, False, False)
+
+    def test_cache(self):
+        robots = RobotSignatures()
+        classifier = AgentClassifier(robots)
+        result = classifier.classify('Googlebot/2.1')
+        assert not result[1]
+        assert classifier.classify('Googlebot/2.1') is result
+        robots.m_robots = ['googlebot']
+        classifier._robot_callback(None)
+        assert classifier.classify('Googlebot/2.1')[1]
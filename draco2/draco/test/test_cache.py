@@ -0,0 +1,65 @@
+# vi: ts=8 sts=4 sw=4 et
+#
+# test_cache.py: unit tests for draco2.draco.cache
+#
+# This file is part of Draco2. Draco2 is free software and is made available
+# under the MIT license. Consult the file "LICENSE" that is distributed
+# together with this file for the exact licensing terms.
+#
+# Draco2 is copyright (c) 1999-2007 by the Draco2 authors. See the file
+# "AUTHORS" for a complete overview.
+#
+# $Revision: $
+
+import time
+
+from draco2.draco.cache import PageCache
+from draco2.util.http import CachePolicy
+
+
+class TestPageCache(object):
+
+    def test_add_get(self):
+        cache = PageCache()
+        key = ('/index.dsp', 'en')
+        assert cache.get(key) is None
+        cache.add(key, 200, { 'content-type': ['text/html'] }, 'body')
+        page = cache.get(key)
+        assert page.status == 200
+        assert page.headers['content-type'] == ['text/html']
+        assert page.body == 'body'
+        assert cache.get(('/index.dsp', 'nl')) is None
+
+    def test_policy(self):
+        cache = PageCache()
+        key = ('/index.dsp',)
+        policy = CachePolicy(max_age=60)
+        cache.add(key, 200, {}, 'body', policy=policy)
+        page = cache.get(key)
+        assert page.policy is policy
+        assert page.age() == 0
+        page.created = time.time() - 10
+        assert page.age() == 10
+        assert page.policy.aged(page.age()).max_age == 50
+
+    def test_expire(self):
+        cache = PageCache()
+        key = ('/index.dsp',)
+        cache.add(key, 200, {}, 'body', timeout=0)
+        assert cache.get(key) is None
+
+    def test_purge(self):
+        cache = PageCache()
+        cache.add(('/news/index.dsp',), 200, {}, 'news')
+        cache.add(('/news/item.dsp?id=1',), 200, {}, 'item')
+        cache.add(('/index.dsp',), 200, {}, 'index')
+        assert cache.purge('/news/') == 2
+        assert cache.get(('/news/index.dsp',)) is None
+        assert cache.get(('/index.dsp',)).body == 'index'
+        cache.purge()
+        assert cache.get(('/index.dsp',)) is None
+
+    def test_vary(self):
+        cache = PageCache()
+        cache.set_vary(['Accept-Language'])
+        assert cache.vary() == ['accept-language']
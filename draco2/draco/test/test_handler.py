@@ -0,0 +1,189 @@
+# vi: ts=8 sts=4 sw=4 et
+#
+# test_handler.py: unit tests for draco2.draco.handler
+#
+# This file is part of Draco2. Draco2 is free software and is made available
+# under the MIT license. Consult the file "LICENSE" that is distributed
+# together with this file for the exact licensing terms.
+#
+# Draco2 is copyright (c) 1999-2007 by the Draco2 authors. See the file
+# "AUTHORS" for a complete overview.
+#
+# $Revision: $
+
+import os
+import tempfile
+
+from draco2.core.response import Response as CoreResponse
+from draco2.interface.interface import HTTPInterface
+from draco2.draco.handler import TemplateWriter, DracoHandler
+from draco2.draco.cache import PageCache
+from draco2.draco.parser import DracoParser
+from draco2.draco.rewriter import DracoRewriter
+from draco2.draco.template import TemplateCache
+from draco2.draco.test.test_rewriter import StaticTagLibrary, document
+from draco2.util import http
+
+
+class Response(object):
+
+    def __init__(self):
+        self.output = []
+
+    def chunk_size(self):
+        return 4
+
+    def write(self, data):
+        self.output.append(data)
+
+
+class TestTemplateWriter(object):
+
+    def test_write(self):
+        response = Response()
+        started = []
+        writer = TemplateWriter(response, started.append)
+        writer.write('ab')
+        assert not started and not response.output
+        writer.write('cd')
+        assert started == ['abcd']
+        assert response.output == ['abcd']
+        writer.write('e')
+        assert response.output == ['abcd', 'e']
+        writer.flush()
+        assert started == ['abcd']
+
+    def test_flush(self):
+        response = Response()
+        started = []
+        writer = TemplateWriter(response, started.append)
+        writer.write('a')
+        writer.flush()
+        assert started == ['a']
+        assert response.output == ['a']
+
+
+class MemoryInterface(HTTPInterface):
+
+    def __init__(self):
+        self._set_protocol('HTTP/1.1')
+        self._set_headers_out({})
+        self._set_header_sent(False)
+        self.set_status(http.HTTP_OK)
+        self.m_output = []
+
+    def send_header(self):
+        self._set_header_sent(True)
+
+    def write(self, buf):
+        self.m_output.append(buf)
+
+
+class Request(object):
+
+    def method(self):
+        return 'GET'
+
+
+class Api(object):
+
+    def __init__(self):
+        self.iface = MemoryInterface()
+        self.request = Request()
+        self.response = CoreResponse(self.iface)
+
+
+class CachedHandler(DracoHandler):
+
+    def __init__(self, cache):
+        super(CachedHandler, self).__init__()
+        self.m_cache = cache
+
+    def _page_cache(self, api):
+        return self.m_cache
+
+    def _cache_key(self, api):
+        return 'key'
+
+    def _authorize(self, api):
+        pass
+
+
+class TestDispatchCached(object):
+
+    def test_policy(self):
+        cache = PageCache()
+        policy = http.CachePolicy(max_age=100, s_maxage=200)
+        page = cache.add('key', http.HTTP_OK, {}, 'body', 300, policy)
+        page.created -= 30
+        api = Api()
+        handler = CachedHandler(cache)
+        assert handler._dispatch_cached(api)
+        headers = api.iface.headers_out()
+        assert headers['cache-control'] == ['max-age=70, s-maxage=170']
+        assert 'age' not in headers
+        assert ''.join(api.iface.m_output) == 'body'
+
+    def test_headers(self):
+        cache = PageCache()
+        headers = { 'cache-control': ['max-age=100'] }
+        page = cache.add('key', http.HTTP_OK, headers, 'body', 300)
+        page.created -= 30
+        api = Api()
+        handler = CachedHandler(cache)
+        assert handler._dispatch_cached(api)
+        headers = api.iface.headers_out()
+        assert headers['cache-control'] == ['max-age=100']
+        assert headers['age'] == ['30']
+
+
+class TemplateRequest(object):
+
+    def docroot(self):
+        return '/'
+
+    def directory(self):
+        return ''
+
+    def basename(self):
+        return 'index'
+
+    def locale(self):
+        return None
+
+
+class TemplateApi(object):
+
+    def __init__(self, log):
+        self.request = TemplateRequest()
+        self.parser = DracoParser()
+        self.rewriter = DracoRewriter()
+        self.rewriter.add_tag_library(StaticTagLibrary(log))
+        self.opener = None
+
+
+class TestRenderTemplate(object):
+
+    def setup_method(cls, method):
+        TemplateCache.instance = TemplateCache()
+        fd, cls.fname = tempfile.mkstemp()
+        os.write(fd, document % '<img src="1"/><%= "<img src=\'2\'/>" %>')
+        os.close(fd)
+
+    def teardown_method(cls, method):
+        del TemplateCache.instance
+        os.remove(cls.fname)
+
+    def test_code(self):
+        log = []
+        api = TemplateApi(log)
+        handler = DracoHandler()
+        try:
+            output = handler._render_template(api, self.fname)
+            assert output.count('width="10"') == 2
+            assert log == [('size', '1'), ('size', '2')]
+            del log[:]
+            assert handler._render_template(api, self.fname) == output
+            assert log == [('size', '2')]
+        finally:
+            api.parser.m_context._unregister_proxies()
@@ -0,0 +1,54 @@
+# vi: ts=8 sts=4 sw=4 et
+#
+# test_image.py: unit tests for draco2.draco.image
+#
+# This file is part of Draco2. Draco2 is free software and is made available
+# under the MIT license. Consult the file "LICENSE" that is distributed
+# together with this file for the exact licensing terms.
+#
+# Draco2 is copyright (c) 1999-2007 by the Draco2 authors. See the file
+# "AUTHORS" for a complete overview.
+#
+# $Revision: $
+
+import os
+import time
+import shutil
+import struct
+import tempfile
+
+from draco2.draco.image import ImageInfo
+
+
+def gif(width, height):
+    return 'GIF89a' + struct.pack('<HH', width, height) + '\x00' * 20
+
+
+class TestImageInfo(object):
+
+    def setup_method(self, method):
+        self.directory = tempfile.mkdtemp()
+        self.fname = os.path.join(self.directory, 'test.gif')
+        self.write(gif(16, 32))
+        self.index = os.path.join(self.directory, 'images.idx')
+
+    def teardown_method(self, method):
+        shutil.rmtree(self.directory)
+
+    def write(self, data):
+        fout = file(self.fname, 'wb')
+        fout.write(data)
+        fout.close()
+
+    def test_index(self):
+        images = ImageInfo()
+        images.add_path(self.directory)
+        images.build_index(self.directory, self.index)
+        images.set_index_file(self.index)
+        assert images.get_info('/test.gif') == ('gif', 16, 32)
+        self.write(gif(8, 8))
+        mtime = time.time() + 10
+        os.utime(self.fname, (mtime, mtime))
+        assert images.get_info('/test.gif') == ('gif', 8, 8)
+        os.remove(self.fname)
+        assert images.get_info('/test.gif') is None
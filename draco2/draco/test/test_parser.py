@@ -271,6 +271,35 @@ class BaseTestParser(object):
         words = result.split()
         assert words == ['test1', 'test2', 'test3']
 
+    def test_cache_directive(self):
+        io = StringIO('<%@ cache max_age="300" public="true" '
+                      'vary="Accept-Language" %>test')
+        assert self.parser.parse(io) == 'test'
+        policy = self.parser.cache_policy()
+        assert policy.max_age == 300
+        assert policy.cache_control() == 'public, max-age=300'
+        assert policy.vary == ['Accept-Language']
+        io = StringIO('test')
+        self.parser.parse(io)
+        assert self.parser.cache_policy() is None
+
+    def test_output(self):
+        opener = VirtualOpener()
+        opener.add_file('file0', 'test0 <%@ include file="file1" %> '
+                                 '<% print "test2" %> test3')
+        opener.add_file('file1', 'test1')
+        output = []
+        result = self.parser.parse('file0', opener=opener,
+                                   output=output.append)
+        assert result == ''
+        assert len(output) > 1
+        assert ''.join(output).split() == ['test0', 'test1', 'test2',
+                                           'test3']
+
+    def test_cache_directive_error(self):
+        io = StringIO('<%@ cache max_age="soon" %>')
+        py.test.raises(ParseError, self.parser.parse, io)
+
 
 class TestDracoParser(BaseTestParser):
 
@@ -0,0 +1,361 @@
+# vi: ts=8 sts=4 sw=4 et
+#
+# test_rewriter.py: unit tests for draco2.draco.rewriter
+#
+# This file is part of Draco2. Draco2 is free software and is made available
+# under the MIT license. Consult the file "LICENSE" that is distributed
+# together with this file for the exact licensing terms.
+#
+# Draco2 is copyright (c) 1999-2007 by the Draco2 authors. See the file
+# "AUTHORS" for a complete overview.
+#
+# $Revision: $
+
+import draco2
+from draco2.draco.rewriter import DracoRewriter, RewriteError
+from draco2.draco.taglib import TagLibrary, TranslationTagLibrary, element
+
+XHTML = 'http://www.w3.org/1999/xhtml'
+TEST = 'http://www.example.com/NS/test'
+
+document = '<html xmlns="%s" xmlns:test="%s">%%s</html>' % (XHTML, TEST)
+
+
+class RecordingTagLibrary(TagLibrary):
+
+    namespaces = { 'xhtml': XHTML, 'test': TEST }
+
+    def __init__(self, log):
+        self.m_log = log
+
+
+class LinkTagLibrary(RecordingTagLibrary):
+
+    priority = 50
+
+    @element('//xhtml:a')
+    def a(self, node):
+        self.m_log.append(('a', node.get('href')))
+        node.set('href', node.get('href') + '?x')
+
+    @element('//xhtml:*[@translate]')
+    def translate(self, node):
+        self.m_log.append(('translate', node.text))
+        del node.attrib['translate']
+
+    @element('//xhtml:p//xhtml:b')
+    def b(self, node):
+        self.m_log.append(('b', node.text))
+
+
+class WidgetTagLibrary(RecordingTagLibrary):
+
+    priority = 10
+
+    @element('//test:link')
+    def link(self, node):
+        self.m_log.append(('link', node.get('href')))
+        frag = self._parse_fragment('<a href="%s">link</a>'
+                                    % node.get('href'))
+        self._substitute_node(node, frag)
+
+    @element('//test:form')
+    def form(self, node):
+        self.m_log.append(('form', None))
+        node.tag = '{%s}form' % XHTML
+
+    @element('//test:remove')
+    def remove(self, node):
+        self._remove_node(node)
+
+
+class StaticTagLibrary(RecordingTagLibrary):
+
+    priority = 50
+
+    @element('//xhtml:img', static=True)
+    def size(self, node):
+        self.m_log.append(('size', node.get('src')))
+        node.set('width', '10')
+
+
+class FormTagLibrary(RecordingTagLibrary):
+
+    priority = 50
+
+    @element('//xhtml:form')
+    def xform(self, node):
+        self.m_log.append(('xform', None))
+
+
+class LocalTagLibrary(RecordingTagLibrary):
+
+    @element('//xhtml:a', local=True)
+    def a(self, node):
+        self.m_log.append(('a', node.get('href')))
+        node.set('href', node.get('href') + '?x')
+
+    @element('//xhtml:h1')
+    def h1(self, node):
+        node.text = node.text.upper()
+
+
+def rewrite(body, *taglibs):
+    rewriter = DracoRewriter()
+    for taglib in taglibs:
+        rewriter.add_tag_library(taglib)
+    return rewriter.filter(document % body)
+
+
+class TestRewriter(object):
+
+    def test_document_order(self):
+        log = []
+        rewrite('<a href="1"/><!-- c --><p><a href="2"/></p><a href="3"/>',
+                LinkTagLibrary(log))
+        assert log == [('a', '1'), ('a', '2'), ('a', '3')]
+
+    def test_predicate(self):
+        log = []
+        output = rewrite('<p translate="1">text</p><p>other</p>',
+                         LinkTagLibrary(log))
+        assert log == [('translate', 'text')]
+        assert 'translate=' not in output
+
+    def test_complex_selector(self):
+        log = []
+        rewrite('<b>no</b><p><i><b>yes</b></i></p>', LinkTagLibrary(log))
+        assert log == [('b', 'yes')]
+
+    def test_substitute(self):
+        log = []
+        output = rewrite('<test:link href="1"/><a href="2"/>',
+                         LinkTagLibrary(log), WidgetTagLibrary(log))
+        assert log == [('link', '1'), ('a', '1'), ('a', '2')]
+        assert 'href="1?x"' in output
+        assert 'href="2?x"' in output
+
+    def test_remove(self):
+        log = []
+        output = rewrite('<p>a<test:remove/>b<a href="1"/></p>',
+                         LinkTagLibrary(log), WidgetTagLibrary(log))
+        assert log == [('a', '1')]
+        assert 'remove' not in output
+        assert '<p>ab<a' in output
+
+    def test_rename(self):
+        log = []
+        rewrite('<test:form/>', WidgetTagLibrary(log), FormTagLibrary(log))
+        assert log == [('form', None), ('xform', None)]
+
+    def test_table_cache(self):
+        log1 = []
+        log2 = []
+        rewrite('<a href="1"/>', LinkTagLibrary(log1))
+        rewrite('<a href="2"/>', LinkTagLibrary(log2))
+        assert log1 == [('a', '1')]
+        assert log2 == [('a', '2')]
+        names = LinkTagLibrary._element_names()
+        assert LinkTagLibrary._element_names() is names
+        assert ('//xhtml:a', 'a') in names
+
+    def test_static(self):
+        log = []
+        rewriter = DracoRewriter()
+        rewriter.add_tag_library(StaticTagLibrary(log))
+        rewriter.add_tag_library(LinkTagLibrary(log))
+        output, dynamic = rewriter.filter_static(document % '<img src="1"/>')
+        assert log == [('size', '1')]
+        assert 'width="10"' in output
+        assert not dynamic
+        output, dynamic = rewriter.filter_static(document % '<a href="1"/>')
+        assert log == [('size', '1')]
+        assert dynamic
+
+    def test_dynamic(self):
+        log = []
+        rewriter = DracoRewriter()
+        rewriter.add_tag_library(StaticTagLibrary(log))
+        rewriter.add_tag_library(WidgetTagLibrary(log))
+        rewriter.add_tag_library(LinkTagLibrary(log))
+        body = '<img src="1"/><test:link href="2"/>'
+        output, dynamic = rewriter.filter_static(document % body)
+        assert dynamic
+        del log[:]
+        output = rewriter.filter(output, rewriter.REWRITE_DYNAMIC)
+        assert log == [('link', '2'), ('a', '2')]
+        del log[:]
+        body = '<test:form><img src="1"/></test:form>'
+        rewriter.filter(document % body, rewriter.REWRITE_DYNAMIC)
+        assert ('size', '1') not in log
+
+    def test_compiled(self):
+        log = []
+        rewriter = DracoRewriter()
+        rewriter.add_tag_library(StaticTagLibrary(log))
+        rewriter.add_tag_library(WidgetTagLibrary(log))
+        rewriter.add_tag_library(LinkTagLibrary(log))
+        doctype = '<!DOCTYPE html PUBLIC "-//W3C//DTD XHTML 1.0 Strict//EN" ' \
+                  '"http://www.w3.org/TR/xhtml1/DTD/xhtml1-strict.dtd">\n'
+        literals = ['', doctype + document.split('%s')[0] +
+                    '<p><img src="1"/><a href="', '">x</a></p><div>',
+                    '<img src="2"/></div><p title=\'', '\'/>' +
+                    document.split('%s')[1], '']
+        outputs = ['', '3', '<img src="4"/><test:link href="5"/>', 'a"b',
+                   '\n']
+        markup = rewriter.compile(literals)
+        assert log == [('size', '1'), ('size', '2')]
+        del log[:]
+        output = rewriter.filter_compiled(markup, outputs)
+        assert log == [('a', '3'), ('size', '4'), ('link', '5'), ('a', '5')]
+        result = ''.join([ l+o for l,o in zip(literals, outputs + ['']) ])
+        assert output == rewriter.filter(result)
+
+    def test_compiled_error(self):
+        rewriter = DracoRewriter()
+        assert rewriter.compile(['<p>', '']) is None
+        assert rewriter.compile(['<p draco-code="1"/>']) is None
+        start, end = document.split('%s')
+        markup = rewriter.compile([start + '<p>', '</p>' + end])
+        assert markup is not None
+        assert rewriter.filter_compiled(markup, ['<br>']) is None
+        assert rewriter.filter_compiled(markup, []) is None
+
+    def test_stream(self):
+        log = []
+        rewriter = DracoRewriter()
+        rewriter.add_tag_library(LocalTagLibrary(log))
+        rewriter.add_tag_library(WidgetTagLibrary(log))
+        assert rewriter.streamable()
+        body = '<h1>title <b>x</b></h1>a<test:remove/>b<!-- c -->' \
+               '<p class="&quot;">x<a href="1"/>y<test:link href="2"/>z' \
+               '<br/></p>'
+        input = document % body
+        for size in (1, 5, len(input)):
+            stream = rewriter.stream()
+            output = ''
+            for i in range(0, len(input), size):
+                output += stream.feed(input[i:i+size])
+            output += stream.close()
+            assert output == '<html xmlns="%s" xmlns:test="%s">' \
+                    '<h1>TITLE <b>x</b></h1>ab<!-- c -->' \
+                    '<p class="&quot;">x<a href="1?x"/>y' \
+                    '<a href="2?x">link</a>z<br/></p></html>' % (XHTML, TEST)
+
+    def test_stream_serialize(self):
+        rewriter = DracoRewriter()
+        rewriter.add_tag_library(LocalTagLibrary([]))
+        rewriter.add_tag_library(WidgetTagLibrary([]))
+        doctype = '<!DOCTYPE html PUBLIC "-//W3C//DTD XHTML 1.0 Strict//EN"' \
+                  ' "http://www.w3.org/TR/xhtml1/DTD/xhtml1-strict.dtd">\n'
+        body = '<head><title>t</title><script src="s"/></head><body>' \
+               '<p xml:lang="en">x</p><a name="n" href="1"/>' \
+               '<input checked=""/><br/><div/><h1>x&#160;\xc3\xa9</h1>' \
+               '<test:link href="2"/><p a="&#10;&#9;">&#13;</p>' \
+               '<?empty?><?pi data?><!-- \xc3\xa9 --></body>'
+        prolog = '<?xml version="1.0"?>\n<!-- c -->\n<?pi?>\n' \
+                 '<?pi data?>\n<!-- d -->\n'
+        inputs = [ document % body, doctype + document % body,
+                   doctype + '<!-- c -->' + document % '<head/>',
+                   prolog + document % body,
+                   '<!DOCTYPE html>\n' + prolog[22:] + document % body,
+                   doctype + prolog[22:] + document % body ]
+        for input in inputs:
+            stream = rewriter.stream()
+            output = ''
+            for i in range(0, len(input), 7):
+                output += stream.feed(input[i:i+7])
+            output += stream.close()
+            assert output == rewriter.filter(input)
+
+    def test_stream_xhtml(self):
+        rewriter = DracoRewriter()
+        rewriter.add_tag_library(LocalTagLibrary([]))
+        doctype = '<!DOCTYPE html PUBLIC "-//W3C//DTD XHTML 1.0 Strict//EN"' \
+                  ' "http://www.w3.org/TR/xhtml1/DTD/xhtml1-strict.dtd">\n'
+        input = doctype + document % ('<a href="1"/>' * 10)
+        stream = rewriter.stream()
+        assert stream.feed(input) == ''
+        assert stream.close() == rewriter.filter(input)
+
+    def test_stream_incremental(self):
+        log = []
+        rewriter = DracoRewriter()
+        rewriter.add_tag_library(LocalTagLibrary(log))
+        stream = rewriter.stream()
+        output = stream.feed(document % ('<a href="1"/>' * 10))
+        assert output.startswith('<html')
+        assert output.count('<a ') >= 9
+
+    def test_not_streamable(self):
+        rewriter = DracoRewriter()
+        rewriter.add_tag_library(LinkTagLibrary([]))
+        assert not rewriter.streamable()
+
+    def test_undefined_prefix(self):
+        class BadTagLibrary(TagLibrary):
+            namespaces = {}
+            @element('//bad:a')
+            def a(self, node):
+                pass
+        try:
+            rewrite('', BadTagLibrary())
+        except RewriteError:
+            pass
+        else:
+            assert False
+
+
+class DummyLocale(object):
+
+    def __init__(self, translations):
+        self.m_translations = translations
+        self.m_lookups = []
+
+    def translate_many(self, messages):
+        self.m_lookups.append(messages)
+        return [ self.m_translations.get(message[0], message[0])
+                 for message in messages ]
+
+
+class DummyAPI(object):
+    pass
+
+
+class TestTranslation(object):
+
+    def setup_method(cls, method):
+        cls.api = draco2.api
+        draco2.api = DummyAPI()
+
+    def teardown_method(cls, method):
+        draco2.api = cls.api
+
+    def test_batch(self):
+        locale = DummyLocale({ 'Hello': 'Hallo <a href="x">wereld</a>',
+                               'Title': 'Titel' })
+        draco2.api.locale = locale
+        log = []
+        body = '<h1>Hello</h1><p translate="1">Title</p><h2>Other</h2>' \
+               '<h3>Hello</h3>'
+        output = rewrite(body, TranslationTagLibrary(), LocalTagLibrary(log))
+        assert len(locale.m_lookups) == 1
+        assert locale.m_lookups[0] == [('Hello', None, None),
+                                       ('Title', None, None),
+                                       ('Other', None, None),
+                                       ('Hello', None, None)]
+        assert '<h1>Hallo <a href="x?x">wereld</a></h1>' in output
+        assert '<h3>Hallo <a href="x?x">wereld</a></h3>' in output
+        assert '<p>Titel</p>' in output
+        assert '<h2>Other</h2>' in output
+
+    def test_static(self):
+        locale = DummyLocale({ 'Hello': 'Hallo' })
+        draco2.api.locale = locale
+        rewriter = DracoRewriter()
+        rewriter.add_tag_library(TranslationTagLibrary())
+        output, dynamic = rewriter.filter_static(document % '<h1>Hello</h1>')
+        assert '<h1>Hallo</h1>' in output
+        assert not dynamic
+        output = rewriter.filter(output, rewriter.REWRITE_DYNAMIC)
+        assert len(locale.m_lookups) == 1
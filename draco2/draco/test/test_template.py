@@ -0,0 +1,172 @@
+# vi: ts=8 sts=4 sw=4 et
+#
+# test_template.py: unit tests for draco2.draco.template
+#
+# This file is part of Draco2. Draco2 is free software and is made available
+# under the MIT license. Consult the file "LICENSE" that is distributed
+# together with this file for the exact licensing terms.
+#
+# Draco2 is copyright (c) 1999-2007 by the Draco2 authors. See the file
+# "AUTHORS" for a complete overview.
+#
+# $Revision: $
+
+import os
+import os.path
+import shutil
+import tempfile
+
+import draco2
+from draco2.draco.parser import DracoParser
+from draco2.draco.opener import DracoOpener
+from draco2.draco.rewriter import DracoRewriter
+from draco2.draco.taglib import DracoTagLibrary
+from draco2.draco.template import TemplateCache
+
+
+class ChangeContext(object):
+
+    def __init__(self):
+        self.callbacks = []
+
+    def add_callback(self, callback):
+        self.callbacks.append(callback)
+
+
+class ChangeManager(object):
+
+    def __init__(self):
+        self.contexts = {}
+
+    def get_context(self, name):
+        return self.contexts.setdefault(name, ChangeContext())
+
+
+class Request(object):
+
+    def __init__(self, docroot):
+        self.m_docroot = docroot
+
+    def docroot(self):
+        return self.m_docroot
+
+    def directory(self):
+        return 'dir'
+
+    def basename(self):
+        return 'page'
+
+
+class DummyAPI(object):
+    pass
+
+
+class TestTemplateCache(object):
+
+    def setup_method(cls, method):
+        fd, cls.fname = tempfile.mkstemp()
+        os.write(fd, '<p>static</p>')
+        os.close(fd)
+        cls.parser = DracoParser()
+
+    def teardown_method(cls, method):
+        os.remove(cls.fname)
+        if hasattr(cls.parser, 'm_context'):
+            cls.parser.m_context._unregister_proxies()
+
+    def test_static_parse(self):
+        parser = self.parser
+        assert parser.parse(self.fname) == '<p>static</p>'
+        assert parser.isstatic()
+        assert [ f[0] for f in parser.files() ] == [self.fname]
+        fout = file(self.fname, 'w')
+        fout.write('<p><%= 1 %></p>')
+        fout.close()
+        assert parser.parse(self.fname) == '<p>1</p>'
+        assert not parser.isstatic()
+
+    def test_segments(self):
+        parser = self.parser
+        fd, fname = tempfile.mkstemp()
+        os.write(fd, '<b><%= 2 %></b>')
+        os.close(fd)
+        try:
+            fout = file(self.fname, 'w')
+            fout.write('<p><%= 1 %><% print 3, %></p><%@ include file="' +
+                       fname + '" %><a href="<%= 4 %>"/>')
+            fout.close()
+            output = parser.parse(self.fname)
+            literals, outputs = parser.segments()
+            assert literals == ['<p>', '</p><b>', '</b><a href="', '"/>']
+            assert outputs == ['13', '2', '4']
+            output = parser.parse(self.fname, output=[].append)
+            assert parser.segments() is None
+            fout = file(self.fname, 'w')
+            fout.write('<%@ include expr="' + repr(fname) + '" %>')
+            fout.close()
+            output = parser.parse(self.fname)
+            assert parser.segments() == (['', ''], ['<b>2</b>'])
+        finally:
+            os.remove(fname)
+
+    def test_add_get(self):
+        cache = TemplateCache()
+        output = self.parser.parse(self.fname)
+        cache.add('key', self.parser.files(), output, False)
+        template = cache.get('key')
+        assert template.output == '<p>static</p>'
+        assert not template.dynamic
+        assert cache.get('other') is None
+
+    def test_modified(self):
+        cache = TemplateCache()
+        st = os.stat(self.fname)
+        cache.add('key', [(self.fname, st.st_mtime - 1)], '', False)
+        assert cache.get('key') is None
+
+    def test_expire(self):
+        cache = TemplateCache()
+        cache.set_timeout(0)
+        cache.add('key', [], '', False)
+        assert cache.get('key') is None
+
+    def test_translation_change(self):
+        cache = TemplateCache()
+        changes = ChangeManager()
+        cache._set_change_manager(changes)
+        cache.add('key', [], '', False)
+        ctx = changes.get_context('draco2.draco.translator')
+        for callback in ctx.callbacks:
+            callback(None)
+        assert cache.get('key') is None
+
+    def test_head_files(self):
+        docroot = tempfile.mkdtemp()
+        dirname = os.path.join(docroot, 'dir')
+        os.mkdir(dirname)
+        api = draco2.api
+        try:
+            draco2.api = DummyAPI()
+            draco2.api.request = Request(docroot)
+            opener = DracoOpener()
+            opener._set_document_root(docroot)
+            opener._set_current_directory('dir')
+            draco2.api.opener = opener
+            rewriter = DracoRewriter()
+            rewriter.add_tag_library(DracoTagLibrary())
+            input = '<html xmlns="http://www.w3.org/1999/xhtml">' \
+                    '<head/></html>'
+            output, dynamic = rewriter.filter_static(input)
+            assert 'page.css' not in output
+            files = rewriter.files()
+            assert [ f[0] for f in files ] == [dirname]
+            cache = TemplateCache()
+            cache.add('key', files, output, dynamic)
+            assert cache.get('key') is not None
+            file(os.path.join(dirname, 'page.css'), 'w').close()
+            st = os.stat(dirname)
+            os.utime(dirname, (st.st_atime, st.st_mtime + 1))
+            assert cache.get('key') is None
+        finally:
+            draco2.api = api
+            shutil.rmtree(docroot)
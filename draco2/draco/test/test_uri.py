@@ -62,6 +62,35 @@ class TestDracoURI(DracoURITest):
             parts = parse_draco_uri(uri, self.docroot)
             assert parts == ref
 
+    def test_parse_cache(self):
+        cache = ParseCache()
+        uri = self.test_uris[0][0]
+        parts = cache.parse(uri, self.docroot)
+        assert parts == self.test_uris[0][1]
+        self.create_docroot_directory('dir/subdir')
+        assert cache.parse(uri, self.docroot) == parts
+        # The cache is keyed on the path only.
+        other = cache.parse(uri.replace('?query', '?other'), self.docroot)
+        assert other[:7] == parts[:7]
+        assert other[7] == 'other'
+        cache.clear()
+        parts = cache.parse(uri, self.docroot)
+        assert parts == self.test_uris[1][1]
+
+    def test_parse_cache_timeout(self):
+        cache = ParseCache(timeout=0)
+        uri = self.test_uris[0][0]
+        assert cache.parse(uri, self.docroot) == self.test_uris[0][1]
+        self.create_docroot_directory('dir/subdir')
+        assert cache.parse(uri, self.docroot) == self.test_uris[1][1]
+
+    def test_paste_parts(self):
+        self.create_docroot_directory('dir/subdir')
+        uri = 'http://hostname/dir/subdir/template.dsp?query'
+        parts = parse_draco_uri(uri, self.docroot)
+        uri = paste_draco_parts(parts, locale='en-us')
+        assert uri == 'http://hostname/dir/subdir/template.dsp/en-us?query'
+
     def test_create_uri(self):
         for ref,parts in self.test_uris:
             uri = create_draco_uri(*parts)
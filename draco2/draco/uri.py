@@ -12,8 +12,11 @@
 # $Revision: 1187 $
 
 import os
+import time
+import logging
 
 from draco2.util import uri as urimod
+from draco2.util.cache import LruCache
 from draco2.util.loader import path_from_module
 from draco2.session.util import issessionid
 from draco2.locale.util import islocale
@@ -31,14 +34,24 @@ def uri_from_method(method, extension):
     return reluri
 
 
-def parse_draco_uri(uri, docroot):
+def parse_draco_uri(uri, docroot, cache=None):
     """Decompose an URI into Draco specific components.
 
     The return value is the 8-tuple: (protocol, host, path,
         filename, locale, session, pathinfo, args)
+
+    The optional `cache' argument is a PathCache that is used to resolve
+    the path part of the URI.
     """
     protocol, host, path, args = urimod.parse_uri(uri)
-    directory, filename, pathinfo = urimod.resolve_path_uri(path, docroot) 
+    directory, filename, pathinfo = urimod.resolve_path_uri(path, docroot,
+                                                            cache)
+    return _draco_parts(protocol, host, directory, filename, pathinfo, args)
+
+
+def _draco_parts(protocol, host, directory, filename, pathinfo, args):
+    """Split the locale and the session off `pathinfo' and return the
+    8-tuple of parse_draco_uri()."""
     parts = pathinfo.split('/')
     if parts and islocale(parts[0]):
         locale = parts[0]
@@ -55,6 +68,85 @@ def parse_draco_uri(uri, docroot):
             pathinfo, args)
 
 
+class ParseCache(object):
+    """Cache for parsing Draco URIs.
+
+    Parsing a Draco URI involves stat() calls on the file system to
+    resolve its path. This cache remembers how paths resolve, so that
+    URIs that differ only in their query or host are resolved once.
+    Entries expire after `timeout' seconds, so changes to the file
+    system may go unnoticed for that long. The process wide path cache
+    is not used, so that this is the only delay.
+
+    This class is thread safe.
+    """
+
+    def __init__(self, size=1000, timeout=5):
+        """Constructor."""
+        self.m_cache = LruCache(size)
+        self.set_timeout(timeout)
+
+    @classmethod
+    def _create(cls, api):
+        """Factory method."""
+        cache = cls()
+        cache._configure(api)
+        if hasattr(api, 'changes'):
+            cache._set_change_manager(api.changes)
+        return cache
+
+    def _configure(self, api):
+        """Configure the cache from the config file."""
+        config = api.config.ns('draco2.draco.uri')
+        if config.has_key('cachesize'):
+            self.set_size(config['cachesize'])
+        if config.has_key('timeout'):
+            self.set_timeout(config['timeout'])
+
+    def _set_change_manager(self, changes):
+        """Set the change manager to `changes'."""
+        ctx = changes.get_context('draco2.core.config')
+        ctx.add_callback(self._change_callback)
+
+    def _change_callback(self, api):
+        """Reload config and clear the cache."""
+        self._configure(api)
+        self.m_cache.clear()
+        logger = logging.getLogger('draco2.draco.uri')
+        logger.debug('Cleared parse cache due to change.')
+
+    def set_size(self, size):
+        """Set the maximum number of paths in the cache."""
+        self.m_cache.set_size(size)
+
+    def timeout(self):
+        """Return the time to live of a cache entry, in seconds."""
+        return self.m_timeout
+
+    def set_timeout(self, timeout):
+        """Set the time to live of a cache entry to `timeout' seconds."""
+        self.m_timeout = timeout
+
+    def parse(self, uri, docroot):
+        """Like parse_draco_uri(), but use the cache."""
+        protocol, host, path, args = urimod.parse_uri(uri)
+        key = (path, docroot)
+        now = time.time()
+        entry = self.m_cache.get(key)
+        if entry is not None and entry[0] > now:
+            resolved = entry[1]
+        else:
+            resolved = urimod.resolve_path_uri(path, docroot)
+            self.m_cache.add(key, (now + self.m_timeout, resolved))
+        directory, filename, pathinfo = resolved
+        return _draco_parts(protocol, host, directory, filename, pathinfo,
+                            args)
+
+    def clear(self):
+        """Remove all entries from the cache."""
+        self.m_cache.clear()
+
+
 def create_draco_uri(scheme, host, directory, filename, locale,
                      session, pathinfo, args):
     """Create a Draco URI from its components.
@@ -111,8 +203,20 @@ def paste_draco_uri(uri, docroot, scheme=None, host=None, directory=None,
     Components provides as arguments augment URI if URI doesn't contain
     that component.
     """
+    parts = parse_draco_uri(uri, docroot)
+    return paste_draco_parts(parts, scheme, host, directory, filename,
+                             locale, session, pathinfo, args)
+
+
+def paste_draco_parts(parts, scheme=None, host=None, directory=None,
+                      filename=None, locale=None, session=None,
+                      pathinfo=None, args=None):
+    """Paste into a URI that was parsed into `parts' by parse_draco_uri().
+
+    See paste_draco_uri() for the other arguments.
+    """
     (curscheme, curhost, curdir, curfile, curloc, curses,
-     curinfo, curargs) = parse_draco_uri(uri, docroot)
+     curinfo, curargs) = parts
     if not curscheme:
         curscheme = scheme
     if not curhost:
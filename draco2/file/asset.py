@@ -0,0 +1,220 @@
+# vi: ts=8 sts=4 sw=4 et
+#
+# asset.py: manifest of fingerprinted static assets
+#
+# This file is part of Draco2. Draco2 is free software and is made available
+# under the MIT license. Consult the file "LICENSE" that is distributed
+# together with this file for the exact licensing terms.
+#
+# Draco2 is copyright (c) 1999-2007 by the Draco2 authors. See the file
+# "AUTHORS" for a complete overview.
+#
+# $Revision: $
+
+import os
+import os.path
+import logging
+
+from draco2.util.misc import md5sum
+
+
+asset_extensions = ('css', 'js')
+
+
+def normalize_uri(uri):
+    """Normalize the docroot relative URI `uri'."""
+    return '/' + '/'.join([ part for part in uri.split('/') if part ])
+
+def fingerprint_uri(uri, digest):
+    """Insert the content digest `digest' into the asset URI `uri'.
+
+    The digest is inserted before the extension, e.g. "/css/site.css"
+    becomes "/css/site.0123456789.css".
+    """
+    base, ext = os.path.splitext(uri)
+    return '%s.%s%s' % (base, digest, ext)
+
+
+# Asset manifest
+#
+# An asset manifest lists all static assets below a directory together
+# with a digest of their contents. The manifest file has one line per
+# asset with the tab separated fields name, digest and modification
+# time. The name is relative to the directory, starts with a '/', and
+# uses '/' as the path separator.
+
+def build_asset_manifest(root, extensions=asset_extensions):
+    """Return an asset manifest for all assets below directory `root'.
+
+    The manifest is a dictionary mapping asset names to (digest, mtime)
+    tuples. Only files with an extension in `extensions' are included.
+    """
+    manifest = {}
+    for dirpath, dirnames, filenames in os.walk(root):
+        reldir = dirpath[len(root):].replace(os.sep, '/')
+        for fname in filenames:
+            ext = os.path.splitext(fname)[1][1:].lower()
+            if ext not in extensions or fname[0] in '_.':
+                continue
+            name = normalize_uri('%s/%s' % (reldir, fname))
+            if '\t' in name or '\n' in name:
+                continue
+            path = os.path.join(dirpath, fname)
+            try:
+                st = os.stat(path)
+                fin = file(path, 'rb')
+            except (OSError, IOError):
+                continue
+            try:
+                digest = md5sum(fin.read())[:10]
+            finally:
+                fin.close()
+            manifest[name] = (digest, int(st.st_mtime))
+    return manifest
+
+def write_asset_manifest(manifest, fname):
+    """Write the asset manifest `manifest' to the file `fname'.
+
+    The file is replaced atomically so that processes reading the
+    manifest never see a partially written file.
+    """
+    tmpname = '%s.%d' % (fname, os.getpid())
+    fout = file(tmpname, 'w')
+    try:
+        fout.write('# Draco asset manifest\n')
+        names = manifest.keys()
+        names.sort()
+        for name in names:
+            digest, mtime = manifest[name]
+            fout.write('%s\t%s\t%d\n' % (name, digest, mtime))
+    finally:
+        fout.close()
+    try:
+        os.rename(tmpname, fname)
+    except OSError:
+        # Windows does not allow renaming over an existing file.
+        os.remove(fname)
+        os.rename(tmpname, fname)
+
+def read_asset_manifest(fname):
+    """Read an asset manifest from the file `fname'.
+
+    An empty manifest is returned if the file does not exist.
+    """
+    manifest = {}
+    try:
+        fin = file(fname)
+    except IOError:
+        return manifest
+    try:
+        for line in fin:
+            if line.startswith('#'):
+                continue
+            fields = line.rstrip('\n').split('\t')
+            if len(fields) != 3:
+                continue
+            try:
+                manifest[fields[0]] = (fields[1], int(fields[2]))
+            except ValueError:
+                continue
+    finally:
+        fin.close()
+    return manifest
+
+
+class AssetManifest(object):
+    """Fingerprinted static assets.
+
+    The asset manifest maps static assets in the document root, such as
+    style sheets and scripts, to URIs that contain a digest of their
+    contents. Because the URI of an asset changes whenever its contents
+    change, fingerprinted URIs can be served with far-future caching
+    headers.
+
+    The manifest is stored in a file that is built at startup if it does
+    not exist, and that can be rebuilt with the `draco2.py asset manifest'
+    command. The manifest is reloaded by the change manager when the file
+    is rebuilt.
+
+    This class is thread safe.
+    """
+
+    def __init__(self):
+        """Constructor."""
+        self.m_assets = {}
+        self.m_fingerprints = {}
+        self.m_manifest_file = None
+        self.m_change_context = None
+
+    @classmethod
+    def _create(cls, api):
+        """Factory method."""
+        manifest = cls()
+        if hasattr(api, 'changes'):
+            manifest._set_change_manager(api.changes)
+        config = api.config.ns('draco2.file.asset')
+        if config.has_key('manifestfile'):
+            section = api.config.ns('draco2')
+            fname = os.path.join(section['datadirectory'],
+                                 config['manifestfile'])
+            if not os.path.exists(fname):
+                manifest.build(section['documentroot'], fname)
+            manifest.set_manifest_file(fname)
+        return manifest
+
+    def _set_change_manager(self, changes):
+        """Set the change manager to `changes'."""
+        self.m_change_context = changes.get_context('draco2.file.asset')
+        self.m_change_context.add_callback(self._change_callback)
+
+    def _change_callback(self, api):
+        """Reload the manifest (change detected)."""
+        self._load(self.m_manifest_file)
+        logger = logging.getLogger('draco2.file.asset')
+        logger.debug('Reloaded asset manifest (change detected).')
+
+    def _load(self, fname):
+        """Load the manifest from file `fname'."""
+        manifest = read_asset_manifest(fname)
+        assets = {}
+        fingerprints = {}
+        for name,(digest,mtime) in manifest.items():
+            uri = fingerprint_uri(name, digest)
+            assets[name] = uri
+            fingerprints[uri] = (name, mtime)
+        self.m_assets = assets
+        self.m_fingerprints = fingerprints
+
+    def build(self, root, fname):
+        """Build an asset manifest for directory `root' and write it to
+        the file `fname'."""
+        logger = logging.getLogger('draco2.file.asset')
+        logger.info('Building asset manifest for %s.' % root)
+        manifest = build_asset_manifest(root)
+        write_asset_manifest(manifest, fname)
+        logger.info('Wrote %d assets to %s.' % (len(manifest), fname))
+
+    def set_manifest_file(self, fname):
+        """Use the asset manifest in file `fname'."""
+        self.m_manifest_file = fname
+        self._load(fname)
+        if self.m_change_context:
+            self.m_change_context.add_file(fname)
+
+    def enabled(self):
+        """Return True if a manifest is in use."""
+        return self.m_manifest_file is not None
+
+    def lookup(self, uri):
+        """Return the fingerprinted URI for the asset `uri', or None if
+        the asset is not in the manifest."""
+        return self.m_assets.get(normalize_uri(uri))
+
+    def resolve(self, uri):
+        """Resolve the fingerprinted URI `uri'.
+
+        The return value is a tuple (uri, mtime) containing the URI of
+        the asset and its modification time at the moment the manifest
+        was built, or None if `uri' is not a fingerprinted URI.
+        """
+        return self.m_fingerprints.get(normalize_uri(uri))
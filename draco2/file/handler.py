@@ -16,14 +16,22 @@ import os.path
 
 from draco2.core.handler import Handler
 from draco2.core.response import HTTPResponse
+from draco2.file.asset import AssetManifest
 from draco2.util import http
 from draco2.util import uri as urilib
+from draco2.util.singleton import singleton
 
 
 class FileHandler(Handler):
-    """A handler that serves plain files."""
+    """A handler that serves plain files.
+
+    Requests for fingerprinted asset URIs are served from the original
+    file, with caching headers that allow clients to cache the response
+    forever.
+    """
 
     allowed_methods = ('GET', 'HEAD')
+    immutable_max_age = 365 * 24 * 3600
 
     def _handle(self, api):
         """Handle a file request."""
@@ -34,6 +42,10 @@ class FileHandler(Handler):
             raise HTTPResponse, http.HTTP_FORBIDDEN
         fname = os.path.join(request.docroot(), request.directory(),
                              request.filename())
+        assets = singleton(AssetManifest, api, factory=AssetManifest._create)
+        asset = assets.resolve('%s/%s' % (request.directory(), filename))
+        if asset:
+            fname = request.docroot() + asset[0].replace('/', os.sep)
         try:
             st = os.stat(fname)
             fin = file(fname, 'rb')
@@ -48,6 +60,12 @@ class FileHandler(Handler):
         response.set_header('content-length', str(st.st_size))
         modified = http.get_last_modified(st)
         response.set_header('last-modified', modified)
+        # Only if the asset did not change since the manifest was built
+        # does its content match the fingerprint.
+        if asset and int(st.st_mtime) == asset[1]:
+            policy = http.CachePolicy(max_age=self.immutable_max_age,
+                                      public=True, immutable=True)
+            response.set_cache_policy(policy)
         response.send_header()
         if request.method() == 'GET':
             fin.seek(0)
@@ -0,0 +1,76 @@
+# vi: ts=8 sts=4 sw=4 et
+#
+# test_asset.py: test suite for draco2.file.asset
+#
+# This file is part of Draco2. Draco2 is free software and is made available
+# under the MIT license. Consult the file "LICENSE" that is distributed
+# together with this file for the exact licensing terms.
+#
+# Draco2 is copyright (c) 1999-2007 by the Draco2 authors. See the file
+# "AUTHORS" for a complete overview.
+#
+# $Revision: $
+
+import os
+import os.path
+import shutil
+import tempfile
+
+from draco2.file.asset import (AssetManifest, fingerprint_uri,
+                               build_asset_manifest, write_asset_manifest,
+                               read_asset_manifest)
+from draco2.util.misc import md5sum
+
+
+class TestAssetManifest(object):
+
+    def setup_method(cls, method):
+        cls.docroot = tempfile.mkdtemp()
+        os.mkdir(os.path.join(cls.docroot, 'css'))
+        cls.create_file('css/site.css', 'body { color: black; }')
+        cls.create_file('page.js', 'alert(1);')
+        cls.create_file('_private.js', 'alert(2);')
+        cls.create_file('page.dsp', '<html />')
+        cls.datadir = tempfile.mkdtemp()
+
+    def teardown_method(cls, method):
+        shutil.rmtree(cls.docroot)
+        shutil.rmtree(cls.datadir)
+
+    def create_file(self, name, data):
+        fname = os.path.join(self.docroot, name.replace('/', os.sep))
+        fout = file(fname, 'wb')
+        fout.write(data)
+        fout.close()
+
+    def test_fingerprint_uri(self):
+        assert fingerprint_uri('/css/site.css', 'abc') == '/css/site.abc.css'
+
+    def test_build(self):
+        manifest = build_asset_manifest(self.docroot)
+        names = manifest.keys()
+        names.sort()
+        assert names == ['/css/site.css', '/page.js']
+        digest = md5sum('alert(1);')[:10]
+        assert manifest['/page.js'][0] == digest
+        fname = os.path.join(self.datadir, 'assets.idx')
+        write_asset_manifest(manifest, fname)
+        assert read_asset_manifest(fname) == manifest
+
+    def test_lookup(self):
+        fname = os.path.join(self.datadir, 'assets.idx')
+        assets = AssetManifest()
+        assert not assets.enabled()
+        assets.build(self.docroot, fname)
+        assets.set_manifest_file(fname)
+        assert assets.enabled()
+        digest = md5sum('alert(1);')[:10]
+        uri = '/page.%s.js' % digest
+        assert assets.lookup('/page.js') == uri
+        assert assets.lookup('//page.js') == uri
+        assert assets.lookup('/other.js') is None
+        name, mtime = assets.resolve(uri)
+        assert name == '/page.js'
+        st = os.stat(os.path.join(self.docroot, 'page.js'))
+        assert mtime == int(st.st_mtime)
+        assert assets.resolve('/page.js') is None
@@ -38,7 +38,7 @@ class FormTagLibrary(TagLibrary):
                            namespaces=self.namespaces)
         return bool(forms)
 
-    @element('//xhtml:input')
+    @element('//xhtml:input', local=True)
     def input(self, node):
         """Paste in value from the namespace."""
         if not self._check_form(node):
@@ -61,7 +61,7 @@ class FormTagLibrary(TagLibrary):
             elif node.attrib.get('selected'):
                 del node.attrib['selected']
 
-    @element('//xhtml:option')
+    @element('//xhtml:option', local=True)
     def option(self, node):
         """Select the right option."""
         if not self._check_form(node):
@@ -116,6 +116,24 @@ class HTTPInterface(object):
         """Write to the HTTP response."""
         raise NotImplementedError
 
+    def chunked(self):
+        """Return True if the response body can be sent using the
+        "chunked" transfer-coding.
+
+        Chunked encoding requires an HTTP/1.1 client.
+        """
+        return self.protocol() == 'HTTP/1.1'
+
+    def write_chunk(self, buf):
+        """Write `buf' as a single chunk of a chunked response."""
+        if not buf:
+            return
+        self.write('%x\r\n%s\r\n' % (len(buf), buf))
+
+    def end_chunks(self):
+        """Terminate a chunked response."""
+        self.write('0\r\n\r\n')
+
     def _set_options(self, options):
         self.m_options = options
 
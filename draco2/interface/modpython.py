@@ -96,6 +96,11 @@ class ModPythonInterface(HTTPInterface):
             del headers_out['content-type']
         except KeyError:
             pass
+        # Apache does chunked encoding itself if required.
+        try:
+            del headers_out['transfer-encoding']
+        except KeyError:
+            pass
         status_class = self.status() - self.status() % 100
         for key in headers_out:
             for value in headers_out[key]:
@@ -109,6 +114,13 @@ class ModPythonInterface(HTTPInterface):
     def write(self, buffer):
         self.m_mpreq.write(buffer)
 
+    def write_chunk(self, buffer):
+        # Apache adds the chunk framing.
+        self.m_mpreq.write(buffer)
+
+    def end_chunks(self):
+        pass
+
     def local_hostname(self):
         return self.m_mpreq.hostname
 
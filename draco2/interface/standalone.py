@@ -18,10 +18,16 @@ from draco2.interface.interface import HTTPInterface
 
 
 class StandaloneInterface(HTTPInterface):
-    """An interface that can be used stand-alone."""
+    """An interface that can be used stand-alone.
+
+    The `data' argument contains the start of the request body, if it
+    was already read from the connection together with the headers. It
+    is consumed by keeping an offset into it, and is released once it
+    has been read completely.
+    """
 
     def __init__(self, proto, method, uri, headers, conn,
-                 local_addr, remote_addr, options):
+                 local_addr, remote_addr, options, data=''):
         self._set_protocol(proto)
         self._set_method(method)
         self._set_uri(uri)
@@ -38,20 +44,45 @@ class StandaloneInterface(HTTPInterface):
         self.set_error(None)
         self.m_conn = conn
         self.m_options = options
+        self.m_data = data
+        self.m_offset = 0
         self.m_sent_header = False
         super(StandaloneInterface, self).__init__()
 
     def read(self, size=None):
         if size is None:
             try:
-                size = self.header('content-length')
-            except (TypeError, ValueError):
+                size = int(self.headers_in()['content-length'][0])
+            except (KeyError, ValueError):
                 size = 0
+        if self.m_data:
+            buf = self._consume(self.m_offset + size)
+            if len(buf) < size:
+                buf += self.m_conn.read(size - len(buf))
+            return buf
         return self.m_conn.read(size)
 
     def readline(self):
+        if self.m_data:
+            pos = self.m_data.find('\n', self.m_offset)
+            if pos != -1:
+                return self._consume(pos + 1)
+            buf = self._consume(len(self.m_data))
+            return buf + self.m_conn.readline()
         return self.m_conn.readline()
 
+    def _consume(self, end):
+        """Return the buffered data up to offset `end'."""
+        if self.m_offset == 0 and end >= len(self.m_data):
+            buf = self.m_data
+        else:
+            buf = self.m_data[self.m_offset:end]
+        self.m_offset += len(buf)
+        if self.m_offset == len(self.m_data):
+            self.m_data = ''
+            self.m_offset = 0
+        return buf
+
     def send_header(self):
         if self.header_sent():
             return
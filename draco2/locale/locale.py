@@ -117,6 +117,14 @@ class Locale(object):
                                               context, name)
         return message
 
+    def translate_many(self, messages):
+        """Translate a list of messages at once.
+
+        The `messages' argument is a list of (message, context, name)
+        tuples. A list of translations is returned.
+        """
+        return self.m_translator.translate_many(messages, self.languages())
+
     def format_date(self, date, format='%x', **kwargs):
         if kwargs:
             conv = self.localeconv().copy()
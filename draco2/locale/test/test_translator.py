@@ -0,0 +1,68 @@
+# vi: ts=8 sts=4 sw=4 et
+#
+# test_translator.py: unit tests for draco2.locale.translator
+#
+# This file is part of Draco2. Draco2 is free software and is made available
+# under the MIT license. Consult the file "LICENSE" that is distributed
+# together with this file for the exact licensing terms.
+#
+# Draco2 is copyright (c) 1999-2007 by the Draco2 authors. See the file
+# "AUTHORS" for a complete overview.
+#
+# $Revision: $
+
+from draco2.core.model import Message
+from draco2.locale.translator import Translator
+
+
+class CachedTranslation(dict):
+    """A translation from the object cache, selected without extra
+    attributes."""
+
+    def extra_data(self):
+        return {}
+
+
+class Transaction(object):
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def select(self, typ, where=None, args=None, order=None, join=None,
+               extra_attrs=None):
+        hash = args[0]
+        for row in self.rows:
+            if row[0] == hash:
+                return [CachedTranslation(translation=row[4])]
+        return []
+
+    def select_translations(self, hashes, names, languages):
+        return [ row for row in self.rows
+                 if (row[0] in hashes or row[1] in names)
+                    and row[3] in languages ]
+
+
+class Models(object):
+
+    def __init__(self, transaction):
+        self.m_transaction = transaction
+
+    def model(self, name):
+        return self
+
+    def transaction(self, name):
+        return self.m_transaction
+
+
+class TestTranslator(object):
+
+    def test_translate_many(self):
+        rows = [ (Message.hash('yes'), None, None, 'nl', 'ja'),
+                 (Message.hash('yes'), None, 'ctx', 'nl', 'jawel'),
+                 (Message.hash('no'), None, None, 'nl', 'nee') ]
+        translator = Translator(Models(Transaction(rows)))
+        assert translator.translate('yes', ('nl',)) == 'ja'
+        messages = [('yes', 'ctx', None), ('no', None, None),
+                     ('maybe', None, None)]
+        result = translator.translate_many(messages, ('nl',))
+        assert result == ['jawel', 'nee', 'maybe']
@@ -44,6 +44,17 @@ class TranslatorInterface(object):
         """
         raise NotImplementedError
 
+    def translate_many(self, messages, languages):
+        """Translate a list of messages at once.
+
+        The `messages' argument is a list of (message, context, name)
+        tuples. The return value is a list of translations, in the same
+        order.
+        """
+        translations = [ self.translate(message, languages, context, name)
+                         for message,context,name in messages ]
+        return translations
+
 
 class Translator(TranslatorInterface):
     """The default translator.
@@ -160,6 +171,63 @@ class Translator(TranslatorInterface):
         return translation
 
 
+    def translate_many(self, messages, languages):
+        """Translate a list of messages at once.
+
+        Messages that are not in the cache are looked up with a single
+        query. The best translation for each message is selected using
+        the same criteria as translate().
+        """
+        translations = [None] * len(messages)
+        missing = {}
+        for i,(message,context,name) in enumerate(messages):
+            hash = Message.hash(message)
+            cacheid = (hash, context, name) + tuple(languages)
+            translation = self.m_cache.get(cacheid)
+            if translation:
+                translations[i] = translation
+            else:
+                missing.setdefault(cacheid, []).append(i)
+        if not missing:
+            return translations
+        hashes = {}
+        names = {}
+        for cacheid in missing:
+            hashes[cacheid[0]] = True
+            if cacheid[2]:
+                names[cacheid[2]] = True
+        # The shared transaction may already hold some of the translations
+        # in its object cache, so a plain query is used.
+        transaction = self.m_models.model('draco').transaction('shared')
+        result = transaction.select_translations(hashes.keys(), names.keys(),
+                                                 list(languages))
+        for cacheid,indices in missing.items():
+            hash, context, name = cacheid[:3]
+            best = None
+            for row in result:
+                rhash, rname, rcontext, rlanguage, rtranslation = row
+                if rhash != hash and (not name or rname != name):
+                    continue
+                if name is not None:
+                    key = [rname == name]
+                else:
+                    key = [rname is None]
+                key.append(rhash == hash)
+                key += [ rlanguage == language for language in languages ]
+                if context:
+                    key.append(rcontext == context)
+                if best is None or key > best[0]:
+                    best = (key, rtranslation)
+            if best is not None:
+                translation = best[1]
+            else:
+                translation = messages[indices[0]][0]
+            self.m_cache.add(cacheid, translation)
+            for i in indices:
+                translations[i] = translation
+        return translations
+
+
 class DummyTranslator(TranslatorInterface):
     """Dummy translator (doesn't translate)."""
 
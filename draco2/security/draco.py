@@ -15,6 +15,7 @@ import logging
 import datetime
 
 from draco2.util.http import Cookie
+from draco2.util.misc import needs_touch
 from draco2.core.model import SecurityContext
 from draco2.security.util import (isauthtoken, generate_authtoken,
                                   parse_authtoken)
@@ -36,6 +37,7 @@ class DracoAuthentication(AuthenticationScheme):
                                                   transaction)
         self.m_context = None
         self.set_timeout(3600)
+        self.set_touch_fraction(0)
         self.set_secure(False)
 
     @classmethod
@@ -45,6 +47,8 @@ class DracoAuthentication(AuthenticationScheme):
         config = api.config.namespace('draco2.security.draco')
         if config.has_key('timeout'):
             scheme.set_timeout(config['timeout'])
+        if config.has_key('touchfraction'):
+            scheme.set_touch_fraction(config['touchfraction'])
         if config.has_key('secure'):
             scheme.set_secure(config['secure'])
         return scheme
@@ -53,6 +57,11 @@ class DracoAuthentication(AuthenticationScheme):
         """Set the timeout value."""
         self.m_timeout = timeout
 
+    def set_touch_fraction(self, fraction):
+        """Set the fraction of the timeout after which the expiration
+        date of a security context is extended."""
+        self.m_touch_fraction = fraction
+
     def set_secure(self, secure):
         """Set secure flag."""
         self.m_secure = secure
@@ -81,14 +90,17 @@ class DracoAuthentication(AuthenticationScheme):
         if context['expire_date'] <= now:
             logger.info('Client provided expired authentication token.')
             return False
-        updates = {}  # batch updates
-        updates['last_used'] = now
-        expire_date = now + datetime.timedelta(seconds=self.m_timeout)
-        updates['expire_date'] = expire_date
-        context.update(updates)
-        cookie = Cookie('draco-authtoken', context['token'],
-                        expires=expire_date, path='/', secure=self.m_secure)
-        self.m_response.set_cookie(cookie)
+        if needs_touch(context['expire_date'], self.m_timeout,
+                       self.m_touch_fraction, now):
+            updates = {}  # batch updates
+            updates['last_used'] = now
+            expire_date = now + datetime.timedelta(seconds=self.m_timeout)
+            updates['expire_date'] = expire_date
+            context.update(updates)
+            cookie = Cookie('draco-authtoken', context['token'],
+                            expires=expire_date, path='/',
+                            secure=self.m_secure)
+            self.m_response.set_cookie(cookie)
         self.m_context = context
         return True
 
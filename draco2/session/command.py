@@ -13,7 +13,7 @@
 
 from draco2.util.timezone import GMT, LocalTime
 from draco2.util.http import rfc1123_datetime
-from draco2.core.model import Session
+from draco2.session.store import create_session_store
 from draco2.command.command import Command
 
 
@@ -38,9 +38,8 @@ class ListSessions(Command):
         parser.set_default('gmt', False)
 
     def run(self, opts, args, api):
-        model = api.models.model('draco')
-        transaction = model.transaction()
-        sessions = transaction.select(Session)
+        store = create_session_store(api)
+        sessions = store.sessions()
         for session in sessions:
             self.write('session: %s, create_date = %s, last_used = %s, ' \
                        'expire_date = %s\n' % (session['id'],
@@ -58,8 +57,9 @@ class ExpireSessions(Command):
 
     def run(self, opts, args, api):
         model = api.models.model('draco')
-        transaction = model.transaction()
-        expired = transaction.expire_sessions()
+        transaction = model.transaction('shared')
+        store = create_session_store(api)
+        expired = store.expire()
         transaction.commit()
         self.write('sessions expired: %s\n' % expired)
 
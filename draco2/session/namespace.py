@@ -11,9 +11,87 @@
 #
 # $Revision: 222 $
 
-from draco2.util.serialize import dumps, loads
+import re
+import threading
+
+from draco2.util.serialize import dumps, loads, compress, decompress
 from draco2.util.namespace import DictNamespace, NamespaceError
-from draco2.core.model import SessionNamespace as SessionNamespaceObject
+from draco2.core.model import ValueName
+from draco2.session.exception import SessionError
+
+
+class NamespaceMetrics(object):
+    """Size metrics for session namespaces.
+
+    Metrics are kept per scope. Scopes that only differ in their
+    subsession are counted together.
+
+    This class is thread safe.
+    """
+
+    re_subsession = re.compile('/[0-9]+$')
+
+    def __init__(self):
+        """Constructor."""
+        self.m_lock = threading.Lock()
+        self.m_scopes = {}
+
+    def _entry(self, scope):
+        """Return the metrics entry for `scope'. Must be called with the
+        lock held."""
+        scope = self.re_subsession.sub('', scope)
+        try:
+            entry = self.m_scopes[scope]
+        except KeyError:
+            entry = { 'loads': 0, 'load_bytes': 0, 'flushes': 0,
+                      'write_bytes': 0, 'max_size': 0 }
+            self.m_scopes[scope] = entry
+        return entry
+
+    def record_load(self, scope, size):
+        """Record that a namespace of `size' bytes was loaded."""
+        self.m_lock.acquire()
+        try:
+            entry = self._entry(scope)
+            entry['loads'] += 1
+            entry['load_bytes'] += size
+            entry['max_size'] = max(entry['max_size'], size)
+        finally:
+            self.m_lock.release()
+
+    def record_flush(self, scope, written, size):
+        """Record that `written' bytes were written to a namespace that
+        has a size of `size' bytes."""
+        self.m_lock.acquire()
+        try:
+            entry = self._entry(scope)
+            entry['flushes'] += 1
+            entry['write_bytes'] += written
+            entry['max_size'] = max(entry['max_size'], size)
+        finally:
+            self.m_lock.release()
+
+    def metrics(self):
+        """Return the metrics as a dictionary indexed by scope."""
+        self.m_lock.acquire()
+        try:
+            result = {}
+            for scope,entry in self.m_scopes.items():
+                result[scope] = entry.copy()
+        finally:
+            self.m_lock.release()
+        return result
+
+    def clear(self):
+        """Clear all metrics."""
+        self.m_lock.acquire()
+        try:
+            self.m_scopes.clear()
+        finally:
+            self.m_lock.release()
+
+
+namespace_metrics = NamespaceMetrics()
 
 
 class SessionNamespace(DictNamespace):
@@ -24,43 +102,102 @@ class SessionNamespace(DictNamespace):
     each with a different scope.
 
     The implementation is load/update/store: when the namespace is
-    instantiated, all data in the database is copied. During a request,
-    updates and deletes are tracked, and at the end of the request these
-    changes are merged (flush()) with the database.
+    instantiated, all data in the session store is copied. During a
+    request, updates and deletes are tracked, and at the end of the
+    request these changes are written back (flush()) to the store.
+
+    Every value is serialized separately, and only values that have
+    changed are written back. Values can be modified in place without
+    the namespace noticing, so flush() compares the serialized values
+    with the ones that were loaded. Because values are serialized
+    separately, objects that are shared between values are not shared
+    anymore after the namespace has been reloaded.
+
+    Values that are larger than the compression threshold are
+    compressed. If the namespace is larger than its maximum size after
+    a flush, a SessionError is raised. Names are stored in a column of
+    limited width, so a NamespaceError is raised for names that are
+    longer than that.
     """
 
-    def __init__(self, session, scope, transaction):
+    c_max_name = ValueName.width
+
+    def __init__(self, session, scope, store, compress=None, max_size=None):
         """Constructor."""
         super(SessionNamespace, self).__init__()
         self.m_session = session
         self.m_scope = scope
-        self.m_transaction = transaction
+        self.m_store = store
+        self.m_compress = compress
+        self.m_max_size = max_size
         self.m_dirty = False
         self._load()
 
     def _load(self):
-        """Load data from the database."""
-        namespace = SessionNamespaceObject()
-        namespace['id'] = self.m_session
-        namespace['scope'] = self.m_scope
-        namespace['data'] = dumps({})
-        # Futher locking is not necessary as the session record has already
-        # been locked.
-        namespace = self.m_transaction.merge(namespace, lock=False)
-        self.m_namespace = namespace
-        data = loads(namespace['data'])
-        self.update(data)
+        """Load data from the session store."""
+        values = self.m_store.load_namespace(self.m_session, self.m_scope)
+        # Empty namespaces are not stored until they are written to.
+        if values is None:
+            values = {}
+        self.m_serialized = {}
+        self.m_sizes = {}
+        for name,data in values.items():
+            serialized = decompress(data)
+            self.m_serialized[name] = serialized
+            self.m_sizes[name] = len(data)
+            super(SessionNamespace, self).__setitem__(name, loads(serialized))
+        namespace_metrics.record_load(self.m_scope, sum(self.m_sizes.values()))
+        self.m_dirty = False
+
+    def size(self):
+        """Return the size of the namespace in the store, in bytes."""
+        return sum(self.m_sizes.values())
 
     def flush(self):
-        """Sync data back to the database."""
-        if not self.m_dirty:
+        """Sync data back to the session store."""
+        # A namespace that was empty and was not modified is still empty.
+        if not self.m_dirty and not self.m_serialized:
+            return
+        serialized = {}
+        sizes = self.m_sizes.copy()
+        updates = {}
+        for name,value in self.iteritems():
+            data = dumps(value)
+            serialized[name] = data
+            if data == self.m_serialized.get(name):
+                continue
+            data = compress(data, self.m_compress)
+            updates[name] = data
+            sizes[name] = len(data)
+        deletes = [ name for name in self.m_serialized if name not in self ]
+        for name in deletes:
+            del sizes[name]
+        if not updates and not deletes:
+            self.m_dirty = False
             return
-        self.m_namespace['data'] = dumps(self.copy())
+        size = sum(sizes.values())
+        if self.m_max_size is not None and size > self.m_max_size:
+            m = 'Session namespace %s exceeds maximum size (%d > %d bytes).'
+            raise SessionError, m % (self.m_scope, size, self.m_max_size)
+        self.m_store.store_namespace(self.m_session, self.m_scope,
+                                     updates, deletes)
+        self.m_serialized = serialized
+        self.m_sizes = sizes
+        self.m_dirty = False
+        written = sum([ len(data) for data in updates.values() ])
+        namespace_metrics.record_flush(self.m_scope, written, size)
+
+    def _check_name(self, key):
+        """Check that `key' can be used as a value name."""
+        if isinstance(key, basestring) and len(key) > self.c_max_name:
+            m = 'Session namespace key too long (%d > %d characters).'
+            raise NamespaceError, m % (len(key), self.c_max_name)
 
     # Override any method that changes the dictionary and set the dirty
     # flag.
 
     def __setitem__(self, key, value):
+        self._check_name(key)
         super(SessionNamespace, self).__setitem__(key, value)
         self.m_dirty = True
 
@@ -69,6 +206,9 @@ class SessionNamespace(DictNamespace):
         self.m_dirty = True
 
     def update(self, data):
+        data = dict(data)
+        for key in data:
+            self._check_name(key)
         super(SessionNamespace, self).update(data)
         self.m_dirty = True
 
@@ -77,6 +217,7 @@ class SessionNamespace(DictNamespace):
         self.m_dirty = True
 
     def setdefault(self, key, value=None):
+        self._check_name(key)
         ret = super(SessionNamespace, self).setdefault(key, value)
         self.m_dirty = True
         return ret
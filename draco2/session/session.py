@@ -16,9 +16,9 @@ import datetime
 import logging
 
 from draco2.util.http import Cookie
+from draco2.util.misc import needs_touch
 from draco2.util.serialize import loads, dumps
 from draco2.util.namespace import DictNamespace
-from draco2.core.model import Session as SessionObject
 from draco2.session.exception import SessionError
 from draco2.session.namespace import SessionNamespace
 from draco2.session.util import dump_sessionid, generate_sessionid
@@ -89,42 +89,49 @@ class Session(object):
     This class represents a single HTTP session.
     """
 
-    def __init__(self, request, response, transaction,
+    def __init__(self, request, response, store,
                  security=None, events=None):
         """Constructor."""
         self.m_session = None
         self.m_sessionid = None
         self.m_request = request
         self.m_response = response
-        self.m_transaction = transaction
+        self.m_store = store
         self.m_security = security
         self.m_events = events
         self.m_namespaces = {}
         self.set_timeout(7200)  # two hours
+        self.set_touch_fraction(0)
+        self.set_optimistic(False)
+        self.set_compress_threshold(None)
+        self.set_max_namespace_size(None)
 
     def load(self, sessionid):
         """Load an existing session."""
         if not sessionid[0]:
             return False
-        # Lock the session. Every session is updated at each request.
-        # Without locking, this would lead to serialization errors (and thus
-        # transaction retries) with every concurrent request. Therefore
-        # better prevent concurrent request (this is the hypothesis, at
-        # least).
-        result = self.m_transaction.select(SessionObject, 'id=%s',
-                                           (sessionid[0],), lock=True)
-        if not result:
+        # Lock the session, unless in optimistic mode. Every session is
+        # updated at each request. Without locking, this would lead to
+        # serialization errors (and thus transaction retries) with every
+        # concurrent request. Therefore better prevent concurrent request
+        # (this is the hypothesis, at least). In optimistic mode, the
+        # store resolves concurrent updates when they are committed.
+        session = self.m_store.load(sessionid[0],
+                                    lock=not self.m_optimistic)
+        if session is None:
             return False
-        session = result[0]
         if not self._check(session):
             return False
         self._update(session)
+        # Fetch all namespaces up front. They are deserialized only when
+        # they are first used.
+        self.m_store.prefetch_namespaces(session['id'])
         self.m_session = session
         self.m_sessionid = sessionid
         return True
 
     def _check(self, session):
-        """Check session object `session'."""
+        """Check session record `session'."""
         logger = logging.getLogger('draco2.session.session')
         # Once a session has been logged in we don't allow it to be used
         # without credentials anymore. The theory is that these sessions
@@ -133,7 +140,7 @@ class Session(object):
         if self.m_security and session['principal'] and \
                 session['principal'] != self.m_security.principal():
             logger.info('Session principal mismatch.')
-            self.m_transaction.delete(session)
+            self.m_store.delete(session['id'])
             return False
         now = datetime.datetime.now()
         if session['expire_date'] <= now:
@@ -142,21 +149,32 @@ class Session(object):
         return True
 
     def _update(self, session):
-        """Update time stamps in session object `session'."""
+        """Update time stamps in session record `session'.
+
+        The time stamps are only updated when the touch fraction of the
+        timeout has passed, or when the principal has changed.
+        """
         updates = {}  # Batch updates
-        updates['principal'] = self.m_security.principal()
+        principal = self.m_security.principal()
+        if principal != session['principal']:
+            updates['principal'] = principal
         now = datetime.datetime.now()
-        updates['last_used'] = now
-        expire_date = now + datetime.timedelta(seconds=self.m_timeout)
-        updates['expire_date'] = expire_date
+        if updates or needs_touch(session['expire_date'], self.m_timeout,
+                                  self.m_touch_fraction, now):
+            updates['last_used'] = now
+            expire_date = now + datetime.timedelta(seconds=self.m_timeout)
+            updates['expire_date'] = expire_date
+            cookie = Cookie('draco-session', session['id'],
+                            expires=expire_date, path='/')
+            self.m_response.set_cookie(cookie)
+        if not updates:
+            return
         session.update(updates)
-        cookie = Cookie('draco-session', session['id'],
-                        expires=expire_date, path='/')
-        self.m_response.set_cookie(cookie)
+        self.m_store.update(session['id'], updates)
 
     def new(self):
         """Create a new session."""
-        session = SessionObject()
+        session = {}
         sessionid = generate_sessionid()
         session['id'] = sessionid[0]
         session['last_subsession'] = sessionid[1]
@@ -166,7 +184,8 @@ class Session(object):
         session['last_used'] = now
         expire_date = now + datetime.timedelta(seconds=self.m_timeout)
         session['expire_date'] = expire_date
-        self.m_transaction.insert(session)
+        session['version'] = 0
+        self.m_store.insert(session)
         value = dump_sessionid((sessionid[0], None))
         cookie = Cookie('draco-session', value, expires=expire_date, path='/')
         self.m_response.set_cookie(cookie)
@@ -177,7 +196,7 @@ class Session(object):
         """Destroy the current session."""
         if not self.m_session:
             return
-        self.m_transaction.delete(self.m_session)
+        self.m_store.delete(self.m_session['id'])
         expired = datetime.datetime(1970, 1, 1)
         cookie = Cookie('draco-session', '', expires=expired, path='/')
         self.m_response.set_cookie(cookie)
@@ -192,6 +211,34 @@ class Session(object):
         """Set the default session timeout. """
         self.m_timeout = timeout
 
+    def set_touch_fraction(self, fraction):
+        """Set the touch fraction to `fraction'.
+
+        The expiration date of a session is extended only when more
+        than this fraction of the timeout has passed since it was last
+        extended. A fraction of 0 extends it on every request.
+        """
+        self.m_touch_fraction = fraction
+
+    def set_optimistic(self, optimistic):
+        """Enable or disable optimistic mode.
+
+        In optimistic mode, sessions are loaded without a lock, so that
+        concurrent requests of the same session run in parallel. Changes
+        are merged when concurrent requests both update the session.
+        """
+        self.m_optimistic = optimistic
+
+    def set_compress_threshold(self, threshold):
+        """Compress namespace values larger than `threshold' bytes. If
+        `threshold' is None, values are not compressed."""
+        self.m_compress_threshold = threshold
+
+    def set_max_namespace_size(self, size):
+        """Set the maximum size of a namespace to `size' bytes. If `size'
+        is None, namespaces are not limited in size."""
+        self.m_max_namespace_size = size
+
     def create_date(self):
         """Return the creation date of this session."""
         if not self.m_session:
@@ -209,6 +256,8 @@ class Session(object):
         subsession = self.m_session['last_subsession'] + 1
         subsession = subsession % sys.maxint
         self.m_session['last_subsession'] = subsession
+        self.m_store.update(self.m_session['id'],
+                            { 'last_subsession': subsession })
         return subsession
 
     def enter_subsession(self, name=None):
@@ -258,7 +307,9 @@ class Session(object):
         try:
             ns = self.m_namespaces[scope]
         except KeyError:
-            ns = SessionNamespace(self.m_session['id'], scope, self.m_transaction)
+            ns = SessionNamespace(self.m_session['id'], scope, self.m_store,
+                                  self.m_compress_threshold,
+                                  self.m_max_namespace_size)
             self.m_namespaces[scope] = ns
         return ns
 
@@ -274,11 +325,19 @@ class Session(object):
 
     def commit(self):
         """Commit the session (flushes namespaces)."""
-        if not self.m_session:
-            raise SessionError, 'Session not initialized.'
-        for ns in self.m_namespaces.values():
-            ns.flush()
+        try:
+            if self.m_session:
+                for ns in self.m_namespaces.values():
+                    ns.flush()
+            self.m_namespaces.clear()
+            self.m_store.commit()
+        finally:
+            self.m_store.release()
+
+    def _finalize(self):
+        """Release the session locks without committing."""
         self.m_namespaces.clear()
+        self.m_store.release()
 
 
 class DummySession(SessionInterface):
@@ -377,3 +436,6 @@ class DummySession(SessionInterface):
 
     def commit(self):
         """Commit the session (flushes namespaces)."""
+
+    def _finalize(self):
+        """Release the session locks without committing."""
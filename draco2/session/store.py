@@ -0,0 +1,805 @@
+# vi: ts=8 sts=4 sw=4 et
+#
+# store.py: session stores
+#
+# This file is part of Draco2. Draco2 is free software and is made available
+# under the MIT license. Consult the file "LICENSE" that is distributed
+# together with this file for the exact licensing terms.
+#
+# Draco2 is copyright (c) 1999-2007 by the Draco2 authors. See the file
+# "AUTHORS" for a complete overview.
+#
+# $Revision: $
+
+import os
+import os.path
+import errno
+import tempfile
+import logging
+import datetime
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from draco2.util.singleton import singleton
+from draco2.util.serialize import dumps, loads
+from draco2.core.model import Session as SessionObject
+from draco2.core.model import SessionNamespace as SessionNamespaceObject
+from draco2.session.exception import SessionError
+from draco2.session.util import isbasesession
+
+
+session_fields = ('id', 'last_subsession', 'principal', 'create_date',
+                  'last_used', 'expire_date', 'version')
+
+
+def merge_updates(current, updates):
+    """Merge the updates `updates' to a session record with the record
+    `current' that was written by a concurrent request.
+
+    Time stamps and the last subsession only move forward. For other
+    fields the update wins.
+    """
+    merged = {}
+    for key,value in updates.items():
+        if key in ('last_subsession', 'last_used', 'expire_date'):
+            value = max(value, current[key])
+        merged[key] = value
+    return merged
+
+
+class SessionStore(object):
+    """Base class for session stores.
+
+    A session store stores session records and session namespaces. A
+    session record is a dictionary with the keys in `session_fields'.
+    A namespace is stored as a set of values, each serialized to a
+    string, so that a change to a single value can be written without
+    rewriting the whole namespace.
+
+    Sessions are locked against concurrent use by load(). Changes are
+    made durable by commit(), which also releases the locks that are
+    held by the current request.
+
+    A session can also be loaded without a lock. In that case commit()
+    writes the changes only if the version of the session has not
+    changed since it was loaded. If it has, the changes are merged
+    into the current version: record updates with merge_updates(), and
+    namespace values by replacing the values that were written.
+    """
+
+    @classmethod
+    def _create(cls, api):
+        """Factory method."""
+        raise NotImplementedError
+
+    def load(self, sessionid, lock=True):
+        """Load the session record for `sessionid'.
+
+        If `lock' is true, the session is locked until commit() or
+        release() is called. Otherwise, changes are written optimistically
+        at commit(). The return value is None if there is no such
+        session.
+        """
+        raise NotImplementedError
+
+    def insert(self, record):
+        """Insert the new session record `record'."""
+        raise NotImplementedError
+
+    def update(self, sessionid, values):
+        """Update the session record for `sessionid' with `values'."""
+        raise NotImplementedError
+
+    def delete(self, sessionid):
+        """Delete the session `sessionid' and its namespaces."""
+        raise NotImplementedError
+
+    def prefetch_namespaces(self, sessionid):
+        """Load all namespaces of session `sessionid' at once, so that
+        load_namespace() can be served without accessing the store."""
+
+    def load_namespace(self, sessionid, scope):
+        """Return the values of namespace `scope' in session `sessionid'
+        as a dictionary of serialized values, or None if the namespace
+        does not exist."""
+        raise NotImplementedError
+
+    def store_namespace(self, sessionid, scope, updates, deletes):
+        """Update namespace `scope' in session `sessionid'.
+
+        The `updates' argument is a dictionary of serialized values to
+        store, and `deletes' a list of the names of values to delete.
+        The changes are written at commit().
+        """
+        raise NotImplementedError
+
+    def commit(self):
+        """Make all changes durable and release all locks."""
+        raise NotImplementedError
+
+    def release(self):
+        """Release all locks, discarding changes that were not yet
+        committed."""
+        raise NotImplementedError
+
+    def sessions(self):
+        """Return a list of all session records."""
+        raise NotImplementedError
+
+    def expire(self):
+        """Remove all expired sessions. Returns the number of sessions
+        removed."""
+        raise NotImplementedError
+
+
+class DatabaseSessionStore(SessionStore):
+    """Session store that uses the `session' and `session_namespace'
+    tables of the Draco model.
+
+    Locking and durability are provided by the transaction, which is
+    committed by the caller. Session updates and namespace writes are
+    collected and are written in bulk by commit(). The session row is
+    updated with a compare-and-swap on its version.
+
+    Transactions run at the serializable isolation level. Under that
+    level, an update to a session that was changed by a concurrent
+    request since the transaction started does not match zero rows but
+    fails with a serialization error. commit() therefore writes all
+    changes as a single unit with retry(), which rolls back, replays the
+    object cache and then runs the writes again in a new snapshot. In
+    that snapshot the compare-and-swap sees the new version and the
+    changes are merged. Statements that were issued directly on the
+    cursor of the transaction before commit() are not replayed.
+    """
+
+    c_max_retries = 10
+
+    def __init__(self, transaction):
+        """Constructor."""
+        self.m_transaction = transaction
+        self.m_sessions = {}
+        self.m_namespaces = {}
+        self.m_prefetched = set()
+        self.m_updates = {}
+        self.m_pending = {}
+
+    @classmethod
+    def _create(cls, api):
+        """Factory method."""
+        transaction = api.models.model('draco').transaction('shared')
+        store = cls(transaction)
+        return store
+
+    def _record(self, session):
+        """Return a record for session object `session'."""
+        record = {}
+        for key in session_fields:
+            record[key] = session[key]
+        return record
+
+    def load(self, sessionid, lock=True):
+        """Load the session record for `sessionid'."""
+        result = self.m_transaction.select(SessionObject, 'id=%s',
+                                           (sessionid,), lock=lock)
+        if not result:
+            return
+        session = result[0]
+        self.m_sessions[sessionid] = session
+        return self._record(session)
+
+    def insert(self, record):
+        """Insert the new session record `record'."""
+        session = SessionObject()
+        session.update(record)
+        self.m_transaction.insert(session)
+        self.m_sessions[record['id']] = session
+        # A new session does not have namespaces yet.
+        self.m_prefetched.add(record['id'])
+
+    def update(self, sessionid, values):
+        """Update the session record for `sessionid' with `values'."""
+        if sessionid not in self.m_sessions:
+            raise SessionError, 'Session not loaded.'
+        self.m_updates.setdefault(sessionid, {}).update(values)
+
+    def delete(self, sessionid):
+        """Delete the session `sessionid' and its namespaces."""
+        namespaces = self.m_transaction.select(SessionNamespaceObject,
+                                               'id=%s', (sessionid,))
+        for ns in namespaces:
+            self.m_transaction.delete(ns)
+        session = self.m_sessions.pop(sessionid)
+        self.m_transaction.delete(session)
+        for key in self.m_namespaces.keys():
+            if key[0] == sessionid:
+                del self.m_namespaces[key]
+        self.m_prefetched.discard(sessionid)
+        self.m_updates.pop(sessionid, None)
+        self.m_pending.pop(sessionid, None)
+
+    def prefetch_namespaces(self, sessionid):
+        """Load all namespaces of session `sessionid' in one query."""
+        for key in self.m_namespaces.keys():
+            if key[0] == sessionid:
+                del self.m_namespaces[key]
+        result = self.m_transaction.select(SessionNamespaceObject,
+                                           'id=%s', (sessionid,))
+        for value in result:
+            key = (sessionid, value['scope'])
+            namespace = self.m_namespaces.setdefault(key, {})
+            namespace[value['name']] = value['data']
+        self.m_prefetched.add(sessionid)
+
+    def load_namespace(self, sessionid, scope):
+        """Return the values of namespace `scope'."""
+        try:
+            return dict(self.m_namespaces[(sessionid, scope)])
+        except KeyError:
+            pass
+        if sessionid in self.m_prefetched:
+            return
+        result = self.m_transaction.select(SessionNamespaceObject,
+                                           'id=%s AND scope=%s',
+                                           (sessionid, scope))
+        if not result:
+            return
+        namespace = {}
+        for value in result:
+            namespace[value['name']] = value['data']
+        self.m_namespaces[(sessionid, scope)] = namespace
+        return dict(namespace)
+
+    def store_namespace(self, sessionid, scope, updates, deletes):
+        """Update namespace `scope' in session `sessionid'."""
+        pending = self.m_pending.setdefault(sessionid, {})
+        for name,data in updates.items():
+            pending[(scope, name)] = data
+        for name in deletes:
+            pending[(scope, name)] = None
+
+    def _write_namespaces(self, sessionid, pending):
+        """Write the pending namespace changes `pending' of session
+        `sessionid'."""
+        # We need to know which values exist.
+        if sessionid not in self.m_prefetched:
+            self.prefetch_namespaces(sessionid)
+        updates = {}
+        inserts = {}
+        deletes = []
+        for key,data in pending.items():
+            namespace = self.m_namespaces.get((sessionid, key[0]), {})
+            exists = key[1] in namespace
+            if data is None:
+                if exists:
+                    deletes.append(key)
+            elif exists:
+                updates[key] = data
+            else:
+                inserts[key] = data
+        if updates or inserts or deletes:
+            self.m_transaction.write_session_namespaces(sessionid, updates,
+                                                        inserts, deletes)
+
+    def _write_session(self, sessionid):
+        """Write the changes to session `sessionid'.
+
+        The return value is False if the session was deleted by a
+        concurrent request. This must be called from within retry():
+        a concurrent update is reported as a serialization error and
+        is detected here only after the transaction has been replayed.
+        """
+        session = self.m_sessions.get(sessionid)
+        if session is None:
+            return True
+        updates = self.m_updates.get(sessionid, {})
+        version = session['version']
+        logger = logging.getLogger('draco2.session.store')
+        for i in range(self.c_max_retries):
+            if self.m_transaction.update_session(sessionid, version, updates):
+                return True
+            current = self.m_transaction.load_session(sessionid)
+            if current is None:
+                return False
+            logger.debug('Merging concurrent update to session %s.'
+                         % sessionid)
+            updates = merge_updates(current, updates)
+            version = current['version']
+            # Namespace values may have been created concurrently.
+            self.m_prefetched.discard(sessionid)
+        raise SessionError, 'Could not update session %s.' % sessionid
+
+    def commit(self):
+        """Make all changes durable and release all locks."""
+        # The transaction is committed by the request handler.
+        try:
+            sessionids = set(self.m_updates) | set(self.m_pending)
+            if sessionids:
+                self.m_transaction.retry(self._write, sessionids, [])
+        finally:
+            self.release()
+
+    def _write(self, sessionids, attempts):
+        """Write the changes to the sessions in `sessionids'.
+
+        The `attempts' argument is a list that records the calls to this
+        method. When the writes are replayed, the namespace values that
+        exist are loaded again, as values may have been inserted by a
+        concurrent request.
+        """
+        if attempts:
+            self.m_prefetched.difference_update(sessionids)
+        attempts.append(True)
+        for sessionid in sessionids:
+            if not self._write_session(sessionid):
+                continue
+            pending = self.m_pending.get(sessionid)
+            if pending:
+                self._write_namespaces(sessionid, pending)
+
+    def release(self):
+        """Release all locks."""
+        self.m_sessions.clear()
+        self.m_namespaces.clear()
+        self.m_prefetched.clear()
+        self.m_updates.clear()
+        self.m_pending.clear()
+
+    def sessions(self):
+        """Return a list of all session records."""
+        sessions = self.m_transaction.select(SessionObject)
+        return [ self._record(session) for session in sessions ]
+
+    def expire(self):
+        """Remove all expired sessions."""
+        return self.m_transaction.expire_sessions()
+
+
+class _LockTable(object):
+    """A table of locks indexed by key.
+
+    Locks are created on demand and are removed when they are no
+    longer in use.
+    """
+
+    def __init__(self):
+        """Constructor."""
+        self.m_lock = threading.Lock()
+        self.m_locks = {}
+
+    def acquire(self, key):
+        """Acquire the lock for `key'."""
+        self.m_lock.acquire()
+        try:
+            entry = self.m_locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        finally:
+            self.m_lock.release()
+        entry[0].acquire()
+
+    def release(self, key):
+        """Release the lock for `key'."""
+        self.m_lock.acquire()
+        try:
+            entry = self.m_locks[key]
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self.m_locks[key]
+        finally:
+            self.m_lock.release()
+        entry[0].release()
+
+
+def _update_namespaces(namespaces, scope, changes):
+    """Apply the changes `changes' to namespace `scope' in the
+    dictionary of namespaces `namespaces'.
+
+    The `changes' argument maps value names to serialized values, or to
+    None for values that are deleted. The namespace is copied, because it
+    may be shared with the stored version of the session.
+    """
+    namespace = dict(namespaces.get(scope, {}))
+    for name,data in changes.items():
+        if data is None:
+            namespace.pop(name, None)
+        else:
+            namespace[name] = data
+    if namespace:
+        namespaces[scope] = namespace
+    else:
+        namespaces.pop(scope, None)
+
+
+class _SessionState(object):
+    """The state of a session in a local session store."""
+
+    def __init__(self, record, namespaces, locked):
+        """Constructor."""
+        self.record = record
+        self.namespaces = namespaces
+        self.locked = locked
+        self.updates = {}
+        self.changed = {}
+        self.dirty = False
+        self.deleted = False
+
+
+class LocalSessionStore(SessionStore):
+    """Base class for session stores that keep sessions on the local
+    host.
+
+    Changes are collected per thread and are written out at commit().
+    Subclasses implement the storage and the per-session locks.
+
+    This class is thread safe.
+    """
+
+    def __init__(self):
+        """Constructor."""
+        self.m_local = threading.local()
+
+    def _lock(self, sessionid):
+        """Lock session `sessionid'."""
+        raise NotImplementedError
+
+    def _unlock(self, sessionid):
+        """Unlock session `sessionid'."""
+        raise NotImplementedError
+
+    def _read(self, sessionid):
+        """Read session `sessionid'. Returns a (record, namespaces)
+        tuple, or None if the session does not exist."""
+        raise NotImplementedError
+
+    def _write(self, sessionid, record, namespaces):
+        """Write session `sessionid'."""
+        raise NotImplementedError
+
+    def _remove(self, sessionid):
+        """Remove session `sessionid'."""
+        raise NotImplementedError
+
+    def _list(self):
+        """Return a list of session ids."""
+        raise NotImplementedError
+
+    def _states(self):
+        """Return the session states of the current thread."""
+        try:
+            states = self.m_local.states
+        except AttributeError:
+            states = self.m_local.states = {}
+        return states
+
+    def _state(self, sessionid):
+        """Return the state of session `sessionid'."""
+        try:
+            state = self._states()[sessionid]
+        except KeyError:
+            raise SessionError, 'Session not loaded.'
+        return state
+
+    def load(self, sessionid, lock=True):
+        """Load the session record for `sessionid'."""
+        states = self._states()
+        state = states.get(sessionid)
+        locked = state is not None and state.locked
+        acquired = lock and not locked
+        if acquired:
+            self._lock(sessionid)
+            locked = True
+        try:
+            result = self._read(sessionid)
+        except:
+            if acquired:
+                self._unlock(sessionid)
+            raise
+        if result is None:
+            if locked:
+                self._unlock(sessionid)
+            states.pop(sessionid, None)
+            return
+        record, namespaces = result
+        states[sessionid] = _SessionState(record, namespaces, locked)
+        return dict(record)
+
+    def insert(self, record):
+        """Insert the new session record `record'."""
+        sessionid = record['id']
+        self._lock(sessionid)
+        state = _SessionState(dict(record), {}, True)
+        state.dirty = True
+        self._states()[sessionid] = state
+
+    def update(self, sessionid, values):
+        """Update the session record for `sessionid' with `values'."""
+        state = self._state(sessionid)
+        state.record.update(values)
+        state.updates.update(values)
+        state.dirty = True
+
+    def delete(self, sessionid):
+        """Delete the session `sessionid' and its namespaces."""
+        state = self._state(sessionid)
+        state.deleted = True
+
+    def load_namespace(self, sessionid, scope):
+        """Return the values of namespace `scope'."""
+        state = self._state(sessionid)
+        namespace = state.namespaces.get(scope)
+        if namespace is not None:
+            return dict(namespace)
+
+    def store_namespace(self, sessionid, scope, updates, deletes):
+        """Update namespace `scope' in session `sessionid'."""
+        state = self._state(sessionid)
+        changes = dict(updates)
+        for name in deletes:
+            changes[name] = None
+        _update_namespaces(state.namespaces, scope, changes)
+        for name,data in changes.items():
+            state.changed[(scope, name)] = data
+        state.dirty = True
+
+    def _commit(self, sessionid, state):
+        """Write the changes in `state' to session `sessionid'."""
+        if not state.deleted and not state.dirty:
+            return
+        if not state.locked:
+            # Optimistic mode: the lock is held only while writing.
+            self._lock(sessionid)
+            state.locked = True
+            result = self._read(sessionid)
+            if result is None:
+                return  # deleted concurrently
+            record, namespaces = result
+            if record.get('version', 0) != state.record.get('version', 0):
+                logger = logging.getLogger('draco2.session.store')
+                logger.debug('Merging concurrent update to session %s.'
+                             % sessionid)
+                record.update(merge_updates(record, state.updates))
+                for key,data in state.changed.items():
+                    _update_namespaces(namespaces, key[0], { key[1]: data })
+                state.record, state.namespaces = record, namespaces
+        if state.deleted:
+            self._remove(sessionid)
+            return
+        record = state.record
+        record['version'] = record.get('version', 0) + 1
+        self._write(sessionid, record, state.namespaces)
+
+    def commit(self):
+        """Make all changes durable and release all locks."""
+        states = self._states()
+        try:
+            for sessionid,state in states.items():
+                self._commit(sessionid, state)
+        finally:
+            self.release()
+
+    def release(self):
+        """Release all locks."""
+        states = self._states()
+        for sessionid,state in states.items():
+            if state.locked:
+                self._unlock(sessionid)
+        states.clear()
+
+    def sessions(self):
+        """Return a list of all session records."""
+        records = []
+        for sessionid in self._list():
+            result = self._read(sessionid)
+            if result is not None:
+                records.append(result[0])
+        return records
+
+    def expire(self):
+        """Remove all expired sessions."""
+        now = datetime.datetime.now()
+        count = 0
+        for sessionid in self._list():
+            self._lock(sessionid)
+            try:
+                result = self._read(sessionid)
+                if result is not None and result[0]['expire_date'] < now:
+                    self._remove(sessionid)
+                    count += 1
+            finally:
+                self._unlock(sessionid)
+        return count
+
+
+class MemorySessionStore(LocalSessionStore):
+    """Session store that keeps sessions in memory.
+
+    Sessions are not shared between processes and are lost when the
+    process exits. This store is suitable for single process deployments
+    only.
+    """
+
+    def __init__(self):
+        """Constructor."""
+        super(MemorySessionStore, self).__init__()
+        self.m_locks = _LockTable()
+        self.m_sessions = {}
+
+    @classmethod
+    def _create(cls, api):
+        """Factory method."""
+        store = cls()
+        return store
+
+    def _lock(self, sessionid):
+        self.m_locks.acquire(sessionid)
+
+    def _unlock(self, sessionid):
+        self.m_locks.release(sessionid)
+
+    def _read(self, sessionid):
+        try:
+            record, namespaces = self.m_sessions[sessionid]
+        except KeyError:
+            return
+        return (dict(record), dict(namespaces))
+
+    def _write(self, sessionid, record, namespaces):
+        self.m_sessions[sessionid] = (dict(record), dict(namespaces))
+
+    def _remove(self, sessionid):
+        self.m_sessions.pop(sessionid, None)
+
+    def _list(self):
+        return self.m_sessions.keys()
+
+
+class FileSessionStore(LocalSessionStore):
+    """Session store that keeps every session in a file in a local
+    directory.
+
+    Sessions are locked with a lock file per session, and session files
+    are replaced atomically. This store can be shared by multiple
+    processes on a single host. It requires the `fcntl' module and is
+    therefore not available on Windows.
+    """
+
+    def __init__(self, directory):
+        """Constructor."""
+        if fcntl is None:
+            m = 'The file session store requires the fcntl module.'
+            raise SessionError, m
+        super(FileSessionStore, self).__init__()
+        self.m_directory = directory
+        self.m_locks = _LockTable()
+        self.m_lockfiles = {}
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    @classmethod
+    def _create(cls, api):
+        """Factory method."""
+        config = api.config.ns('draco2.draco.session')
+        datadir = api.config.ns('draco2')['datadirectory']
+        directory = config.get('storedirectory', 'sessions')
+        directory = os.path.join(datadir, directory)
+        store = cls(directory)
+        return store
+
+    def directory(self):
+        """Return the directory where sessions are stored."""
+        return self.m_directory
+
+    def _filename(self, sessionid):
+        """Return the file name for session `sessionid'."""
+        if not isbasesession(sessionid):
+            raise SessionError, 'Illegal session id: %s' % sessionid
+        return os.path.join(self.m_directory, sessionid)
+
+    def _lock(self, sessionid):
+        fname = self._filename(sessionid) + '.lock'
+        # The in-process lock serializes threads, the lock file
+        # serializes processes.
+        self.m_locks.acquire(sessionid)
+        try:
+            while True:
+                fout = file(fname, 'a')
+                try:
+                    fcntl.lockf(fout.fileno(), fcntl.LOCK_EX)
+                    # The lock file may have been removed by _remove()
+                    # while we were waiting for it. In that case the
+                    # lock is on an unlinked file and we need to retry.
+                    st = os.fstat(fout.fileno())
+                    try:
+                        current = os.stat(fname)
+                    except OSError, err:
+                        if err.errno != errno.ENOENT:
+                            raise
+                        current = None
+                except:
+                    fout.close()
+                    raise
+                if current is not None and current.st_ino == st.st_ino:
+                    break
+                fout.close()
+        except:
+            self.m_locks.release(sessionid)
+            raise
+        self.m_lockfiles[sessionid] = fout
+
+    def _unlock(self, sessionid):
+        fout = self.m_lockfiles.pop(sessionid, None)
+        try:
+            if fout is not None:
+                fcntl.lockf(fout.fileno(), fcntl.LOCK_UN)
+                fout.close()
+        finally:
+            self.m_locks.release(sessionid)
+
+    def _read(self, sessionid):
+        fname = self._filename(sessionid)
+        try:
+            fin = file(fname, 'rb')
+        except IOError, err:
+            if err.errno == errno.ENOENT:
+                return
+            raise
+        try:
+            data = fin.read()
+        finally:
+            fin.close()
+        record, namespaces = loads(data)
+        return (record, namespaces)
+
+    def _write(self, sessionid, record, namespaces):
+        fname = self._filename(sessionid)
+        fd, tmpname = tempfile.mkstemp(dir=self.m_directory, suffix='.tmp')
+        fout = os.fdopen(fd, 'wb')
+        try:
+            fout.write(dumps((record, namespaces)))
+        finally:
+            fout.close()
+        try:
+            os.rename(tmpname, fname)
+        except OSError:
+            # Windows does not allow renaming over an existing file.
+            os.remove(fname)
+            os.rename(tmpname, fname)
+
+    def _remove(self, sessionid):
+        # The lock file is removed while it is locked. Processes that are
+        # waiting for it notice this in _lock().
+        fname = self._filename(sessionid)
+        for name in (fname, fname + '.lock'):
+            try:
+                os.remove(name)
+            except OSError, err:
+                if err.errno != errno.ENOENT:
+                    raise
+
+    def _list(self):
+        return [ name for name in os.listdir(self.m_directory)
+                 if isbasesession(name) ]
+
+
+def create_session_store(api):
+    """Create the session store that is configured for `api'.
+
+    The database store is created per request. The memory and file
+    stores are shared by all requests in a process.
+    """
+    config = api.config.ns('draco2.draco.session')
+    name = config.get('store', 'database')
+    if name == 'database':
+        store = DatabaseSessionStore._create(api)
+    elif name == 'memory':
+        store = singleton(MemorySessionStore, api,
+                          factory=MemorySessionStore._create)
+    elif name == 'file':
+        store = singleton(FileSessionStore, api,
+                          factory=FileSessionStore._create)
+    else:
+        raise SessionError, 'Unknown session store: %s' % name
+    return store
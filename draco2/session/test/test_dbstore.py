@@ -0,0 +1,100 @@
+# vi: ts=8 sts=4 sw=4 et
+#
+# test_dbstore.py: database session store tests
+#
+# This file is part of Draco2. Draco2 is free software and is made available
+# under the MIT license. Consult the file "LICENSE" that is distributed
+# together with this file for the exact licensing terms.
+#
+# Draco2 is copyright (c) 1999-2007 by the Draco2 authors. See the file
+# "AUTHORS" for a complete overview.
+#
+# $Revision: $
+
+import datetime
+
+from draco2.core.model import DracoModel
+from draco2.session.store import DatabaseSessionStore
+from draco2.database.test.support import DatabaseTest
+
+
+class TestDatabaseSessionStore(DatabaseTest):
+
+    def setup_method(self, method):
+        super(TestDatabaseSessionStore, self).setup_method(method)
+        self.model = DracoModel(self.database)
+        self.schema = self.model.schema()
+        self.schema.drop()
+        self.schema.create()
+        now = datetime.datetime.now()
+        self.record = { 'id': 'sessionid', 'last_subsession': 0,
+                        'principal': None, 'create_date': now,
+                        'last_used': now, 'version': 0,
+                        'expire_date': now + datetime.timedelta(seconds=60) }
+        transaction = self.model.transaction()
+        store = DatabaseSessionStore(transaction)
+        store.insert(self.record)
+        store.store_namespace('sessionid', 'scope', { 'key': 'value' }, [])
+        store.commit()
+        transaction.commit()
+
+    def teardown_method(self, method):
+        self.schema.drop()
+        super(TestDatabaseSessionStore, self).teardown_method(method)
+
+    def test_optimistic(self):
+        transaction1 = self.model.transaction()
+        transaction2 = self.model.transaction()
+        store1 = DatabaseSessionStore(transaction1)
+        store2 = DatabaseSessionStore(transaction2)
+        # Both transactions take their snapshot before either commits.
+        assert store1.load('sessionid', lock=False)['version'] == 1
+        assert store2.load('sessionid', lock=False)['version'] == 1
+        later = self.record['expire_date'] + datetime.timedelta(seconds=60)
+        store1.update('sessionid', { 'expire_date': later,
+                                     'last_subsession': 2 })
+        store1.store_namespace('sessionid', 'scope',
+                               { 'key1': 'value1' }, ['key'])
+        store1.commit()
+        transaction1.commit()
+        # The update by the second transaction conflicts with the first
+        # and is replayed and merged.
+        store2.update('sessionid', { 'expire_date': self.record['expire_date'],
+                                     'last_subsession': 1,
+                                     'principal': 'user' })
+        store2.store_namespace('sessionid', 'scope',
+                               { 'key1': 'value2', 'key2': 'value3' }, [])
+        store2.commit()
+        transaction2.commit()
+        transaction = self.model.transaction()
+        store = DatabaseSessionStore(transaction)
+        record = store.load('sessionid')
+        assert record['version'] == 3
+        assert record['expire_date'] == later
+        assert record['last_subsession'] == 2
+        assert record['principal'] == 'user'
+        assert store.load_namespace('sessionid', 'scope') == \
+                { 'key1': 'value2', 'key2': 'value3' }
+        store.release()
+        transaction.commit()
+
+    def test_insert_conflict(self):
+        transaction1 = self.model.transaction()
+        transaction2 = self.model.transaction()
+        store1 = DatabaseSessionStore(transaction1)
+        store2 = DatabaseSessionStore(transaction2)
+        store2.prefetch_namespaces('sessionid')
+        store1.store_namespace('sessionid', 'scope', { 'key1': 'value1' }, [])
+        store1.commit()
+        transaction1.commit()
+        # The value does not exist in the snapshot of the second
+        # transaction. Its insert fails and is replayed as an update.
+        store2.store_namespace('sessionid', 'scope', { 'key1': 'value2' }, [])
+        store2.commit()
+        transaction2.commit()
+        transaction = self.model.transaction()
+        store = DatabaseSessionStore(transaction)
+        assert store.load_namespace('sessionid', 'scope') == \
+                { 'key': 'value', 'key1': 'value2' }
+        store.release()
+        transaction.commit()
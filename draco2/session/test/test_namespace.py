@@ -17,6 +17,7 @@ import py.test
 
 from draco2.core.model import DracoModel
 from draco2.session.namespace import SessionNamespace, NamespaceError
+from draco2.session.store import DatabaseSessionStore
 from draco2.database.test.support import DatabaseTest, random_data
 
 
@@ -47,8 +48,9 @@ class TestNamespace(DatabaseTest):
         self.schema.drop()
         self.schema.create()
         self.transaction = self.model.transaction()
+        self.store = DatabaseSessionStore(self.transaction)
         self.namespace = SessionNamespace('sessionid', 'myscope',
-                                          self.transaction)
+                                          self.store)
 
     def teardown_method(self, method):
         self.transaction.commit()
@@ -58,7 +60,7 @@ class TestNamespace(DatabaseTest):
     def test_simple(self):
         ns = self.namespace
         ns['key'] = 'value'
-        ns.flush(); ns._load()
+        ns.flush(); self.store.commit(); ns._load()
         assert ns['key'] == 'value'
  
     def test_types(self):
@@ -82,7 +84,7 @@ class TestNamespace(DatabaseTest):
         data.append(NewStyleClass())
         for i,val in enumerate(data):
             ns['key_%d' % i] = val
-        ns.flush(); ns._load()
+        ns.flush(); self.store.commit(); ns._load()
         for i,val in enumerate(data):
             assert ns['key_%d' % i] == val
 
@@ -94,6 +96,6 @@ class TestNamespace(DatabaseTest):
             data.append(blob)
         for i,val in enumerate(data):
             ns['key_%d' % i] = val
-        ns.flush(); ns._load()
+        ns.flush(); self.store.commit(); ns._load()
         for i,val in enumerate(data):
             assert ns['key_%d' % i] == val
@@ -0,0 +1,593 @@
+# vi: ts=8 sts=4 sw=4 et
+#
+# test_store.py: unit tests for draco2.session.store
+#
+# This file is part of Draco2. Draco2 is free software and is made available
+# under the MIT license. Consult the file "LICENSE" that is distributed
+# together with this file for the exact licensing terms.
+#
+# Draco2 is copyright (c) 1999-2007 by the Draco2 authors. See the file
+# "AUTHORS" for a complete overview.
+#
+# $Revision: $
+
+import os
+import time
+import shutil
+import tempfile
+import datetime
+import threading
+
+from draco2.session import store as store_module
+from draco2.session.store import (DatabaseSessionStore, MemorySessionStore,
+                                  FileSessionStore)
+from draco2.session.session import Session
+from draco2.session.namespace import (SessionNamespace, NamespaceError,
+                                      namespace_metrics)
+from draco2.session.exception import SessionError
+from draco2.util.serialize import dumps, compressed_marker
+from draco2.session.util import generate_basesession
+
+
+def make_record(timeout=3600):
+    now = datetime.datetime.now()
+    record = { 'id': generate_basesession(), 'last_subsession': 0,
+               'principal': None, 'create_date': now, 'last_used': now,
+               'expire_date': now + datetime.timedelta(seconds=timeout) }
+    return record
+
+
+class StoreTest(object):
+
+    def create_store(self):
+        raise NotImplementedError
+
+    def test_insert(self):
+        store = self.create_store()
+        record = make_record()
+        store.insert(record)
+        store.store_namespace(record['id'], 'scope', { 'key': 'data' }, [])
+        store.commit()
+        loaded = store.load(record['id'])
+        assert loaded.pop('version') == 1
+        assert loaded == record
+        assert store.load_namespace(record['id'], 'scope') == \
+                { 'key': 'data' }
+        assert store.load_namespace(record['id'], 'other') is None
+        store.commit()
+
+    def test_unknown(self):
+        store = self.create_store()
+        assert store.load(generate_basesession()) is None
+        store.commit()
+
+    def test_update(self):
+        store = self.create_store()
+        record = make_record()
+        store.insert(record)
+        store.commit()
+        store.load(record['id'])
+        store.update(record['id'], { 'principal': 'user' })
+        store.commit()
+        assert store.load(record['id'])['principal'] == 'user'
+        store.commit()
+
+    def test_namespace(self):
+        store = self.create_store()
+        record = make_record()
+        store.insert(record)
+        store.store_namespace(record['id'], 'scope',
+                              { 'key1': 'data1', 'key2': 'data2' }, [])
+        store.commit()
+        store.load(record['id'])
+        store.store_namespace(record['id'], 'scope', { 'key1': 'x1' },
+                              ['key2'])
+        store.commit()
+        store.load(record['id'])
+        assert store.load_namespace(record['id'], 'scope') == \
+                { 'key1': 'x1' }
+        store.store_namespace(record['id'], 'scope', {}, ['key1'])
+        store.commit()
+        store.load(record['id'])
+        assert store.load_namespace(record['id'], 'scope') is None
+        store.commit()
+
+    def test_release(self):
+        store = self.create_store()
+        record = make_record()
+        store.insert(record)
+        store.commit()
+        store.load(record['id'])
+        store.update(record['id'], { 'principal': 'user' })
+        store.release()
+        assert store.load(record['id'])['principal'] is None
+        store.commit()
+
+    def test_delete(self):
+        store = self.create_store()
+        record = make_record()
+        store.insert(record)
+        store.commit()
+        store.load(record['id'])
+        store.delete(record['id'])
+        store.commit()
+        assert store.load(record['id']) is None
+        store.commit()
+
+    def test_lock(self):
+        store = self.create_store()
+        record = make_record()
+        store.insert(record)
+        store.commit()
+        store.load(record['id'])
+        result = []
+        def load():
+            result.append(store.load(record['id']))
+            store.commit()
+        thread = threading.Thread(target=load)
+        thread.start()
+        time.sleep(0.1)
+        assert not result
+        store.update(record['id'], { 'principal': 'user' })
+        store.commit()
+        thread.join()
+        assert result[0]['principal'] == 'user'
+
+    def test_unlocked(self):
+        store = self.create_store()
+        record = make_record()
+        store.insert(record)
+        store.commit()
+        store.load(record['id'])
+        result = []
+        def load():
+            result.append(store.load(record['id'], lock=False))
+            store.commit()
+        thread = threading.Thread(target=load)
+        thread.start()
+        thread.join(5)
+        assert result
+        store.commit()
+
+    def test_expire(self):
+        store = self.create_store()
+        expired = make_record(-10)
+        active = make_record()
+        store.insert(expired)
+        store.insert(active)
+        store.commit()
+        assert len(store.sessions()) == 2
+        assert store.expire() == 1
+        assert store.load(expired['id']) is None
+        assert store.load(active['id']) is not None
+        store.commit()
+
+
+class TestMemorySessionStore(StoreTest):
+
+    def create_store(self):
+        return MemorySessionStore()
+
+
+class TestFileSessionStore(StoreTest):
+
+    def setup_method(self, method):
+        self.directory = tempfile.mkdtemp()
+
+    def teardown_method(self, method):
+        shutil.rmtree(self.directory)
+
+    def create_store(self):
+        return FileSessionStore(self.directory)
+
+    def test_shared(self):
+        store1 = self.create_store()
+        store2 = self.create_store()
+        record = make_record()
+        store1.insert(record)
+        store1.store_namespace(record['id'], 'scope', { 'key': 'data' }, [])
+        store1.commit()
+        loaded = store2.load(record['id'])
+        del loaded['version']
+        assert loaded == record
+        assert store2.load_namespace(record['id'], 'scope') == \
+                { 'key': 'data' }
+        store2.commit()
+
+    def test_optimistic(self):
+        store1 = self.create_store()
+        store2 = self.create_store()
+        record = make_record()
+        store1.insert(record)
+        store1.commit()
+        store1.load(record['id'], lock=False)
+        store2.load(record['id'], lock=False)
+        later = record['expire_date'] + datetime.timedelta(seconds=60)
+        store1.update(record['id'], { 'expire_date': later })
+        store1.store_namespace(record['id'], 'scope', { 'key1': 'data1' }, [])
+        store1.commit()
+        store2.update(record['id'], { 'expire_date': record['expire_date'],
+                                      'principal': 'user' })
+        store2.store_namespace(record['id'], 'scope', { 'key2': 'data2' }, [])
+        store2.commit()
+        loaded = store1.load(record['id'])
+        assert loaded['version'] == 3
+        assert loaded['expire_date'] == later
+        assert loaded['principal'] == 'user'
+        assert store1.load_namespace(record['id'], 'scope') == \
+                { 'key1': 'data1', 'key2': 'data2' }
+        store1.commit()
+
+    def test_lock_removed(self):
+        store = self.create_store()
+        record = make_record()
+        sessionid = record['id']
+        store.insert(record)
+        store.commit()
+        store.load(sessionid)
+        fin, fout = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            # Record locks are per process, so this needs a second one.
+            status = 1
+            try:
+                store = self.create_store()
+                store._lock(sessionid)
+                fname = store._filename(sessionid) + '.lock'
+                lockfile = store.m_lockfiles[sessionid]
+                st = os.fstat(lockfile.fileno())
+                if os.path.exists(fname) and \
+                            os.stat(fname).st_ino == st.st_ino:
+                    status = 0
+                store._unlock(sessionid)
+            finally:
+                os.write(fout, str(status))
+                os._exit(0)
+        os.close(fout)
+        time.sleep(0.1)
+        store.delete(sessionid)
+        store.commit()
+        status = os.read(fin, 1)
+        os.close(fin)
+        os.waitpid(pid, 0)
+        assert status == '0'
+
+    def test_no_fcntl(self):
+        fcntl = store_module.fcntl
+        store_module.fcntl = None
+        try:
+            try:
+                self.create_store()
+            except SessionError:
+                pass
+            else:
+                assert False, 'expected SessionError'
+        finally:
+            store_module.fcntl = fcntl
+
+
+class Conflict(Exception):
+    pass
+
+
+class Transaction(object):
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.selects = 0
+        self.writes = []
+        self.versions = []
+        self.current = None
+        self.conflict = None
+
+    def select(self, typ, where=None, args=None, lock=False):
+        self.selects += 1
+        return [ row for row in self.rows if row['id'] == args[0] and
+                 (len(args) == 1 or row['scope'] == args[1]) ]
+
+    def write_session_namespaces(self, sessionid, updates, inserts, deletes):
+        self.writes.append((sessionid, updates, inserts, deletes))
+        if self.conflict is not None:
+            self.rows.append(self.conflict)
+            self.conflict = None
+            raise Conflict
+
+    def update_session(self, sessionid, version, updates):
+        self.versions.append((version, updates))
+        return version == self.current['version']
+
+    def load_session(self, sessionid):
+        return self.current
+
+    def retry(self, func, *args):
+        while True:
+            try:
+                return func(*args)
+            except Conflict:
+                pass
+
+
+class TestDatabaseSessionStore(object):
+
+    def test_prefetch(self):
+        rows = [ { 'id': 'a', 'scope': 's1', 'name': 'k1', 'data': 'd1' },
+                 { 'id': 'a', 'scope': 's1', 'name': 'k2', 'data': 'd2' },
+                 { 'id': 'a', 'scope': 's2', 'name': 'k1', 'data': 'd3' } ]
+        transaction = Transaction(rows)
+        store = DatabaseSessionStore(transaction)
+        store.prefetch_namespaces('a')
+        assert store.load_namespace('a', 's1') == { 'k1': 'd1', 'k2': 'd2' }
+        assert store.load_namespace('a', 's2') == { 'k1': 'd3' }
+        assert store.load_namespace('a', 's3') is None
+        assert transaction.selects == 1
+
+    def test_no_prefetch(self):
+        rows = [ { 'id': 'a', 'scope': 's1', 'name': 'k1', 'data': 'd1' } ]
+        transaction = Transaction(rows)
+        store = DatabaseSessionStore(transaction)
+        assert store.load_namespace('a', 's1') == { 'k1': 'd1' }
+        assert store.load_namespace('a', 's2') is None
+        assert transaction.selects == 2
+
+    def test_batch(self):
+        rows = [ { 'id': 'a', 'scope': 's1', 'name': 'k1', 'data': 'd1' },
+                 { 'id': 'a', 'scope': 's1', 'name': 'k2', 'data': 'd2' } ]
+        transaction = Transaction(rows)
+        store = DatabaseSessionStore(transaction)
+        store.prefetch_namespaces('a')
+        store.store_namespace('a', 's1', { 'k1': 'x1', 'k3': 'x3' },
+                              ['k2', 'k4'])
+        store.store_namespace('a', 's2', { 'k1': 'x4' }, [])
+        assert not transaction.writes
+        store.commit()
+        assert transaction.writes == \
+                [('a', { ('s1', 'k1'): 'x1' },
+                  { ('s1', 'k3'): 'x3', ('s2', 'k1'): 'x4' },
+                  [('s1', 'k2')])]
+
+    def test_conflict(self):
+        now = datetime.datetime.now()
+        later = now + datetime.timedelta(seconds=60)
+        session = { 'id': 'a', 'version': 1, 'expire_date': now,
+                    'last_used': now, 'principal': None }
+        transaction = Transaction([])
+        transaction.current = { 'id': 'a', 'version': 2,
+                                'expire_date': later, 'last_used': now,
+                                'principal': None }
+        store = DatabaseSessionStore(transaction)
+        store.m_sessions['a'] = session
+        store.prefetch_namespaces('a')
+        store.update('a', { 'expire_date': now, 'principal': 'user' })
+        store.store_namespace('a', 's1', { 'k1': 'x1' }, [])
+        # A concurrent request created the value in the meantime.
+        transaction.rows.append({ 'id': 'a', 'scope': 's1', 'name': 'k1',
+                                  'data': 'd1' })
+        store.commit()
+        assert transaction.versions == \
+                [(1, { 'expire_date': now, 'principal': 'user' }),
+                 (2, { 'expire_date': later, 'principal': 'user' })]
+        assert transaction.selects == 2
+        assert transaction.writes == [('a', { ('s1', 'k1'): 'x1' }, {}, [])]
+
+    def test_insert_conflict(self):
+        transaction = Transaction([])
+        store = DatabaseSessionStore(transaction)
+        store.prefetch_namespaces('a')
+        store.store_namespace('a', 's1', { 'k1': 'x1' }, [])
+        # The insert fails because a concurrent request inserted the
+        # same value. The writes are replayed and the value is updated.
+        transaction.conflict = { 'id': 'a', 'scope': 's1', 'name': 'k1',
+                                 'data': 'd1' }
+        store.commit()
+        assert transaction.selects == 2
+        assert transaction.writes == \
+                [('a', {}, { ('s1', 'k1'): 'x1' }, []),
+                 ('a', { ('s1', 'k1'): 'x1' }, {}, [])]
+
+
+class Security(object):
+
+    def principal(self):
+        return None
+
+
+class Response(object):
+
+    def set_cookie(self, cookie):
+        self.cookie = cookie
+
+
+class TestSession(object):
+
+    def test_session(self):
+        store = MemorySessionStore()
+        response = Response()
+        session = Session(None, response, store, Security())
+        session.new()
+        session.namespace()['key'] = 'value'
+        sessionid = session.sessionid()
+        session.commit()
+        session = Session(None, response, store, Security())
+        assert session.load(sessionid)
+        assert session.namespace()['key'] == 'value'
+        assert response.cookie.value == sessionid[0]
+        session.commit()
+
+    def test_destroy(self):
+        store = MemorySessionStore()
+        session = Session(None, Response(), store, Security())
+        session.new()
+        sessionid = session.sessionid()
+        session.commit()
+        session = Session(None, Response(), store, Security())
+        assert session.load(sessionid)
+        session.destroy()
+        session.commit()
+        session = Session(None, Response(), store, Security())
+        assert not session.load(sessionid)
+
+    def test_empty_namespace(self):
+        store = MemorySessionStore()
+        session = Session(None, Response(), store, Security())
+        session.new()
+        session.namespace('empty').update({})
+        session.namespace('full')['key'] = 'value'
+        sessionid = session.sessionid()
+        session.commit()
+        store.load(sessionid[0])
+        assert store.load_namespace(sessionid[0], 'empty/0') is None
+        assert store.load_namespace(sessionid[0], 'full/0') is not None
+        store.commit()
+
+    def test_modified_in_place(self):
+        store = MemorySessionStore()
+        session = Session(None, Response(), store, Security())
+        session.new()
+        session.namespace()['list'] = []
+        sessionid = session.sessionid()
+        session.commit()
+        session = Session(None, Response(), store, Security())
+        session.load(sessionid)
+        session.namespace()['list'].append(1)
+        session.commit()
+        session = Session(None, Response(), store, Security())
+        session.load(sessionid)
+        assert session.namespace()['list'] == [1]
+        session.commit()
+
+
+    def test_touch(self):
+        store = MemorySessionStore()
+        session = Session(None, Response(), store, Security())
+        session.new()
+        sessionid = session.sessionid()
+        expire_date = session.expire_date()
+        session.commit()
+        response = Response()
+        session = Session(None, response, store, Security())
+        session.set_touch_fraction(0.5)
+        assert session.load(sessionid)
+        assert session.expire_date() == expire_date
+        assert not hasattr(response, 'cookie')
+        session.commit()
+        session = Session(None, response, store, Security())
+        assert session.load(sessionid)
+        assert session.expire_date() > expire_date
+        assert response.cookie.value == sessionid[0]
+        session.commit()
+
+
+class RecordingStore(MemorySessionStore):
+
+    def __init__(self):
+        super(RecordingStore, self).__init__()
+        self.stored = []
+
+    def store_namespace(self, sessionid, scope, updates, deletes):
+        self.stored.append((scope, updates.keys(), deletes))
+        super(RecordingStore, self).store_namespace(sessionid, scope,
+                                                    updates, deletes)
+
+
+class TestNamespace(object):
+
+    def test_unchanged(self):
+        store = RecordingStore()
+        session = Session(None, Response(), store, Security())
+        session.new()
+        session.namespace()['key'] = 'value'
+        sessionid = session.sessionid()
+        session.commit()
+        assert store.stored == [('__default__/0', ['key'], [])]
+        session = Session(None, Response(), store, Security())
+        session.load(sessionid)
+        ns = session.namespace()
+        ns['key'] = 'value'
+        ns.update({})
+        session.commit()
+        assert store.stored == [('__default__/0', ['key'], [])]
+
+    def test_changed_keys(self):
+        store = RecordingStore()
+        record = make_record()
+        store.insert(record)
+        sessionid = record['id']
+        ns = SessionNamespace(sessionid, 'scope', store)
+        ns.update({ 'key1': 'value1', 'key2': 'value2', 'key3': 'value3' })
+        ns.flush()
+        ns['key1'] = 'other'
+        del ns['key2']
+        ns.flush()
+        assert store.stored[1] == ('scope', ['key1'], ['key2'])
+        store.commit()
+
+    def test_compress(self):
+        store = MemorySessionStore()
+        record = make_record()
+        store.insert(record)
+        sessionid = record['id']
+        ns = SessionNamespace(sessionid, 'scope', store, compress=100)
+        ns['small'] = 'x'
+        ns['large'] = 'x' * 1000
+        ns.flush()
+        values = store.load_namespace(sessionid, 'scope')
+        assert values['small'] == dumps('x')
+        assert values['large'].startswith(compressed_marker)
+        assert len(values['large']) < 100
+        ns = SessionNamespace(sessionid, 'scope', store)
+        assert ns['large'] == 'x' * 1000
+        assert ns.size() == sum(map(len, values.values()))
+        store.commit()
+
+    def test_max_size(self):
+        store = MemorySessionStore()
+        record = make_record()
+        store.insert(record)
+        sessionid = record['id']
+        ns = SessionNamespace(sessionid, 'scope', store, max_size=100)
+        ns['key'] = 'x' * 1000
+        try:
+            ns.flush()
+        except SessionError:
+            pass
+        else:
+            assert False, 'expected SessionError'
+        assert store.load_namespace(sessionid, 'scope') is None
+        store.commit()
+
+    def test_long_name(self):
+        store = MemorySessionStore()
+        record = make_record()
+        store.insert(record)
+        sessionid = record['id']
+        ns = SessionNamespace(sessionid, 'scope', store)
+        name = 'x' * SessionNamespace.c_max_name
+        ns[name] = 'value'
+        for func in (lambda: ns.__setitem__(name + 'x', 'value'),
+                     lambda: ns.update({ name + 'x': 'value' }),
+                     lambda: ns.setdefault(name + 'x', 'value')):
+            try:
+                func()
+            except NamespaceError:
+                pass
+            else:
+                assert False, 'expected NamespaceError'
+        assert ns.keys() == [name]
+        store.commit()
+
+    def test_metrics(self):
+        namespace_metrics.clear()
+        store = MemorySessionStore()
+        record = make_record()
+        store.insert(record)
+        sessionid = record['id']
+        ns = SessionNamespace(sessionid, 'scope/1', store)
+        ns['key'] = 'value'
+        ns.flush()
+        ns = SessionNamespace(sessionid, 'scope/2', store)
+        metrics = namespace_metrics.metrics()
+        assert metrics.keys() == ['scope']
+        assert metrics['scope']['loads'] == 2
+        assert metrics['scope']['flushes'] == 1
+        assert metrics['scope']['write_bytes'] == len(dumps('value'))
+        store.commit()
@@ -72,6 +72,17 @@ class LruCache(object):
         self.m_time += 1
         self.expire()
 
+    def remove(self, key):
+        """Remove an entry from the cache."""
+        try:
+            del self.m_cache[key]
+        except KeyError:
+            pass
+
+    def keys(self):
+        """Return a list with the keys of all entries in the cache."""
+        return self.m_cache.keys()
+
     def clear(self):
         """Clear all entries from the cache."""
         self.m_cache.clear()
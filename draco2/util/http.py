@@ -59,6 +59,7 @@ HTTP_REQUEST_URI_TOO_LONG = 414
 HTTP_UNSUPPORTED_MEDIA_TYPE = 415
 HTTP_REQUEST_RANGE_NOT_SATISFIABLE = 416
 HTTP_EXPECTATION_FAILED = 417
+HTTP_REQUEST_HEADER_FIELDS_TOO_LARGE = 431
 HTTP_INTERNAL_SERVER_ERROR = 500
 HTTP_NOT_IMPLEMENTED = 501
 HTTP_BAD_GATEWAY = 502
@@ -102,6 +103,7 @@ http_reason_strings = \
     HTTP_UNSUPPORTED_MEDIA_TYPE: 'Unsupported Media Type',
     HTTP_REQUEST_RANGE_NOT_SATISFIABLE: 'Requested Range Not Satisfiable',
     HTTP_EXPECTATION_FAILED: 'Expectation Failed',
+    HTTP_REQUEST_HEADER_FIELDS_TOO_LARGE: 'Request Header Fields Too Large',
     HTTP_INTERNAL_SERVER_ERROR: 'Internal Server Error',
     HTTP_NOT_IMPLEMENTED: 'Not Implemented',
     HTTP_BAD_GATEWAY: 'Bad Gateway',
@@ -171,7 +173,7 @@ def parse_headers(input):
     None of the advanced features from RFC822, such as long lines
     and (un)structured fields are supported.
     """
-    headers = {}
+    lines = []
     while True:
         line = input.readline()
         if not line:
@@ -179,6 +181,15 @@ def parse_headers(input):
         line = line.rstrip()
         if not line:
             break
+        lines.append(line)
+    return parse_header_lines(lines)
+
+
+def parse_header_lines(lines):
+    """Parse a list of RFC822-style header lines, without line
+    terminators."""
+    headers = {}
+    for line in lines:
         if line[:1].isspace():
             # We don't support RFC822 style continued headers
             raise HTTPError, HTTP_NOT_IMPLEMENTED
@@ -194,6 +205,54 @@ def parse_headers(input):
     return headers
 
 
+def read_request(sock, max_size=65536, max_headers=100, block_size=8192):
+    """Read and parse a HTTP request from socket `sock'.
+
+    The request line and headers are read in blocks until the empty
+    line that terminates them is found. If they are larger than
+    `max_size' bytes or contain more than `max_headers' headers, the
+    request is refused.
+
+    The return value is a 5-tuple: protocol, method, uri, headers,
+    data. The `data' element contains the part of the request body that
+    was read together with the headers.
+
+    Exceptions: HTTPError
+    """
+    data = ''
+    start = 0
+    while True:
+        pos = data.find('\n\r\n', start)
+        size = 3
+        pos2 = data.find('\n\n', start)
+        if pos2 != -1 and (pos == -1 or pos2 < pos):
+            pos = pos2
+            size = 2
+        if pos != -1:
+            break
+        if len(data) > max_size:
+            raise HTTPError, HTTP_REQUEST_HEADER_FIELDS_TOO_LARGE
+        start = max(0, len(data) - 2)
+        buf = sock.recv(block_size)
+        if not buf:
+            raise HTTPError, HTTP_BAD_REQUEST
+        data += buf
+    if pos > max_size:
+        raise HTTPError, HTTP_REQUEST_HEADER_FIELDS_TOO_LARGE
+    lines = data[:pos].splitlines()
+    data = data[pos+size:]
+    if not lines:
+        raise HTTPError, HTTP_BAD_REQUEST
+    try:
+        method, uri, proto = lines[0].split()
+    except ValueError:
+        raise HTTPError, HTTP_BAD_REQUEST
+    if len(lines) - 1 > max_headers:
+        raise HTTPError, HTTP_REQUEST_HEADER_FIELDS_TOO_LARGE
+    headers = parse_header_lines(lines[1:])
+    return proto, method, uri, headers, data
+
+
 # Form argument parsing
 
 class FileUpload(object):
@@ -240,80 +299,165 @@ def parse_header_options(data):
             options[key] = [value]
     return ctype, options
 
-def skip_until_boundary(input, boundary):
-    """Skip input until RFC2046-style `boundary' is read.
+class _Spool(object):
+    """Output for a multipart part.
 
-    Exceptions: HTTPError
+    Data is kept in memory until its size exceeds `threshold' bytes,
+    after which it is moved to a temporary file. A threshold of None
+    means that the data is always kept in memory.
     """
-    while True:
-        line = input.readline()
-        if line.startswith(boundary):
-            break
-        if not line:
-            raise HTTPError, HTTP_BAD_REQUEST
-
-def read_until_boundary(input, output, boundary):
-    """Pass data from `input' to `output' until `boundary.
 
-    If the end boundary is reached, return True, otherwise False.
-    Exceptions: HTTPError
+    def __init__(self, threshold):
+        self.m_file = cStringIO.StringIO()
+        self.m_size = 0
+        self.m_threshold = threshold
+        self.m_spooled = False
+
+    def write(self, data):
+        self.m_size += len(data)
+        if not self.m_spooled and self.m_threshold is not None \
+                    and self.m_size > self.m_threshold:
+            output = tempfile.TemporaryFile()
+            output.write(self.m_file.getvalue())
+            self.m_file = output
+            self.m_spooled = True
+        self.m_file.write(data)
+
+    def size(self):
+        return self.m_size
+
+    def file(self):
+        """Return the output as a file positioned at the start."""
+        self.m_file.seek(0)
+        return self.m_file
+
+    def getvalue(self):
+        self.m_file.seek(0)
+        return self.m_file.read()
+
+
+class MultipartParser(object):
+    """Parser for RFC2046 multipart/form-data bodies.
+
+    The body is read in large blocks, and the part delimiters are
+    searched for in the block as a whole. The data between delimiters
+    is written out in spans, instead of line by line.
+
+    Uploaded files are kept in memory up to `spool_size' bytes and are
+    spooled to a temporary file beyond that. If a part is larger than
+    `max_part_size' bytes, parsing is aborted with a 413 error.
     """
-    # Things are complicated by the fact that whitespace _before_ the
-    # boundary belongs to the boundary.
-    eol = oldeol = ''
-    end_boundary = boundary + '--'
-    while True:
-        line = input.readline()
-        if not line:
-            raise HTTPError, HTTP_BAD_REQUEST
-        if line.startswith(boundary):
-            break
-        if line.endswith('\r\n'):
-            eol = '\r\n'
-        elif line.endswith('\n'):
-            eol = '\n'
-        line = line[:-len(eol)]
-        output.write(oldeol + line)
-        oldeol = eol
-    return line.startswith(end_boundary)
-
-def parse_post(headers, input):
-    """Parse POST style query string.
 
-    The `headers' arguments must be a dictionary of HTTP headers,
-    `input' must be a file-like object with read() and readline()
-    methods.
+    block_size = 65536
+    max_header_size = 16384
 
-    Exceptions: HTTPError
-    """
-    try:
-        ctype = headers['content-type'][0]
-    except KeyError:
-        type = 'application/x-www-form-urlencoded'
-    try:
-        clen = int(headers['content-length'][0])
-    except (KeyError, ValueError):
-        raise HTTPError, HTTP_LENGTH_REQUIRED
-    ctype, options = parse_header_options(ctype)
+    def __init__(self, input, length, boundary, spool_size=65536,
+                 max_part_size=None):
+        self.m_input = input
+        self.m_remaining = length
+        self.m_delimiter = '\n--' + boundary
+        # The body starts with a delimiter without the preceding line
+        # break. Insert one so that all delimiters look the same.
+        self.m_buffer = '\r\n'
+        self.m_spool_size = spool_size
+        self.m_max_part_size = max_part_size
 
-    # Traditional POST requests
-    if ctype == 'application/x-www-form-urlencoded':
-        data = input.read(clen)
-        args = parse_query(data)
-        return args
+    def _fill(self):
+        """Read the next block of input.
 
-    # Newer POST requests with support for file uploads
-    elif ctype.startswith('multipart/'):
-        try:
-            boundary = options['boundary'][0]
-        except KeyError:
+        Exceptions: HTTPError, when the input ends prematurely.
+        """
+        if self.m_remaining <= 0:
+            raise HTTPError, HTTP_BAD_REQUEST
+        data = self.m_input.read(min(self.block_size, self.m_remaining))
+        if not data:
             raise HTTPError, HTTP_BAD_REQUEST
-        boundary = '--' + boundary
-        skip_until_boundary(input, boundary)
+        self.m_remaining -= len(data)
+        self.m_buffer += data
 
-        args = {}
+    def _copy_until_delimiter(self, output):
+        """Copy input to `output' until a delimiter is found.
+
+        The line break before the delimiter belongs to the delimiter and
+        is not copied. If output is None, the input is discarded.
+        """
+        delimiter = self.m_delimiter
+        # Keep enough data to find a delimiter that straddles two blocks,
+        # including the carriage return before it.
+        keep = len(delimiter) + 1
+        while True:
+            buf = self.m_buffer
+            pos = buf.find(delimiter)
+            if pos != -1:
+                end = pos
+                if end > 0 and buf[end-1] == '\r':
+                    end -= 1
+                span = buf[:end]
+                self.m_buffer = buf[pos+len(delimiter):]
+            elif len(buf) > keep:
+                span = buf[:-keep]
+                self.m_buffer = buf[-keep:]
+            else:
+                span = ''
+            if span and output is not None:
+                if self.m_max_part_size is not None and \
+                        output.size() + len(span) > self.m_max_part_size:
+                    raise HTTPError, HTTP_REQUEST_ENTITY_TOO_LARGE
+                output.write(span)
+            if pos != -1:
+                break
+            self._fill()
+
+    def _read_delimiter_end(self):
+        """Read the remainder of the delimiter line.
+
+        If this was the close delimiter, return True, otherwise False.
+        """
+        while len(self.m_buffer) < 2:
+            self._fill()
+        if self.m_buffer.startswith('--'):
+            return True
         while True:
-            subheaders = parse_headers(input)
+            pos = self.m_buffer.find('\n')
+            if pos != -1:
+                break
+            if len(self.m_buffer) > self.max_header_size:
+                raise HTTPError, HTTP_BAD_REQUEST
+            self._fill()
+        self.m_buffer = self.m_buffer[pos+1:]
+        return False
+
+    def _read_headers(self):
+        """Read the headers of a part."""
+        while True:
+            pos = self.m_buffer.find('\n\r\n')
+            size = 3
+            pos2 = self.m_buffer.find('\n\n')
+            if pos2 != -1 and (pos == -1 or pos2 < pos):
+                pos = pos2
+                size = 2
+            if pos != -1:
+                break
+            if len(self.m_buffer) > self.max_header_size:
+                raise HTTPError, HTTP_BAD_REQUEST
+            self._fill()
+        data = self.m_buffer[:pos+size]
+        self.m_buffer = self.m_buffer[pos+size:]
+        return parse_headers(cStringIO.StringIO(data))
+
+    def parse(self):
+        """Parse the body.
+
+        The return value is a dictionary of lists of form values. Form
+        values are unicode strings, or FileUpload instances for uploaded
+        files.
+
+        Exceptions: HTTPError
+        """
+        self._copy_until_delimiter(None)
+        args = {}
+        while not self._read_delimiter_end():
+            subheaders = self._read_headers()
             try:
                 cdisp = subheaders['content-disposition'][0]
             except KeyError:
@@ -328,27 +472,67 @@ def parse_post(headers, input):
             except KeyError:
                 filename = None
             if filename:
-                output = tempfile.TemporaryFile()
+                output = _Spool(self.m_spool_size)
             else:
-                output = cStringIO.StringIO()
-            atend = read_until_boundary(input, output, boundary)
+                output = _Spool(None)
+            self._copy_until_delimiter(output)
             if filename:
-                output.seek(0)
                 try:
                     subctype = subheaders['content-type'][0]
                 except KeyError:
                     raise HTTPError, HTTP_BAD_REQUEST
-                value = FileUpload(name, output, subctype, filename)
+                value = FileUpload(name, output.file(), subctype, filename)
             else:
                 value = output.getvalue().decode('utf-8')
             if name in args:
                 args[name].append(value)
             else:
                 args[name] = [value]
-            if atend:
-                break
         return args
 
+
+def parse_post(headers, input, max_size=None, max_part_size=None,
+               spool_size=65536):
+    """Parse POST style query string.
+
+    The `headers' arguments must be a dictionary of HTTP headers,
+    `input' must be a file-like object with a read() method.
+
+    If the body is larger than `max_size' bytes, or if a part of a
+    multipart body is larger than `max_part_size' bytes, a 413 error is
+    raised. Uploaded files up to `spool_size' bytes are kept in memory,
+    larger files are stored in a temporary file.
+
+    Exceptions: HTTPError
+    """
+    try:
+        ctype = headers['content-type'][0]
+    except KeyError:
+        ctype = 'application/x-www-form-urlencoded'
+    try:
+        clen = int(headers['content-length'][0])
+    except (KeyError, ValueError):
+        raise HTTPError, HTTP_LENGTH_REQUIRED
+    if max_size is not None and clen > max_size:
+        raise HTTPError, HTTP_REQUEST_ENTITY_TOO_LARGE
+    ctype, options = parse_header_options(ctype)
+
+    # Traditional POST requests
+    if ctype == 'application/x-www-form-urlencoded':
+        data = input.read(clen)
+        args = parse_query(data)
+        return args
+
+    # Newer POST requests with support for file uploads
+    elif ctype.startswith('multipart/'):
+        try:
+            boundary = options['boundary'][0]
+        except KeyError:
+            raise HTTPError, HTTP_BAD_REQUEST
+        parser = MultipartParser(input, clen, boundary, spool_size,
+                                 max_part_size)
+        return parser.parse()
+
     else:
         raise HTTPError, HTTP_BAD_REQUEST
 
@@ -414,6 +598,72 @@ def parse_cookie(data):
     return cookies
 
 
+# Cache control
+
+class CachePolicy(object):
+    """A HTTP caching policy.
+
+    The policy is expressed using the "Cache-Control", "Expires" and
+    "Vary" response headers. The `public' argument can be True for a
+    public response, False for a private response, or None to leave
+    it unspecified. An `immutable' response never changes during its
+    lifetime. Time values are in seconds.
+    """
+
+    def __init__(self, max_age=None, s_maxage=None, public=None,
+                 stale_while_revalidate=None, vary=None, immutable=False):
+        self.max_age = max_age
+        self.s_maxage = s_maxage
+        self.public = public
+        self.stale_while_revalidate = stale_while_revalidate
+        self.immutable = immutable
+        if vary is None:
+            vary = []
+        self.vary = vary
+
+    def cache_control(self):
+        """Return the value for the "Cache-Control" header."""
+        if self.max_age is None and self.s_maxage is None:
+            return 'no-cache'
+        parts = []
+        if self.public is True:
+            parts.append('public')
+        elif self.public is False:
+            parts.append('private')
+        if self.max_age is not None:
+            parts.append('max-age=%d' % self.max_age)
+        if self.s_maxage is not None:
+            parts.append('s-maxage=%d' % self.s_maxage)
+        if self.stale_while_revalidate is not None:
+            parts.append('stale-while-revalidate=%d'
+                         % self.stale_while_revalidate)
+        if self.immutable:
+            parts.append('immutable')
+        return ', '.join(parts)
+
+    def expires(self, now=None):
+        """Return the value for the "Expires" header, or None if the
+        response should not get one."""
+        if self.max_age is None:
+            return
+        if now is None:
+            now = datetime.datetime.now()
+        expires = now + datetime.timedelta(seconds=self.max_age)
+        return _format_english_gmt_date(expires, rfc1123_datetime)
+
+    def aged(self, age):
+        """Return a copy of this policy for a response that has been
+        stored in a cache for `age' seconds."""
+        policy = CachePolicy(self.max_age, self.s_maxage, self.public,
+                             self.stale_while_revalidate, self.vary[:],
+                             self.immutable)
+        if policy.max_age is not None:
+            policy.max_age = max(0, policy.max_age - age)
+        if policy.s_maxage is not None:
+            policy.s_maxage = max(0, policy.s_maxage - age)
+        return policy
+
+
 # User-agent parsing
 
 re_agent = re.compile('(?:([a-zA-Z]+)\s+([0-9.]+)|([^/(]*)(?:/([\w.]+))?)' \
@@ -11,9 +11,99 @@
 #
 # $Revision: 1187 $
 
+import os
+import os.path
+import re
 import struct
 
 
+# Number of bytes read at a time when parsing image headers.
+block_size = 4096
+
+# JPEG start of frame markers. These are all markers in the range
+# 0xc0..0xcf, except DHT (0xc4), JPG (0xc8) and DAC (0xcc). This includes
+# progressive (0xc2) and lossless (0xc3) frames.
+jpeg_sof_markers = [ m for m in range(0xc0, 0xd0)
+                     if m not in (0xc4, 0xc8, 0xcc) ]
+
+# JPEG markers without a length field.
+jpeg_standalone_markers = [0x01, 0xd8] + range(0xd0, 0xd8)
+
+image_extensions = ('png', 'gif', 'jpg', 'jpeg', 'webp', 'svg')
+
+re_svg = re.compile(r'<svg\b([^>]*)>', re.S)
+re_svg_attr = re.compile(r'(width|height|viewBox)\s*=\s*["\']([^"\']*)["\']')
+re_svg_length = re.compile(r'^\s*([0-9]*\.?[0-9]+)\s*(px)?\s*$')
+
+
+def _jpeg_size(fin, data):
+    """Find the size of a JPEG image by scanning for a SOFn marker.
+
+    The markers are scanned in blocks, seeking past large segments such
+    as Exif data instead of reading them.
+    """
+    base = 0
+    pos = 2
+    while True:
+        if pos + 9 > base + len(data):
+            fin.seek(pos)
+            base = pos
+            data = fin.read(block_size)
+            if len(data) < 9:
+                return
+        offset = pos - base
+        if data[offset] != '\xff':
+            return
+        marker = ord(data[offset+1])
+        if marker == 0xff:
+            pos += 1  # fill byte
+        elif marker in jpeg_sof_markers:
+            h, w = struct.unpack('>HH', data[offset+5:offset+9])
+            return w, h
+        elif marker in jpeg_standalone_markers:
+            pos += 2
+        elif marker in (0xd9, 0xda):
+            return  # end of image or start of scan before a frame
+        else:
+            size = struct.unpack('>H', data[offset+2:offset+4])[0]
+            pos += 2 + size
+
+def _webp_size(head):
+    """Return the size of a WebP image from its header."""
+    chunk = head[12:16]
+    if chunk == 'VP8 ' and head[23:26] == '\x9d\x01\x2a':
+        w, h = struct.unpack('<HH', head[26:30])
+        return w & 0x3fff, h & 0x3fff
+    elif chunk == 'VP8L' and head[20] == '\x2f':
+        bits = struct.unpack('<I', head[21:25])[0]
+        return (bits & 0x3fff) + 1, ((bits >> 14) & 0x3fff) + 1
+    elif chunk == 'VP8X':
+        w = struct.unpack('<I', head[24:27] + '\x00')[0] + 1
+        h = struct.unpack('<I', head[27:30] + '\x00')[0] + 1
+        return w, h
+
+def _svg_size(head):
+    """Return the size of an SVG image from its root element.
+
+    The `width' and `height' attributes are used if they are specified
+    in pixels, otherwise the size is taken from the `viewBox' attribute.
+    """
+    mobj = re_svg.search(head)
+    if not mobj:
+        return
+    attrs = dict(re_svg_attr.findall(mobj.group(1)))
+    try:
+        w = re_svg_length.match(attrs.get('width', ''))
+        h = re_svg_length.match(attrs.get('height', ''))
+        if w and h:
+            return int(round(float(w.group(1)))), \
+                   int(round(float(h.group(1))))
+        box = attrs.get('viewBox', '').replace(',', ' ').split()
+        if len(box) == 4:
+            return int(round(float(box[2]))), int(round(float(box[3])))
+    except ValueError:
+        pass
+
 def get_image_info(fname):
     """Determine the image type and size of `fname'.
     
@@ -24,36 +114,123 @@ def get_image_info(fname):
         fin = file(fname, 'rb')
     except IOError:
         return
-    head = fin.read(24)
-    if len(head) != 24:
-        return
-    if head[:4] == '\x89PNG' and head[4:8] == '\r\n\x1a\n':
-        # PNG
-        w, h = struct.unpack('>ii', head[16:24])
-        fmt = 'png'
-    elif head[:6] in ('GIF87a', 'GIF89a'):
-        # GIF
-        w, h = struct.unpack('<HH', head[6:10])
-        fmt = 'gif'
-    elif head[:4] == '\xff\xd8\xff\xe0' and head[6:10] == 'JFIF':
-        # JPEG
-        try:
-            fin.seek(0)  # Read 0xff next
-            size = 2
-            type = 0
-            while not 0xc0 <= type <= 0xcf:
-                fin.seek(size, 1)
-                b = fin.read(1)
-                while ord(b) == 0xff: 
-                    b = fin.read(1)
-                type = ord(b)
-                size = struct.unpack('>H', fin.read(2))[0] - 2
-            # We are at a SOFn block
-            fin.seek(1, 1)  # Skip `precision' byte.
-            h, w = struct.unpack('>HH', fin.read(4))
+    try:
+        head = fin.read(block_size)
+        if len(head) < 24:
+            return
+        if head[:8] == '\x89PNG\r\n\x1a\n':
+            size = struct.unpack('>ii', head[16:24])
+            fmt = 'png'
+        elif head[:6] in ('GIF87a', 'GIF89a'):
+            size = struct.unpack('<HH', head[6:10])
+            fmt = 'gif'
+        elif head[:3] == '\xff\xd8\xff':
+            try:
+                size = _jpeg_size(fin, head)
+            except (IOError, struct.error):
+                return
             fmt = 'jpeg'
-        except (IOError, struct.error):
+        elif head[:4] == 'RIFF' and head[8:12] == 'WEBP':
+            if len(head) < 30:
+                return
+            size = _webp_size(head)
+            fmt = 'webp'
+        elif '<svg' in head:
+            size = _svg_size(head)
+            fmt = 'svg'
+        else:
             return
-    else:
+    finally:
+        fin.close()
+    if not size:
         return
-    return fmt, w, h
+    return (fmt,) + tuple(size)
+
+
+# Image index
+#
+# An image index is a file that stores the format and size of all images
+# below a directory, so that they do not need to be parsed by each
+# process. The file has one line per image with the tab separated fields
+# name, format, width and height. The name is relative to the directory,
+# starts with a '/', and uses '/' as the path separator.
+
+def build_image_index(root, extensions=image_extensions):
+    """Return an image index for all images below directory `root'.
+
+    The index is a dictionary mapping image names to (format, width,
+    height, mtime) tuples. Only files with an extension in `extensions'
+    are considered.
+    """
+    index = {}
+    for dirpath, dirnames, filenames in os.walk(root):
+        reldir = dirpath[len(root):].replace(os.sep, '/').strip('/')
+        for fname in filenames:
+            ext = os.path.splitext(fname)[1][1:].lower()
+            if ext not in extensions:
+                continue
+            if reldir:
+                name = '/%s/%s' % (reldir, fname)
+            else:
+                name = '/%s' % fname
+            if '\t' in name or '\n' in name:
+                continue
+            path = os.path.join(dirpath, fname)
+            try:
+                mtime = os.stat(path).st_mtime
+            except OSError:
+                continue
+            info = get_image_info(path)
+            if info:
+                index[name] = info + (mtime,)
+    return index
+
+def write_image_index(index, fname):
+    """Write the image index `index' to the file `fname'.
+
+    The file is replaced atomically so that processes reading the index
+    never see a partially written file.
+    """
+    tmpname = '%s.%d' % (fname, os.getpid())
+    fout = file(tmpname, 'w')
+    try:
+        fout.write('# Draco image index\n')
+        names = index.keys()
+        names.sort()
+        for name in names:
+            fmt, w, h, mtime = index[name]
+            fout.write('%s\t%s\t%d\t%d\t%r\n' % (name, fmt, w, h, mtime))
+    finally:
+        fout.close()
+    try:
+        os.rename(tmpname, fname)
+    except OSError:
+        # Windows does not allow renaming over an existing file.
+        os.remove(fname)
+        os.rename(tmpname, fname)
+
+def read_image_index(fname):
+    """Read an image index from the file `fname'.
+
+    An empty index is returned if the file does not exist.
+    """
+    index = {}
+    try:
+        fin = file(fname)
+    except IOError:
+        return index
+    try:
+        for line in fin:
+            if line.startswith('#'):
+                continue
+            fields = line.rstrip('\n').split('\t')
+            if len(fields) != 5:
+                continue
+            try:
+                index[fields[0]] = (fields[1], int(fields[2]), int(fields[3]),
+                                    float(fields[4]))
+            except ValueError:
+                continue
+    finally:
+        fin.close()
+    return index
@@ -12,6 +12,7 @@
 # $Revision: 1187 $
 
 import sys
+import datetime
 import traceback
 import md5
 
@@ -63,3 +64,21 @@ def dedent(s, trim=1):
                 break
         lines = lines[lo:hi]
     return '\n'.join(lines)
+
+
+def needs_touch(expire_date, timeout, fraction, now=None):
+    """Return True if an object with a sliding expiration date of
+    `expire_date' and a timeout of `timeout' seconds needs to have its
+    expiration date extended.
+
+    This is the case when more than `fraction' of the timeout has passed
+    since the expiration date was last set. A fraction of 0 means that
+    the expiration date is extended every time.
+    """
+    if fraction <= 0:
+        return True
+    if now is None:
+        now = datetime.datetime.now()
+    remaining = expire_date - now
+    remaining = remaining.days * 86400 + remaining.seconds
+    return timeout - remaining >= fraction * timeout
@@ -11,9 +11,15 @@
 #
 # $Revision: $
 
+import zlib
 import cPickle
 
 
+# Marker for compressed data. Serialized data starts with the pickle
+# protocol 2 opcode '\x80', so this is unambiguous.
+compressed_marker = 'z'
+
+
 class Buffer(object):
     """Auxiliary object that can be used to pickle a `buffer'
     instance which is normally not pickle-able.
@@ -32,7 +38,27 @@ def dumps(data):
 
 
 def loads(serialized):
-    """Load serialized data `serialized'. Returns a Python object."""
-    if isinstance(serialized, buffer):
-        serialized = str(serialized)
+    """Load serialized data `serialized'. Returns a Python object.
+
+    The data may have been compressed with compress().
+    """
+    serialized = decompress(serialized)
     return cPickle.loads(serialized)
+
+
+def compress(serialized, threshold=None):
+    """Compress serialized data `serialized' if it is longer than
+    `threshold' bytes. If `threshold' is None, the data is not
+    compressed."""
+    if threshold is None or len(serialized) <= threshold:
+        return serialized
+    return compressed_marker + zlib.compress(serialized)
+
+
+def decompress(data):
+    """Decompress data that was compressed with compress()."""
+    if isinstance(data, buffer):
+        data = str(data)
+    if data[:1] == compressed_marker:
+        data = zlib.decompress(data[1:])
+    return data
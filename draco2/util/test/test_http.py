@@ -16,6 +16,9 @@ import time
 import tempfile
 import datetime
 import locale
+import cStringIO
+
+import py.test
 
 from draco2.util import http
 
@@ -60,3 +63,127 @@ class TestHTTP(object):
         locale.setlocale(locale.LC_ALL, 'nl_NL')
         self.test_last_modified()
         locale.setlocale(locale.LC_ALL, current)
+
+
+class TestParsePost(object):
+    """Test POST body parsing."""
+
+    boundary = 'xXxBoundaryxXx'
+
+    def multipart(self, parts, eol='\r\n'):
+        body = []
+        for headers, data in parts:
+            body.append('--%s%s' % (self.boundary, eol))
+            for header in headers:
+                body.append(header + eol)
+            body.append(eol)
+            body.append(data + eol)
+        body.append('--%s--%s' % (self.boundary, eol))
+        return ''.join(body)
+
+    def parse(self, body, **kwargs):
+        ctype = 'multipart/form-data; boundary="%s"' % self.boundary
+        headers = { 'content-type': [ctype],
+                    'content-length': [str(len(body))] }
+        input = cStringIO.StringIO(body)
+        return http.parse_post(headers, input, **kwargs)
+
+    def test_urlencoded(self):
+        headers = { 'content-length': ['7'] }
+        input = cStringIO.StringIO('a=1&b=2')
+        args = http.parse_post(headers, input)
+        assert args == { 'a': ['1'], 'b': ['2'] }
+
+    def test_fields(self):
+        parts = [(['Content-Disposition: form-data; name="a"'], 'one'),
+                 (['Content-Disposition: form-data; name="a"'], 'two\r\n'),
+                 (['Content-Disposition: form-data; name="b"'], '')]
+        for eol in ('\r\n', '\n'):
+            body = 'preamble' + eol + self.multipart(parts, eol)
+            args = self.parse(body)
+            assert args['a'] == [u'one', u'two\r\n']
+            assert args['b'] == [u'']
+
+    def test_upload(self):
+        data = ''.join([ chr(i % 256) for i in range(200000) ])
+        data += '\r\n--' + self.boundary[:-1]
+        parts = [(['Content-Disposition: form-data; name="f"; '
+                   'filename="data.bin"',
+                   'Content-Type: application/octet-stream'], data)]
+        body = self.multipart(parts)
+        args = self.parse(body)
+        upload = args['f'][0]
+        assert upload.filename == 'data.bin'
+        assert upload.content_type == 'application/octet-stream'
+        assert upload.file.read() == data
+        args = self.parse(body, spool_size=None)
+        assert args['f'][0].file.read() == data
+
+    def test_truncated(self):
+        parts = [(['Content-Disposition: form-data; name="a"'], 'one')]
+        body = self.multipart(parts)
+        body = body[:body.rfind('--%s' % self.boundary)]
+        py.test.raises(http.HTTPError, self.parse, body)
+
+    def test_limits(self):
+        parts = [(['Content-Disposition: form-data; name="a"'], 'x' * 1000)]
+        body = self.multipart(parts)
+        err = py.test.raises(http.HTTPError, self.parse, body,
+                             max_size=100).value
+        assert err.status() == http.HTTP_REQUEST_ENTITY_TOO_LARGE
+        err = py.test.raises(http.HTTPError, self.parse, body,
+                             max_part_size=999).value
+        assert err.status() == http.HTTP_REQUEST_ENTITY_TOO_LARGE
+        args = self.parse(body, max_part_size=1000)
+        assert args['a'] == [u'x' * 1000]
+
+
+class MemorySocket(object):
+    """Socket that returns data from memory in small blocks."""
+
+    def __init__(self, data, block_size=7):
+        self.m_data = data
+        self.m_block_size = block_size
+
+    def recv(self, size):
+        size = min(size, self.m_block_size)
+        buf = self.m_data[:size]
+        self.m_data = self.m_data[size:]
+        return buf
+
+
+class TestReadRequest(object):
+    """Test reading a HTTP request from a socket."""
+
+    def test_request(self):
+        data = 'POST /test.dsp HTTP/1.1\r\nHost: localhost\r\n' \
+               'Accept: a\r\nAccept: b\r\n\r\nbody'
+        proto, method, uri, headers, body = \
+                http.read_request(MemorySocket(data))
+        assert (proto, method, uri) == ('HTTP/1.1', 'POST', '/test.dsp')
+        assert headers == { 'host': ['localhost'], 'accept': ['a', 'b'] }
+        assert body == 'body'
+
+    def test_bare_newlines(self):
+        data = 'GET / HTTP/1.0\nHost: localhost\n\n'
+        proto, method, uri, headers, body = \
+                http.read_request(MemorySocket(data))
+        assert headers == { 'host': ['localhost'] }
+        assert body == ''
+
+    def test_errors(self):
+        sock = MemorySocket('GET / HTTP/1.0\r\nHost: localhost\r\n')
+        py.test.raises(http.HTTPError, http.read_request, sock)
+        sock = MemorySocket('GET /\r\n\r\n')
+        py.test.raises(http.HTTPError, http.read_request, sock)
+        for data in ('\n\n', '\r\n\r\n'):
+            err = py.test.raises(http.HTTPError, http.read_request,
+                                 MemorySocket(data)).value
+            assert err.status() == http.HTTP_BAD_REQUEST
+        data = 'GET / HTTP/1.0\r\n' + 'X-Header: value\r\n' * 10 + '\r\n'
+        err = py.test.raises(http.HTTPError, http.read_request,
+                             MemorySocket(data), max_headers=5).value
+        assert err.status() == http.HTTP_REQUEST_HEADER_FIELDS_TOO_LARGE
+        err = py.test.raises(http.HTTPError, http.read_request,
+                             MemorySocket(data), max_size=64).value
+        assert err.status() == http.HTTP_REQUEST_HEADER_FIELDS_TOO_LARGE
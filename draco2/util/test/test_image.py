@@ -0,0 +1,121 @@
+# vi: ts=8 sts=4 sw=4 et
+#
+# test_image.py: test suite for draco2.util.image
+#
+# This file is part of Draco2. Draco2 is free software and is made available
+# under the MIT license. Consult the file "LICENSE" that is distributed
+# together with this file for the exact licensing terms.
+#
+# Draco2 is copyright (c) 1999-2007 by the Draco2 authors. See the file
+# "AUTHORS" for a complete overview.
+#
+# $Revision: $
+
+import os
+import os.path
+import struct
+import tempfile
+
+from draco2.util.image import (get_image_info, build_image_index,
+                               read_image_index, write_image_index)
+
+
+def jpeg_segment(marker, data):
+    return '\xff' + chr(marker) + struct.pack('>H', len(data) + 2) + data
+
+
+class TestImageInfo(object):
+
+    def setup_method(cls, method):
+        tempdir = tempfile.gettempdir()
+        subdir = 'dracotest_%d' % os.getpid()
+        cls.directory = os.path.join(tempdir, subdir)
+        os.mkdir(cls.directory)
+        cls.files = []
+
+    def teardown_method(cls, method):
+        for fname in cls.files:
+            os.remove(fname)
+        os.rmdir(cls.directory)
+
+    def create_file(self, name, data):
+        fname = os.path.join(self.directory, name)
+        fout = file(fname, 'wb')
+        fout.write(data)
+        fout.close()
+        self.files.append(fname)
+        return fname
+
+    def test_png(self):
+        data = '\x89PNG\r\n\x1a\n' + '\x00\x00\x00\x0dIHDR' + \
+               struct.pack('>ii', 120, 80) + '\x08\x02\x00\x00\x00'
+        fname = self.create_file('test.png', data)
+        assert get_image_info(fname) == ('png', 120, 80)
+
+    def test_gif(self):
+        data = 'GIF89a' + struct.pack('<HH', 16, 32) + '\x00' * 20
+        fname = self.create_file('test.gif', data)
+        assert get_image_info(fname) == ('gif', 16, 32)
+
+    def test_progressive_jpeg(self):
+        exif = jpeg_segment(0xe1, 'Exif\x00\x00' + 'x' * 10000)
+        dht = jpeg_segment(0xc4, '\x00' * 20)
+        sof = jpeg_segment(0xc2, '\x08' + struct.pack('>HH', 480, 640) +
+                           '\x03' + '\x00' * 9)
+        data = '\xff\xd8' + exif + dht + '\xff' + sof + '\xff\xda'
+        fname = self.create_file('test.jpg', data)
+        assert get_image_info(fname) == ('jpeg', 640, 480)
+
+    def test_jpeg_without_frame(self):
+        data = '\xff\xd8' + jpeg_segment(0xe0, 'JFIF\x00' + '\x00' * 20) + \
+               '\xff\xd9'
+        fname = self.create_file('test.jpg', data)
+        assert get_image_info(fname) is None
+
+    def test_webp(self):
+        data = 'RIFF\x00\x00\x00\x00WEBPVP8 \x00\x00\x00\x00' + \
+               '\x00\x00\x00\x9d\x01\x2a' + struct.pack('<HH', 300, 200)
+        fname = self.create_file('lossy.webp', data)
+        assert get_image_info(fname) == ('webp', 300, 200)
+        bits = (300 - 1) | ((200 - 1) << 14)
+        data = 'RIFF\x00\x00\x00\x00WEBPVP8L\x00\x00\x00\x00' + \
+               '\x2f' + struct.pack('<I', bits) + '\x00' * 5
+        fname = self.create_file('lossless.webp', data)
+        assert get_image_info(fname) == ('webp', 300, 200)
+        data = 'RIFF\x00\x00\x00\x00WEBPVP8X\x0a\x00\x00\x00' + \
+               '\x00' * 4 + struct.pack('<I', 299)[:3] + \
+               struct.pack('<I', 199)[:3]
+        fname = self.create_file('extended.webp', data)
+        assert get_image_info(fname) == ('webp', 300, 200)
+
+    def test_svg(self):
+        data = '<?xml version="1.0"?>\n' \
+               '<svg xmlns="http://www.w3.org/2000/svg" width="100px"\n' \
+               '     height="50" viewBox="0 0 10 5"></svg>'
+        fname = self.create_file('size.svg', data)
+        assert get_image_info(fname) == ('svg', 100, 50)
+        data = '<svg xmlns="http://www.w3.org/2000/svg" width="100%" ' \
+               'viewBox="0,0,24.5,12"></svg>'
+        fname = self.create_file('viewbox.svg', data)
+        assert get_image_info(fname) == ('svg', 25, 12)
+        data = '<svg xmlns="http://www.w3.org/2000/svg" width="2em">' \
+               '                 </svg>'
+        fname = self.create_file('nosize.svg', data)
+        assert get_image_info(fname) is None
+
+    def test_unknown(self):
+        fname = self.create_file('test.txt', 'this is not an image file')
+        assert get_image_info(fname) is None
+
+    def test_index(self):
+        data = 'GIF89a' + struct.pack('<HH', 16, 32) + '\x00' * 20
+        self.create_file('test.gif', data)
+        self.create_file('test.txt', data)
+        index = build_image_index(self.directory)
+        mtime = os.stat(os.path.join(self.directory, 'test.gif')).st_mtime
+        assert index == { '/test.gif': ('gif', 16, 32, mtime) }
+        fname = os.path.join(self.directory, 'images.idx')
+        write_image_index(index, fname)
+        self.files.append(fname)
+        assert read_image_index(fname) == index
+        assert read_image_index(fname + '.missing') == {}
@@ -11,7 +11,9 @@
 #
 # $Revision: $
 
-from draco2.util.misc import dedent
+import datetime
+
+from draco2.util.misc import dedent, needs_touch
 
 
 class TestDedent(object):
@@ -83,3 +85,14 @@ class TestDedent(object):
     def test_whitespace_lines(self):
         s = '    \n    \n'
         assert dedent(s) == ''
+
+
+class TestNeedsTouch(object):
+
+    def test_touch(self):
+        now = datetime.datetime.now()
+        expires = now + datetime.timedelta(seconds=3000)
+        assert needs_touch(expires, 3600, 0, now)
+        assert not needs_touch(expires, 3600, 0.5, now)
+        expires = now + datetime.timedelta(seconds=1000)
+        assert needs_touch(expires, 3600, 0.5, now)
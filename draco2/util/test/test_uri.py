@@ -240,3 +240,20 @@ class TestResolvePathURI(object):
         uri = '/dir/subdir/'
         parts = urimod.resolve_path_uri(uri, self.docroot)
         assert parts == ('dir/subdir', '', '')
+
+    def test_path_cache(self):
+        cache = urimod.PathCache(timeout=60)
+        uri = '/dir/subdir/template.dsp'
+        parts = urimod.resolve_path_uri(uri, self.docroot, cache)
+        assert parts == ('', 'dir', 'subdir/template.dsp')
+        assert cache.hit_ratio() == 0.0
+        self.create_reldir('dir/subdir')
+        parts = urimod.resolve_path_uri(uri, self.docroot, cache)
+        assert parts == ('', 'dir', 'subdir/template.dsp')
+        assert cache.hit_ratio() == 0.5
+        cache.clear()
+        parts = urimod.resolve_path_uri(uri, self.docroot, cache)
+        assert parts == ('dir/subdir', 'template.dsp', '')
+        cache.set_timeout(0)
+        py.test.raises(urimod.ResolutionError, urimod.resolve_path_uri,
+                       uri, self.docroot + 'x', cache)
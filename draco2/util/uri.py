@@ -15,6 +15,9 @@ import os
 import os.path
 import re
 import stat
+import time
+
+from draco2.util.cache import LruCache
 
 
 # URL/Form encoding
@@ -170,19 +173,30 @@ def create_query(args):
 class ResolutionError(Exception):
     pass
 
-def resolve_path_uri(path, docroot):
+def _isdir(path):
+    """Return True if `path' is an existing directory."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return False
+    return stat.S_ISDIR(st.st_mode)
+
+def resolve_path_uri(path, docroot, cache=None):
     """Resolves the path part of an URI.
 
     The URI is resolved to the 3-tuple: directory, filename, pathinfo.
     The filename component is either empty or a single path component,
     and may or may not exist as a physical file. The pathinfo component
     consists of zero or more path components.
+
+    If `cache' is given, it must be a PathCache instance that is used to
+    look up the directory structure of the document root.
     """
-    try:
-        st = os.stat(docroot)
-    except OSError:
-        st = None
-    if st is None or not stat.S_ISDIR(st.st_mode):
+    if cache is None:
+        isdir = _isdir
+    else:
+        isdir = cache.isdir
+    if not isdir(docroot):
         raise ResolutionError, 'Document root does not exist.'
     directory = []
     subdir = docroot
@@ -193,11 +207,7 @@ def resolve_path_uri(path, docroot):
             raise ResolutionError, \
                     'Current or parent directory not allowed in URI.'
         subdir = os.path.join(subdir, part)
-        try:
-            st = os.stat(subdir)
-        except OSError:
-            st = None
-        if st is None or not stat.S_ISDIR(st.st_mode):
+        if not isdir(subdir):
             filename = parts[i]
             pathinfo = '/'.join(parts[i+1:])
             break
@@ -208,6 +218,79 @@ def resolve_path_uri(path, docroot):
     directory = '/'.join(directory)
     return (directory, filename, pathinfo)
 
+def resolve_path_uri_cached(path, docroot):
+    """Like resolve_path_uri(), but use the process wide path cache."""
+    return resolve_path_uri(path, docroot, path_cache)
+
+
+class PathCache(object):
+    """Cache of the directory structure of document roots.
+
+    Resolving a path URI requires a stat() call for the document root
+    and for each of the path components that are directories. This
+    cache remembers for each path prefix whether it is a directory, so
+    that requests for the same part of the document root can be
+    resolved without touching the file system. Entries expire after
+    `timeout' seconds, so changes to the file system may go unnoticed
+    for that long.
+
+    This class is thread safe.
+    """
+
+    def __init__(self, size=10000, timeout=5):
+        """Constructor."""
+        self.m_cache = LruCache(size)
+        self.m_hits = 0
+        self.m_misses = 0
+        self.set_timeout(timeout)
+
+    def _debug(self, logger):
+        """Write debug output."""
+        logger.debug('Path cache statistics:')
+        logger.debug('hits: %d' % self.m_hits)
+        logger.debug('misses: %d' % self.m_misses)
+        logger.debug('hit ratio: %.2f%%' % (100.0 * self.hit_ratio()))
+
+    def set_size(self, size):
+        """Set the maximum number of path prefixes in the cache."""
+        self.m_cache.set_size(size)
+
+    def timeout(self):
+        """Return the time to live of a cache entry, in seconds."""
+        return self.m_timeout
+
+    def set_timeout(self, timeout):
+        """Set the time to live of a cache entry to `timeout' seconds."""
+        self.m_timeout = timeout
+
+    def isdir(self, path):
+        """Return True if `path' is an existing directory."""
+        now = time.time()
+        entry = self.m_cache.get(path)
+        if entry is not None and entry[0] > now:
+            self.m_hits += 1
+            return entry[1]
+        self.m_misses += 1
+        result = _isdir(path)
+        self.m_cache.add(path, (now + self.m_timeout, result))
+        return result
+
+    def hit_ratio(self):
+        """Return the fraction of lookups that were served from the
+        cache, as a float between 0 and 1."""
+        total = self.m_hits + self.m_misses
+        if not total:
+            return 0.0
+        return float(self.m_hits) / total
+
+    def clear(self):
+        """Remove all entries from the cache."""
+        self.m_cache.clear()
+
+
+# The process wide path cache.
+path_cache = PathCache()
+
 def create_path_uri(directory, filename, pathinfo):
     """Create a path URI from a 3-tuple (directory, filename, pathinfo)."""
     parts = []